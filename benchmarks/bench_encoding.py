@@ -0,0 +1,120 @@
+"""
+Board encoding benchmark, encodes typical boards in every output format and
+reports encode time and output size, next to the plain per-frame quantized GIF
+boards used to be written as.
+
+    python -m benchmarks.bench_encoding
+    python -m benchmarks.bench_encoding --repeat 5 --target-kb 512
+"""
+
+import os
+
+for key, value in {"DISCORD_API_TOKEN": "-", "HQ_CHANNEL_ID": "0", "ADMINS": "0", "DB_BACKEND": "sqlite"}.items():
+    os.environ.setdefault(key, value)
+
+from argparse import ArgumentParser
+from io import BytesIO
+from statistics import median
+from time import perf_counter
+from typing import Callable, List, Optional, Sequence, Tuple
+
+from PIL import Image
+from PIL.Image import Image as Img
+
+from duels.board import BoardSpec, TICTAC_BOARD
+from utils import image_handling as imgh
+from utils.image_encoding import FORMATS, encode
+
+# (name, board, cells of player 1, cells of player 2, winning line, animated avatars)
+BOARDS = [
+    ("tictac static", TICTAC_BOARD, [0, 4], [1, 2], None, False),
+    ("tictac animated", TICTAC_BOARD, [0, 4, 8], [1, 2], 6, True),
+    ("grid 5x5 animated", BoardSpec.get(5, 4), [0, 6, 12, 18, 3, 9], [1, 2, 5, 10, 15], None, True),
+]
+
+
+def avatar_frames(size: Tuple[int, int], frame_count: int, duration: int, seed: int) -> List[Img]:
+    """An avatar like animation, round tripped through GIF so frames carry their durations."""
+    frames = []
+    for i in range(frame_count):
+        frame = Image.new("RGBA", (128, 128), ((seed * 70 + i * 9) % 256, 60, 140, 255))
+        offset = (i * 7) % 88
+        frame.paste((255, 220, 0, 255), (offset, 20, offset + 40, 60))
+        frame.paste((20, 20, 20, 255), (20, offset, 60, offset + 40))
+        frames.append(frame)
+    if frame_count > 1:
+        buffer = BytesIO()
+        frames[0].save(buffer, format="GIF", save_all=True, append_images=frames[1:], duration=duration, loop=0)
+        frames = imgh.extract_frames(Image.open(buffer))
+    return [imgh.resize(frame, size) for frame in frames]
+
+
+def board_frames(board: BoardSpec, p1: Sequence[int], p2: Sequence[int], line: Optional[int], animated: bool):
+    avatars = [
+        avatar_frames(board.move_size, 17 if animated else 1, 70, 1),
+        avatar_frames(board.move_size, 23 if animated else 1, 90, 2),
+    ]
+    layers = [imgh.resolve_layer(board.board_layer())]
+    coords = [(0, 0)]
+    for player, cells in enumerate((p1, p2)):
+        for cell in cells:
+            layers.append(avatars[player])
+            coords.append(board.move_location(cell))
+    if line is not None:
+        spec, line_coords = board.line_layer(line)
+        layers.append(imgh.resolve_layer(spec))
+        coords.append(line_coords)
+    return imgh.stack_layers(layers, None, coords)
+
+
+def plain_gif(frames: Sequence[Img], durations: Sequence[int]) -> bytes:
+    buffer = BytesIO()
+    if len(frames) == 1:
+        frames[0].save(buffer, format="PNG")
+    else:
+        frames[0].save(
+            buffer,
+            format="GIF",
+            append_images=list(frames[1:]),
+            save_all=True,
+            duration=list(durations),
+            optimize=False,
+            loop=0,
+            disposal=2,
+        )
+    return buffer.getvalue()
+
+
+def _timed(run: Callable[[], bytes], repeat: int) -> Tuple[float, bytes]:
+    times = []
+    data = b""
+    for _ in range(repeat):
+        start = perf_counter()
+        data = run()
+        times.append((perf_counter() - start) * 1000)
+    return median(times), data
+
+
+def main(repeat: int, target_kb: Optional[float]):
+    imgh.load_assets()
+    target_bytes = int(target_kb * 1024) if target_kb is not None else None
+
+    print(f"{'board':<20}{'format':<12}{'encode (ms)':>14}{'size (KB)':>12}{'frames':>8}")
+    for name, board, p1, p2, line, animated in BOARDS:
+        frames, durations = board_frames(board, p1, p2, line, animated)
+        runs: List[Tuple[str, Callable[[], bytes]]] = [("plain gif", lambda: plain_gif(frames, durations))]
+        for fmt in FORMATS:
+            runs.append((fmt, lambda fmt=fmt: encode(frames, durations, fmt, target_bytes)))
+
+        for fmt, run in runs:
+            encode_time, data = _timed(run, repeat)
+            frame_count = getattr(Image.open(BytesIO(data)), "n_frames", 1)
+            print(f"{name:<20}{fmt:<12}{encode_time:>14.1f}{len(data) / 1024:>12.1f}{frame_count:>8}")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--target-kb", type=float, default=None, help="byte target the encoder searches for")
+    args = parser.parse_args()
+    main(args.repeat, args.target_kb)
@@ -0,0 +1,110 @@
+"""
+Game state micro-benchmark, plays the same random games on the bitboard states
+and on the list based board scan they replaced.
+
+    python -m benchmarks.bench_game_state
+    python -m benchmarks.bench_game_state --games 20000
+"""
+
+import os
+
+for key, value in {"DISCORD_API_TOKEN": "-", "HQ_CHANNEL_ID": "0", "ADMINS": "0", "DB_BACKEND": "sqlite"}.items():
+    os.environ.setdefault(key, value)
+
+from argparse import ArgumentParser
+from random import Random
+from time import perf_counter
+from typing import Callable, List, Tuple
+
+from duels.game_state import CountGameState, LineGameState
+from duels.board import TICTAC_BOARD
+from orz_modules.duel import DuelStatus
+
+# (cell, player) in order
+Game = List[Tuple[int, int]]
+
+
+def random_games(count: int, cell_count: int, seed: int) -> List[Game]:
+    rng = Random(seed)
+    games = []
+    for _ in range(count):
+        cells = list(range(cell_count))
+        rng.shuffle(cells)
+        games.append([(cell, rng.choice((1, 2))) for cell in cells])
+    return games
+
+
+def play_scan_tictac(game: Game) -> int:
+    # the board rebuilt as a grid and every file scanned after each move
+    board = [[0] * 3 for _ in range(3)]
+    for cell, player in game:
+        board[cell // 3][cell % 3] = player
+        for file in WINNING_FILES:
+            if all(board[x][y] == player for x, y in file):
+                return player
+        if all({1, 2} <= {board[x][y] for x, y in file} for file in WINNING_FILES):
+            return 0
+    return 0
+
+
+WINNING_FILES = [[divmod(cell, 3) for cell in line] for line in TICTAC_BOARD.line_set.lines]
+TICTAC_INITIAL = LineGameState(1, 2, TICTAC_BOARD.line_set)
+B3_INITIAL = CountGameState(1, 2, 3, target=2)
+
+
+def play_bitboard_tictac(game: Game) -> int:
+    # states are built once per duel and copied by the timeline
+    state = TICTAC_INITIAL.copy()
+    for cell, player in game:
+        state.apply(cell, player)
+        if state.winner is not None:
+            return state.winner
+        if state.status != DuelStatus.ONGOING.value:
+            return 0
+    return 0
+
+
+def play_scan_b3(game: Game) -> int:
+    owners = [0] * 3
+    for cell, player in game:
+        owners[cell] = player
+        if owners.count(player) >= 2:
+            return player
+    return 0
+
+
+def play_bitboard_b3(game: Game) -> int:
+    state = B3_INITIAL.copy()
+    for cell, player in game:
+        state.apply(cell, player)
+        if state.winner is not None:
+            return state.winner
+    return 0
+
+
+def _timed(play: Callable[[Game], int], games: List[Game]) -> Tuple[float, List[int]]:
+    start = perf_counter()
+    results = [play(game) for game in games]
+    return (perf_counter() - start) / len(games) * 1e6, results
+
+
+def main(games: int, seed: int):
+    cases = [
+        ("tictac", random_games(games, 9, seed), play_scan_tictac, play_bitboard_tictac),
+        ("b3", random_games(games, 3, seed), play_scan_b3, play_bitboard_b3),
+    ]
+
+    print(f"{'mode':<10}{'scan (us/game)':>18}{'bitboard (us/game)':>22}{'speedup':>10}")
+    for name, mode_games, scan, bitboard in cases:
+        scan_time, scan_results = _timed(scan, mode_games)
+        bitboard_time, bitboard_results = _timed(bitboard, mode_games)
+        assert scan_results == bitboard_results, f"{name}: results differ"
+        print(f"{name:<10}{scan_time:>18.2f}{bitboard_time:>22.2f}{scan_time / bitboard_time:>9.1f}x")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--games", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    main(args.games, args.seed)
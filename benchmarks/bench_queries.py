@@ -0,0 +1,128 @@
+"""
+Query layer benchmark, runs the same workload against every given backend.
+
+    python -m benchmarks.bench_queries --backend sqlite
+    python -m benchmarks.bench_queries --backend sqlite postgres
+
+SQLite runs in memory. Postgres uses the DB_* environment variables and
+writes to the tables, so point it at a scratch database.
+"""
+
+import os
+
+for key, value in {"DISCORD_API_TOKEN": "-", "HQ_CHANNEL_ID": "0", "ADMINS": "0", "DB_BACKEND": "sqlite"}.items():
+    os.environ.setdefault(key, value)
+
+from argparse import ArgumentParser
+from asyncio import run
+from contextlib import redirect_stdout
+from io import StringIO
+from time import perf_counter
+from types import SimpleNamespace
+from typing import Any, Awaitable, Callable, Dict, List
+
+from config import tortoise_config
+from database import cf_queries, duel_queries, user_queries
+from database.create_tables import create_schema
+from database.db import DB
+from orz_modules.duel import Duel
+from utils.general import generate_string, get_time
+
+USER_BASE = 10**17
+
+
+async def _timed(name: str, count: int, func: Callable[[int], Awaitable[Any]], results: Dict[str, float]):
+    start = perf_counter()
+    for i in range(count):
+        await func(i)
+    results[name] = (perf_counter() - start) / count * 1e6
+
+
+async def bench_backend(backend: str, count: int) -> Dict[str, float]:
+    results: Dict[str, float] = {}
+
+    start = perf_counter()
+    await DB.establish_connection(tortoise_config(backend, sqlite_path=":memory:"), backend)
+    with redirect_stdout(StringIO()):
+        await create_schema()
+    results["startup (total)"] = (perf_counter() - start) * 1e6
+    try:
+        await _bench_queries(count, results)
+    finally:
+        await DB.close_connection()
+    return results
+
+
+async def _bench_queries(count: int, results: Dict[str, float]):
+    users = [
+        SimpleNamespace(
+            user_id=USER_BASE + i,
+            fullname=f"bench {i}",
+            join_time=get_time(),
+            cf_handle=f"bench_{generate_string(8)}",
+            college_mail=f"bench_{generate_string(8)}@bench",
+            roll_number=generate_string(10),
+        )
+        for i in range(count)
+    ]
+    duels = [
+        SimpleNamespace(
+            duel_id=f"bench{generate_string(11)}",
+            player1=USER_BASE + i,
+            player2=USER_BASE + (i + 1) % count,
+            start_time=get_time(),
+            time_limit=60,
+            end_time=get_time() + 3600,
+            status="ongoing",
+            winner=None,
+            rating=900,
+            problems=[f"{1000 + j}~A" for j in range(9)],
+            progress=["~"] * 9,
+            tournament_id=None,
+            mode=Duel.TICTAC,
+        )
+        for i in range(count)
+    ]
+
+    await _timed("save_user", count, lambda i: user_queries.save_user(users[i]), results)  # type: ignore
+    await _timed("get_user_info", count, lambda i: user_queries.get_user_info(users[i].user_id), results)
+    await _timed(
+        "get_users_info (10)",
+        count,
+        lambda i: user_queries.get_users_info([u.user_id for u in users[i : i + 10]]),
+        results,
+    )
+    await _timed(
+        "check_duplicate_cf_handle", count, lambda i: user_queries.check_duplicate_cf_handle(users[i].cf_handle), results
+    )
+    await _timed("create_tictac_duel", count, lambda i: duel_queries.create_tictac_duel(duels[i]), results)  # type: ignore
+
+    def save_duel(i: int):
+        duels[i].progress[i % 9] = f"{duels[i].player1}~{get_time()}"
+        return duel_queries.save_tictac_duel(duels[i])  # type: ignore
+
+    await _timed("save_tictac_duel", count, save_duel, results)
+    await _timed("get_problems_list", count, lambda i: cf_queries.get_problems_list(800, 1000), results)
+
+    user_ids = [user.user_id for user in users]
+    duel_ids = [duel.duel_id for duel in duels]
+    await DB.execute_query(f"DELETE FROM user_data WHERE user_id IN ({','.join('?' for _ in user_ids)})", *user_ids)
+    await DB.execute_query(f"DELETE FROM duels_tictac WHERE duel_id IN ({','.join('?' for _ in duel_ids)})", *duel_ids)
+    await DB.execute_query(f"DELETE FROM duel_ids WHERE duel_id IN ({','.join('?' for _ in duel_ids)})", *duel_ids)
+
+
+async def main(backends: List[str], count: int):
+    all_results = {backend: await bench_backend(backend, count) for backend in backends}
+
+    names = list(next(iter(all_results.values())))
+    print(f"{'operation':<28}" + "".join(f"{backend + ' (us)':>18}" for backend in backends))
+    for name in names:
+        print(f"{name:<28}" + "".join(f"{all_results[backend][name]:>18.1f}" for backend in backends))
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--backend", nargs="+", default=["sqlite"], choices=["sqlite", "postgres"])
+    parser.add_argument("--count", type=int, default=200)
+    args = parser.parse_args()
+    run(main(args.backend, args.count))
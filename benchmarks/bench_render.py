@@ -0,0 +1,292 @@
+"""
+Board rendering benchmark, renders TicTac and B3 boards at every fill level
+and, for TicTac, every kind of winning line, with synthetic static and
+animated avatars. Reports wall time, peak memory and output bytes of each
+stage of the pipeline: decode, resize, stack and encode. Peak memory is the
+growth of the process' resident set while a stage runs, sampled.
+
+Results are written as JSON, and comparing against an earlier run prints how
+much each case got faster or slower.
+
+    python -m benchmarks.bench_render
+    python -m benchmarks.bench_render --boards tictac --avatars static --output before.json
+    python -m benchmarks.bench_render --compare before.json
+"""
+
+import os
+
+for key, value in {"DISCORD_API_TOKEN": "-", "HQ_CHANNEL_ID": "0", "ADMINS": "0", "DB_BACKEND": "sqlite"}.items():
+    os.environ.setdefault(key, value)
+
+import json
+import platform
+import subprocess
+from argparse import ArgumentParser
+from io import BytesIO
+from statistics import median
+from threading import Event, Thread
+from time import perf_counter, strftime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import PIL
+from PIL import Image
+
+from config import RENDER_BACKEND, RENDER_FORMAT
+from duels import b3_duel
+from duels.board import TICTAC_BOARD
+from utils import image_handling as imgh
+from utils.image_encoding import FORMATS, encode
+
+STAGES = ["decode", "resize", "stack", "encode"]
+
+# profile: (frame count, size in px) of the avatars of player 1 and player 2
+AVATARS: Dict[str, Tuple[Tuple[int, int], Tuple[int, int]]] = {
+    "static": ((1, 128), (1, 128)),
+    "animated": ((17, 128), (23, 128)),
+    "large": ((40, 512), (33, 512)),
+}
+
+# winning line kind: index into the TicTac lines
+LINES = {"row": 0, "column": 3, "diagonal": 6, "anti_diagonal": 7}
+
+# cells filled in this order, players alternating
+FILL_ORDER = [4, 0, 8, 2, 6, 1, 7, 3, 5]
+
+Case = Dict[str, Any]
+
+
+def synthetic_avatar(frame_count: int, size: int, seed: int) -> bytes:
+    """An encoded avatar with moving shapes, a GIF if animated and a PNG if not."""
+    frames = []
+    for i in range(frame_count):
+        frame = Image.new("RGBA", (size, size), ((seed * 70 + i * 9) % 256, 60, 140, 255))
+        block = size // 3
+        offset = (i * size // 18) % (size - block)
+        frame.paste((255, 220, 0, 255), (offset, size // 6, offset + block, size // 6 + block))
+        frame.paste((20, 20, 20, 255), (size // 6, offset, size // 6 + block, offset + block))
+        frames.append(frame)
+
+    buffer = BytesIO()
+    if frame_count == 1:
+        frames[0].save(buffer, format="PNG")
+    else:
+        frames[0].save(buffer, format="GIF", save_all=True, append_images=frames[1:], duration=80, loop=0)
+    return buffer.getvalue()
+
+
+def tictac_cases() -> List[Case]:
+    cases = []
+    for fill in range(len(FILL_ORDER) + 1):
+        owners = [0] * 9
+        for i, cell in enumerate(FILL_ORDER[:fill]):
+            owners[cell] = 1 + i % 2
+        cases.append({"board": "tictac", "fill": fill, "line": None, "owners": owners})
+
+    for line_kind, line in LINES.items():
+        line_cells = TICTAC_BOARD.line_set.lines[line]
+        others = [cell for cell in FILL_ORDER if cell not in line_cells]
+        for fill in range(len(line_cells), len(FILL_ORDER) + 1):
+            owners = [0] * 9
+            for cell in line_cells:
+                owners[cell] = 1
+            for i, cell in enumerate(others[: fill - len(line_cells)]):
+                owners[cell] = 2 - i % 2
+            cases.append({"board": "tictac", "fill": fill, "line": line_kind, "owners": owners})
+    return cases
+
+
+def b3_cases() -> List[Case]:
+    return [
+        {"board": "b3", "fill": fill, "line": None, "owners": [1 + i % 2 if i < fill else 0 for i in range(3)]}
+        for fill in range(4)
+    ]
+
+
+def case_layout(case: Case) -> Tuple[imgh.LayerSpec, Tuple[int, int], List[Tuple[int, int]]]:
+    """The board layer, the avatar size and where every cell's avatar goes."""
+    if case["board"] == "b3":
+        return imgh.asset_layer("bin/b3_board.png"), b3_duel.MOVE_SIZE, b3_duel.MOVE_LOCATIONS
+    board = TICTAC_BOARD
+    return board.board_layer(), board.move_size, [board.move_location(cell) for cell in range(board.cell_count)]
+
+
+class PeakMemory:
+    """Samples the resident set of the process while a stage runs."""
+
+    def __init__(self, interval: float = 0.001):
+        self.interval = interval
+        self.peak = 0
+        self._start = 0
+        self._done = Event()
+        self._thread: Optional[Thread] = None
+
+    @staticmethod
+    def rss() -> int:
+        try:
+            with open("/proc/self/statm") as statm:
+                return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, ValueError):
+            return 0
+
+    def _sample(self):
+        while not self._done.wait(self.interval):
+            self.peak = max(self.peak, self.rss() - self._start)
+
+    def __enter__(self) -> "PeakMemory":
+        self._start = self.rss()
+        self._thread = Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *_):
+        self._done.set()
+        assert self._thread is not None
+        self._thread.join()
+        self.peak = max(self.peak, self.rss() - self._start)
+
+
+def _stage(run: Callable[[], Any], repeat: int) -> Tuple[Any, Dict[str, float]]:
+    times = []
+    result = None
+    for _ in range(repeat):
+        start = perf_counter()
+        result = run()
+        times.append((perf_counter() - start) * 1000)
+    with PeakMemory() as memory:
+        result = run()
+    return result, {"ms": median(times), "peak_kb": memory.peak / 1024}
+
+
+def _frames_bytes(frames: Any) -> int:
+    return sum(len(frame.getbands()) * frame.width * frame.height for frame in frames)
+
+
+def run_case(case: Case, avatars: Tuple[bytes, bytes], backend: str, fmt: str, repeat: int) -> Dict[str, Any]:
+    board_spec, move_size, locations = case_layout(case)
+    stages: Dict[str, Dict[str, float]] = {}
+
+    decoded, stages["decode"] = _stage(
+        lambda: [imgh.extract_frames(imgh.load_image(BytesIO(data))) for data in avatars], repeat
+    )
+    stages["decode"]["bytes"] = sum(_frames_bytes(frames) for frames in decoded)
+
+    resized, stages["resize"] = _stage(
+        lambda: [tuple(imgh.resize(frame, move_size) for frame in frames) for frames in decoded], repeat
+    )
+    stages["resize"]["bytes"] = sum(_frames_bytes(frames) for frames in resized)
+
+    def stack():
+        layers = [imgh.resolve_layer(board_spec)]
+        layers_coords = [(0, 0)]
+        for cell, owner in enumerate(case["owners"]):
+            if owner:
+                layers.append(resized[owner - 1])
+                layers_coords.append(locations[cell])
+        if case["line"] is not None:
+            line_spec, line_coords = TICTAC_BOARD.line_layer(LINES[case["line"]])
+            layers.append(imgh.resolve_layer(line_spec))
+            layers_coords.append(line_coords)
+        return imgh.stack_layers(layers, None, layers_coords, backend=backend)
+
+    (frames, durations), stages["stack"] = _stage(stack, repeat)
+    stages["stack"]["bytes"] = _frames_bytes(frames)
+
+    data, stages["encode"] = _stage(lambda: encode(frames, durations, fmt), repeat)
+    stages["encode"]["bytes"] = len(data)
+
+    return {
+        "name": case_name(case),
+        "frames": len(frames),
+        "total_ms": sum(stage["ms"] for stage in stages.values()),
+        "output_bytes": len(data),
+        "stages": stages,
+    }
+
+
+def case_name(case: Case) -> str:
+    return f"{case['board']}/fill={case['fill']}/line={case['line'] or 'none'}/avatars={case['avatars']}"
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: List[Dict[str, Any]], baseline_path: str):
+    with open(baseline_path) as baseline_file:
+        baseline = {result["name"]: result for result in json.load(baseline_file)["results"]}
+
+    print(f"\nagainst {baseline_path}")
+    print(f"{'case':<48}{'time':>10}{'bytes':>10}")
+    for result in results:
+        before = baseline.get(result["name"])
+        if before is None:
+            continue
+        time_change = (result["total_ms"] / before["total_ms"] - 1) * 100 if before["total_ms"] else 0.0
+        size_change = (result["output_bytes"] / before["output_bytes"] - 1) * 100 if before["output_bytes"] else 0.0
+        print(f"{result['name']:<48}{time_change:>+9.1f}%{size_change:>+9.1f}%")
+
+
+def main(
+    boards: List[str],
+    avatar_profiles: List[str],
+    backend: str,
+    fmt: str,
+    repeat: int,
+    output: str,
+    baseline: Optional[str],
+):
+    imgh.load_assets()
+
+    cases = (tictac_cases() if "tictac" in boards else []) + (b3_cases() if "b3" in boards else [])
+    results = []
+    print(f"{'case':<48}" + "".join(f"{stage + ' (ms)':>14}" for stage in STAGES) + f"{'peak (MB)':>11}{'out (KB)':>10}")
+    for profile in avatar_profiles:
+        avatars = tuple(
+            synthetic_avatar(frame_count, size, seed) for seed, (frame_count, size) in enumerate(AVATARS[profile])
+        )
+        assert len(avatars) == 2
+        for case in cases:
+            result = run_case({**case, "avatars": profile}, avatars, backend, fmt, repeat)
+            results.append(result)
+            peak = max(stage["peak_kb"] for stage in result["stages"].values()) / 1024
+            print(
+                f"{result['name']:<48}"
+                + "".join(f"{result['stages'][stage]['ms']:>14.1f}" for stage in STAGES)
+                + f"{peak:>11.1f}{result['output_bytes'] / 1024:>10.1f}"
+            )
+
+    report = {
+        "created": strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "pillow": PIL.__version__,
+        "numpy": getattr(imgh.np, "__version__", None),
+        "backend": backend,
+        "format": fmt,
+        "repeat": repeat,
+        "results": results,
+    }
+    with open(output, "w") as output_file:
+        json.dump(report, output_file, indent=2)
+    print(f"\nwrote {len(results)} results to {output}")
+
+    if baseline is not None:
+        compare(results, baseline)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--boards", nargs="+", choices=["tictac", "b3"], default=["tictac", "b3"])
+    parser.add_argument("--avatars", nargs="+", choices=list(AVATARS), default=list(AVATARS))
+    parser.add_argument("--backend", choices=["auto", "pillow", "numpy"], default=RENDER_BACKEND)
+    parser.add_argument("--format", choices=list(FORMATS), default=RENDER_FORMAT)
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--output", default="bench_render.json")
+    parser.add_argument("--compare", default=None, help="earlier JSON results to compare against")
+    args = parser.parse_args()
+    main(args.boards, args.avatars, args.backend, args.format, args.repeat, args.output, args.compare)
@@ -1,9 +1,11 @@
+from asyncio import gather, to_thread
 from enum import Enum
 from random import sample
-from typing import Any, Dict, List, Set, Tuple
+from typing import Any, Dict, List, Optional, Set, Tuple
 
-from codeforces.api import get_user_submissions, get_users_info
+from codeforces.api import get_user_submissions
 from codeforces.models import CFProblem, CFSubmission, CFUser
+from codeforces.rate_limiter import PRIORITY_POLL, cf_rate_limiter
 from database.cf_queries import get_problems_list
 
 
@@ -47,7 +49,15 @@ def get_user_problems_status(
     Get the status of a user's submissions for a list of problems.
     """
     user_submissions = get_user_submissions(handle)
+    return group_problems_status(user_submissions, problems, time, after)
 
+
+def group_problems_status(
+    user_submissions: List[CFSubmission], problems: List[CFProblem], time: int, after: bool = True
+) -> Dict[CFProblem, List[Tuple[int, str]]]:
+    """
+    Groups already fetched submissions by problem, see `get_user_problems_status`.
+    """
     # Create a dictionary to store the submissions of each problem in a {CFProblem : [(CFSubmission time, CFSubmission verdict)]} format
     problem_based_submission: Dict[CFProblem, List[Tuple[int, str]]] = {}
     for problem in problems:
@@ -80,18 +90,76 @@ async def get_duel_problems(
 ) -> List[CFProblem]:
     """
     Get a list of problems for a duel between two users with the given ratings.
+    Both users' solved problems are fetched concurrently, off the event loop.
     :raises ValueError: if not enough problems are found
     """
-    user_1, user_2 = get_users_info([handle_1, handle_2])
-
     all_problems = await _fetch_all_problems(
         min_rating=min_rating, max_rating=max_rating
     )
-    problem_set = _filter_problems(problems=all_problems, users=[user_1, user_2])
+    solved_1, solved_2 = await gather(
+        fetch_user_solved_problems(handle_1), fetch_user_solved_problems(handle_2)
+    )
+    problem_set = [prob for prob in all_problems if prob not in solved_1 and prob not in solved_2]
 
     return sample(problem_set, problem_count)
 
 
+async def get_round_problems(
+    pairs: List[Tuple[str, str]],
+    solved: Dict[str, Set[CFProblem]],
+    excluded: Set[CFProblem],
+    min_rating: int,
+    max_rating: int,
+    problem_count: int,
+) -> List[Optional[List[CFProblem]]]:
+    """
+    Problems for a whole round of duels from a single read of the catalog, the
+    handles' solved problems having been fetched beforehand. Every duel gets the
+    same problems when enough are unsolved by all the players, otherwise each
+    pair gets its own.
+    :param pairs: handles of the two players of each duel
+    :param excluded: problems none of the duels may get, e.g. from earlier rounds
+    :return: the problems of each pair, None for a pair without enough problems
+    """
+    all_problems = await _fetch_all_problems(
+        min_rating=min_rating, max_rating=max_rating
+    )
+    candidates = [prob for prob in all_problems if prob not in excluded]
+
+    solved_by_any: Set[CFProblem] = set()
+    for pair in pairs:
+        for handle in pair:
+            solved_by_any |= solved[handle]
+    shared = [prob for prob in candidates if prob not in solved_by_any]
+    if len(shared) >= problem_count:
+        problems = sample(shared, problem_count)
+        return [list(problems) for _ in pairs]
+
+    round_problems: List[Optional[List[CFProblem]]] = []
+    for handle_1, handle_2 in pairs:
+        unsolved = [
+            prob for prob in candidates if prob not in solved[handle_1] and prob not in solved[handle_2]
+        ]
+        round_problems.append(sample(unsolved, problem_count) if len(unsolved) >= problem_count else None)
+    return round_problems
+
+
+def get_user_solved_problems(handle: str) -> Set[CFProblem]:
+    """
+    Every problem the user has an accepted submission on.
+    """
+    user_submissions: List[CFSubmission] = get_user_submissions(handle)
+    return {sub.problem for sub in user_submissions if sub.verdict == Verdict.OK.value}
+
+
+async def fetch_user_solved_problems(handle: str, priority: int = PRIORITY_POLL) -> Set[CFProblem]:
+    """
+    `get_user_solved_problems` in a thread, within the shared API budget.
+    """
+    await cf_rate_limiter().acquire(priority)
+    return await to_thread(get_user_solved_problems, handle)
+
+
 async def _fetch_all_problems(
     min_rating: int = 0, max_rating: int = 3500
 ) -> List[CFProblem]:
@@ -118,10 +186,6 @@ def _filter_problems(problems: List[CFProblem], users: List[CFUser]) -> List[CFP
     global_user_solved: Set[CFProblem] = set()
 
     for i in users:
-        user_submissions: List[CFSubmission] = get_user_submissions(i.handle)
-        user_solved = {
-            sub.problem for sub in user_submissions if sub.verdict == Verdict.OK.value
-        }
-        global_user_solved |= user_solved
+        global_user_solved |= get_user_solved_problems(i.handle)
 
     return [prob for prob in problems if prob not in global_user_solved]
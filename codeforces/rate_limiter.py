@@ -0,0 +1,76 @@
+"""
+rate_limiter.py
+Spaces every Codeforces API call made by the bot within one shared budget.
+"""
+
+from asyncio import Future, TimerHandle, get_running_loop
+from heapq import heappop, heappush
+from itertools import count
+from time import monotonic
+from typing import List, Optional, Tuple
+
+from config import CF_API_CALLS_PER_SECOND
+
+# lower goes first, live duels are never kept waiting behind background fetches
+PRIORITY_POLL = 0
+PRIORITY_BACKGROUND = 1
+
+
+class RateLimiter:
+    """
+    Lets callers through at most `calls_per_second` times a second, the most
+    urgent waiter first and in arrival order among equals.
+    """
+
+    def __init__(self, calls_per_second: float):
+        self.interval = 1 / calls_per_second
+        self._next_call = 0.0
+        self._waiters: List[Tuple[int, int, "Future[None]"]] = []  # (priority, seq, waiter)
+        self._seq = count()
+        self._timer: Optional[TimerHandle] = None
+
+        self.calls = 0
+        self.max_waiting = 0
+
+    @property
+    def waiting(self) -> int:
+        return sum(not waiter.done() for _, _, waiter in self._waiters)
+
+    async def acquire(self, priority: int = PRIORITY_POLL):
+        """Waits for the turn of the next API call."""
+        waiter: "Future[None]" = get_running_loop().create_future()
+        heappush(self._waiters, (priority, next(self._seq), waiter))
+        self.max_waiting = max(self.max_waiting, len(self._waiters))
+        self._dispatch()
+        await waiter
+
+    def _dispatch(self):
+        if self._timer is not None:
+            return
+        # cancelled waiters are dropped here rather than when they cancel
+        while self._waiters and self._waiters[0][2].done():
+            heappop(self._waiters)
+        if not self._waiters:
+            return
+
+        delay = self._next_call - monotonic()
+        if delay > 0:
+            self._timer = get_running_loop().call_later(delay, self._on_timer)
+            return
+
+        _, _, waiter = heappop(self._waiters)
+        waiter.set_result(None)
+        self.calls += 1
+        self._next_call = monotonic() + self.interval
+        self._timer = get_running_loop().call_later(self.interval, self._on_timer)
+
+    def _on_timer(self):
+        self._timer = None
+        self._dispatch()
+
+
+_cf_rate_limiter = RateLimiter(CF_API_CALLS_PER_SECOND)
+
+
+def cf_rate_limiter() -> RateLimiter:
+    return _cf_rate_limiter
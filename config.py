@@ -10,21 +10,111 @@ def getenv(key: str) -> str:
         raise ValueError(f"Missing environment variable: {key}")
     return value
 
+def getenv_default(key: str, default: str) -> str:
+    return os.getenv(key) or default
+
 DISCORD_API_TOKEN = getenv("DISCORD_API_TOKEN")
 HQ_CHANNEL_ID = int(getenv("HQ_CHANNEL_ID") or 0)
 
-DB_URL = getenv("DB_URL")
-DB_PORT = getenv("DB_PORT")
-DB_DATABASE = getenv("DB_DATABASE")
-DB_USER = getenv("DB_USER")
-DB_PASS = getenv("DB_PASS")
+DB_BACKEND = getenv_default("DB_BACKEND", "postgres")  # "postgres" or "sqlite"
+DB_SQLITE_PATH = getenv_default("DB_SQLITE_PATH", "orzduck.sqlite3")
+
+DB_POOL_MIN_SIZE = int(getenv_default("DB_POOL_MIN_SIZE", "1"))
+DB_POOL_MAX_SIZE = int(getenv_default("DB_POOL_MAX_SIZE", "10"))
+# seconds
+DB_POOL_ACQUIRE_TIMEOUT = float(getenv_default("DB_POOL_ACQUIRE_TIMEOUT", "10"))
+DB_POOL_MAX_LIFETIME = float(getenv_default("DB_POOL_MAX_LIFETIME", "1800"))
+DB_STATEMENT_TIMEOUT = float(getenv_default("DB_STATEMENT_TIMEOUT", "30"))
+
+DB_SLOW_QUERY_MS = float(getenv_default("DB_SLOW_QUERY_MS", "200"))
+
+DUEL_RETENTION_MONTHS = int(getenv_default("DUEL_RETENTION_MONTHS", "12"))
+DUEL_PARTITIONS_AHEAD = int(getenv_default("DUEL_PARTITIONS_AHEAD", "2"))
+DUEL_ARCHIVE_MODE = getenv_default("DUEL_ARCHIVE_MODE", "move")  # "move" or "detach"
+# "default" (pglz), or "lz4" on Postgres 14+ built with it
+DUEL_ARCHIVE_COMPRESSION = getenv_default("DUEL_ARCHIVE_COMPRESSION", "default")
+
+# Codeforces allows one call every two seconds
+CF_API_CALLS_PER_SECOND = float(getenv_default("CF_API_CALLS_PER_SECOND", "0.5"))
+# seconds
+CF_POLL_MIN_INTERVAL = float(getenv_default("CF_POLL_MIN_INTERVAL", "15"))
+CF_POLL_MAX_INTERVAL = float(getenv_default("CF_POLL_MAX_INTERVAL", "120"))
+
+# duels of a tournament round started at once, each one renders and sends its board
+TOURNAMENT_START_CONCURRENCY = int(getenv_default("TOURNAMENT_START_CONCURRENCY", "4"))
+
+# matchmaking accepts a rating gap of QUEUE_BASE_GAP right away, widening by
+# QUEUE_GAP_PER_SECOND for every second waited up to QUEUE_MAX_GAP
+QUEUE_BASE_GAP = int(getenv_default("QUEUE_BASE_GAP", "100"))
+QUEUE_GAP_PER_SECOND = float(getenv_default("QUEUE_GAP_PER_SECOND", "5"))
+QUEUE_MAX_GAP = int(getenv_default("QUEUE_MAX_GAP", "800"))
+# seconds
+QUEUE_MATCH_INTERVAL = float(getenv_default("QUEUE_MATCH_INTERVAL", "5"))
+QUEUE_TIMEOUT = int(getenv_default("QUEUE_TIMEOUT", "900"))
+
+# spectator messages edited at most once every SPECTATOR_EDIT_INTERVAL seconds per channel
+SPECTATOR_EDIT_INTERVAL = float(getenv_default("SPECTATOR_EDIT_INTERVAL", "1.5"))
+SPECTATOR_MAX_SUBSCRIPTIONS = int(getenv_default("SPECTATOR_MAX_SUBSCRIPTIONS", "200"))
+
+# messages sent or edited in a channel, at most DISCORD_CHANNEL_CALLS in any
+# DISCORD_CHANNEL_WINDOW seconds, Discord allows 5 every 5 seconds
+DISCORD_CHANNEL_CALLS = int(getenv_default("DISCORD_CHANNEL_CALLS", "5"))
+DISCORD_CHANNEL_WINDOW = float(getenv_default("DISCORD_CHANNEL_WINDOW", "5"))
+
+# decoded and resized avatar frames kept in memory, by the bot and by each
+# render worker process on its own, so up to (RENDER_WORKERS + 1) times this
+AVATAR_CACHE_MB = float(getenv_default("AVATAR_CACHE_MB", "64"))
+# encoded board images kept in memory
+RENDER_CACHE_MB = float(getenv_default("RENDER_CACHE_MB", "32"))
+# board compositing runs in worker processes, 0 renders in a thread instead
+RENDER_WORKERS = int(getenv_default("RENDER_WORKERS", "2"))
+RENDER_QUEUE_SIZE = int(getenv_default("RENDER_QUEUE_SIZE", "8"))
+RENDER_TIMEOUT = float(getenv_default("RENDER_TIMEOUT", "30"))  # seconds
+# animated boards are resampled onto at most this many frames, and at most this
+# many MB of composited RGBA frames, covering at most RENDER_MAX_LOOP_MS
+RENDER_MAX_FRAMES = int(getenv_default("RENDER_MAX_FRAMES", "40"))
+RENDER_FRAMES_MB = float(getenv_default("RENDER_FRAMES_MB", "128"))
+RENDER_MAX_LOOP_MS = int(getenv_default("RENDER_MAX_LOOP_MS", "10000"))
+# "pillow", "numpy", or "auto" to stack animated boards with NumPy whenever it is
+# installed. NumPy is no faster on boards with a winning line, and peaks higher
+RENDER_BACKEND = getenv_default("RENDER_BACKEND", "pillow")
+# "gif", "webp" or "apng", encoded at the best settings that fit RENDER_TARGET_KB.
+# Discord shows only the first frame of an APNG
+RENDER_FORMAT = getenv_default("RENDER_FORMAT", "gif")
+RENDER_TARGET_KB = float(getenv_default("RENDER_TARGET_KB", "7680"))
 
 ADMINS = [int(user_id) for user_id in getenv("ADMINS").split(", ")]
 
-TORTOISE_ORM: Dict[str, Any] = {
-    "connections": {
-        "default": f"postgres://{DB_USER}:{DB_PASS}@{DB_URL}:{DB_PORT}/{DB_DATABASE}"
-    },
-    "apps": {"models": {"models": [], "default_connection": "default"}},
-    "use_tz": True,
-}
\ No newline at end of file
+def tortoise_config(backend: str, sqlite_path: str = DB_SQLITE_PATH) -> Dict[str, Any]:
+    if backend == "postgres":
+        connection: Dict[str, Any] = {
+            "engine": "tortoise.backends.asyncpg",
+            "credentials": {
+                "host": getenv("DB_URL"),
+                "port": int(getenv("DB_PORT")),
+                "user": getenv("DB_USER"),
+                "password": getenv("DB_PASS"),
+                "database": getenv("DB_DATABASE"),
+                "minsize": DB_POOL_MIN_SIZE,
+                "maxsize": DB_POOL_MAX_SIZE,
+                "max_inactive_connection_lifetime": DB_POOL_MAX_LIFETIME,
+                "server_settings": {
+                    "statement_timeout": str(int(DB_STATEMENT_TIMEOUT * 1000))
+                },
+            },
+        }
+    elif backend == "sqlite":
+        connection = {
+            "engine": "tortoise.backends.sqlite",
+            "credentials": {"file_path": sqlite_path},
+        }
+    else:
+        raise ValueError(f"Unknown DB backend: {backend}")
+
+    return {
+        "connections": {"default": connection},
+        "apps": {"models": {"models": [], "default_connection": "default"}},
+        "use_tz": True,
+    }
+
+TORTOISE_ORM = tortoise_config(DB_BACKEND)
@@ -0,0 +1,13 @@
+__all__ = ["StorageBackend", "PostgresBackend", "SQLiteBackend", "get_backend"]
+
+from .base import StorageBackend
+from .postgres import PostgresBackend
+from .sqlite import SQLiteBackend
+
+
+def get_backend(name: str) -> StorageBackend:
+    if name == "postgres":
+        return PostgresBackend()
+    if name == "sqlite":
+        return SQLiteBackend()
+    raise ValueError(f"Unknown DB backend: {name}")
@@ -0,0 +1,32 @@
+from typing import Any, Dict, List, Tuple
+
+
+class StorageBackend:
+    """
+    The SQL dialect of a storage engine behind DB.
+    Queries are written with `?` placeholders, list args are array columns.
+    """
+
+    name: str = ""
+
+    # column type used for list values
+    array_type: str = ""
+
+    # whether the duel tables are range partitioned by month
+    supports_partitions: bool = False
+
+    def format_query(self, query: str) -> str:
+        raise NotImplementedError
+
+    def adapt_args(self, args: Tuple[Any, ...]) -> List[Any]:
+        return list(args)
+
+    def adapt_rows(self, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        return rows
+
+    def truncate_query(self, table: str) -> str:
+        raise NotImplementedError
+
+    def columns_query(self, table: str) -> str:
+        """Query listing the columns of a table, one row per column with a `name`."""
+        raise NotImplementedError
@@ -0,0 +1,28 @@
+from database.backends.base import StorageBackend
+
+
+class PostgresBackend(StorageBackend):
+    name = "postgres"
+    array_type = "TEXT[]"
+    supports_partitions = True
+
+    def format_query(self, query: str) -> str:
+        formatted_query = ""
+        i = 0
+        ctr = 1
+        while i < len(query):
+            if query[i] != "?":
+                formatted_query += query[i]
+            elif i < len(query) - 1 and query[i + 1] == "?":
+                formatted_query += "?"
+            else:
+                formatted_query += f"${ctr}"
+                ctr += 1
+            i += 1
+        return formatted_query
+
+    def truncate_query(self, table: str) -> str:
+        return f"TRUNCATE TABLE {table}"
+
+    def columns_query(self, table: str) -> str:
+        return f"SELECT column_name AS name FROM information_schema.columns WHERE table_name = '{table}'"
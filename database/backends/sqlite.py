@@ -0,0 +1,37 @@
+from json import dumps, loads
+from typing import Any, Dict, List, Tuple
+
+from database.backends.base import StorageBackend
+
+# columns stored as TEXT[] on Postgres, JSON encoded text here
+ARRAY_COLUMNS = {"problems", "progress", "tags"}
+
+
+class SQLiteBackend(StorageBackend):
+    """
+    Embedded backend for local runs, CI and benchmarks, no server needed.
+    """
+
+    name = "sqlite"
+    array_type = "TEXT"
+    supports_partitions = False
+
+    def format_query(self, query: str) -> str:
+        return query
+
+    def adapt_args(self, args: Tuple[Any, ...]) -> List[Any]:
+        return [dumps(arg) if isinstance(arg, (list, tuple)) else arg for arg in args]
+
+    def adapt_rows(self, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        for row in rows:
+            for column in ARRAY_COLUMNS.intersection(row):
+                value = row[column]
+                if isinstance(value, str) and value.startswith("["):
+                    row[column] = loads(value)
+        return rows
+
+    def truncate_query(self, table: str) -> str:
+        return f"DELETE FROM {table}"
+
+    def columns_query(self, table: str) -> str:
+        return f"PRAGMA table_info({table})"
@@ -1,4 +1,4 @@
-from typing import TYPE_CHECKING, Any, Dict, List
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
 
 from database.db import DB
 
@@ -8,7 +8,7 @@ if TYPE_CHECKING:
 
 async def dump_problem(problem: "CFProblem"):
     query = (
-        "INSERT INTO cf_problem (contestId, problemsetName, index, name, type, points, rating, tags, solvedCount) "
+        "INSERT INTO cf_problem (contestId, problemsetName, \"index\", name, type, points, rating, tags, solvedCount) "
         "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
     )
     await DB.execute_query(
@@ -33,7 +33,7 @@ async def dump_problems(problems: List["CFProblem"]):
 
 
 async def clear_problems():
-    query = "TRUNCATE TABLE cf_problem"
+    query = DB.backend.truncate_query("cf_problem")
     await DB.execute_query(query)
 
 
@@ -74,7 +74,7 @@ async def dump_users(users: List["CFUser"]):
 
 
 async def clear_users():
-    query = "TRUNCATE TABLE cf_user"
+    query = DB.backend.truncate_query("cf_user")
     await DB.execute_query(query)
 
 
@@ -84,3 +84,24 @@ async def get_problems_list(min_rating: int, max_rating: int) -> List[Dict[Any,
     """
     query = f"SELECT * FROM cf_problem WHERE rating >= {min_rating} AND rating <= {max_rating}"
     return await DB.execute_query(query)
+
+
+async def get_problems_by_keys(keys: List[Tuple[int, str]]) -> List[Dict[Any, Any]]:
+    """
+    Get the problems with the given (contestId, index) pairs.
+    """
+    if not keys:
+        return []
+    query = (
+        "SELECT * FROM cf_problem WHERE (contestId, \"index\") IN "
+        f"({', '.join(['(?, ?)' for _ in keys])})"
+    )
+    return await DB.execute_query(query, *[value for key in keys for value in key])
+
+
+async def get_user_rating(handle: str) -> Optional[int]:
+    """
+    The rating of a user as of the last reload, None if they aren't loaded.
+    """
+    result = await DB.execute_query("SELECT rating FROM cf_user WHERE handle = ?", handle)
+    return result[0]["rating"] if result else None
@@ -1,9 +1,22 @@
+from typing import List
+
+from config import DUEL_ARCHIVE_COMPRESSION
 from database.db import DB
+from database.partition_queries import duel_partition_queries, ensure_duel_partitions
+
+# columns added to the duel tables after they were first created, in the order they were added
+ADDED_DUEL_COLUMNS = [("channel_id", "BIGINT"), ("message_id", "BIGINT"), ("mode", "TEXT")]
+# the only columns of an archived duel big enough to be worth compressing
+ARCHIVE_COMPRESSED_COLUMNS = ["problems", "problem", "progress"]
 
 
 async def create_tables():
     await DB.establish_connection()
+    await create_schema()
+    await DB.close_connection()
+
 
+async def create_schema():
     print("Creating user_data table.")
     query = (
         "CREATE TABLE IF NOT EXISTS user_data ("
@@ -17,10 +30,9 @@ async def create_tables():
     )
     await DB.execute_query(query)
 
-    print("Creating duels_tictac table.")
-    query = (
-        "CREATE TABLE IF NOT EXISTS duels_tictac ("
-        "duel_id TEXT PRIMARY KEY,"
+    array_type = DB.backend.array_type
+    duel_columns = (
+        "duel_id TEXT NOT NULL,"
         "player1 BIGINT NOT NULL,"
         "player2 BIGINT NOT NULL,"
         "start_time BIGINT NOT NULL,"
@@ -29,36 +41,19 @@ async def create_tables():
         "status TEXT NOT NULL,"
         "winner BIGINT,"
         "rating INT NOT NULL, "
-        "problems TEXT[] NOT NULL,"
-        "progress TEXT[] NOT NULL,"
-        "tournament_id TEXT"
-        ")"
+        f"problems {array_type} NOT NULL,"
+        f"progress {array_type} NOT NULL,"
+        "tournament_id TEXT,"
+        "channel_id BIGINT,"
+        "message_id BIGINT"
     )
-    await DB.execute_query(query)
-
-    print("Creating duels_mini table.")
-    query = (
-        "CREATE TABLE IF NOT EXISTS duels_mini ("
-        "duel_id TEXT PRIMARY KEY,"
-        "player1 BIGINT NOT NULL,"
-        "player2 BIGINT NOT NULL,"
-        "start_time BIGINT NOT NULL,"
-        "time_limit INT NOT NULL,"
-        "end_time BIGINT,"
-        "status TEXT NOT NULL,"
-        "winner BIGINT,"
-        "rating INT NOT NULL, "
-        "problems TEXT[] NOT NULL,"
-        "progress TEXT[] NOT NULL,"
-        "tournament_id TEXT"
-        ")"
+    grid_columns = (
+        f"{duel_columns},"
+        "board_size INT NOT NULL,"
+        "win_length INT NOT NULL"
     )
-    await DB.execute_query(query)
-
-    print("Creating duels_classic table.")
-    query = (
-        "CREATE TABLE IF NOT EXISTS duels_classic ("
-        "duel_id TEXT PRIMARY KEY,"
+    classic_columns = (
+        "duel_id TEXT NOT NULL,"
         "player1 BIGINT NOT NULL,"
         "player2 BIGINT NOT NULL,"
         "start_time BIGINT NOT NULL,"
@@ -69,10 +64,25 @@ async def create_tables():
         "rating INT NOT NULL, "
         "problem TEXT NOT NULL,"
         "progress TEXT NOT NULL,"
-        "tournament_id TEXT"
-        ")"
+        "tournament_id TEXT,"
+        "channel_id BIGINT,"
+        "message_id BIGINT"
     )
-    await DB.execute_query(query)
+
+    print("Creating duel_ids table.")
+    await create_duel_ids_table()
+
+    print("Creating duels_tictac table.")
+    await create_duel_table("duels_tictac", duel_columns)
+
+    print("Creating duels_mini table.")
+    await create_duel_table("duels_mini", duel_columns)
+
+    print("Creating duels_grid table.")
+    await create_duel_table("duels_grid", grid_columns)
+
+    print("Creating duels_classic table.")
+    await create_duel_table("duels_classic", classic_columns)
 
     print("Creating cf_user table.")
     query = (
@@ -105,16 +115,158 @@ async def create_tables():
         "CREATE TABLE IF NOT EXISTS cf_problem ("
         "contestId INT NOT NULL,"
         "problemsetName TEXT,"
-        "index TEXT NOT NULL,"
+        "\"index\" TEXT NOT NULL,"
         "name TEXT NOT NULL,"
-        "PRIMARY KEY (contestId, index, name), "
         "type TEXT NOT NULL,"
         "points FLOAT,"
         "rating INT,"
-        "tags TEXT[] NOT NULL,"
-        "solvedCount INT NOT NULL"
+        f"tags {DB.backend.array_type} NOT NULL,"
+        "solvedCount INT NOT NULL,"
+        "PRIMARY KEY (contestId, \"index\", name)"
         ")"
     )
     await DB.execute_query(query)
 
-    await DB.close_connection()
+
+async def create_duel_table(table: str, columns: str):
+    """
+    Creates a duel table range partitioned by month on start_time, along with its
+    archive table and the indexes backing the ongoing / per player lookups.
+    A plain table left over from before partitioning is migrated into it.
+    Backends without partitioning get a plain table with the same indexes.
+    """
+    if not DB.backend.supports_partitions:
+        await DB.execute_query(
+            f"CREATE TABLE IF NOT EXISTS {table} ({columns}, PRIMARY KEY (duel_id, start_time))"
+        )
+        await DB.execute_query(f"CREATE TABLE IF NOT EXISTS {table}_archive ({columns})")
+        await add_duel_columns(table)
+        await create_duel_indexes(table)
+        await register_duel_ids(table)
+        return
+
+    result = await DB.execute_query("SELECT relkind FROM pg_class WHERE relname = ?", table)
+    if result and result[0]["relkind"] == "r":
+        await migrate_duel_table(table, columns)
+        return
+
+    for query in partitioned_duel_table_queries(table, columns):
+        await DB.execute_query(query)
+    await add_duel_columns(table)
+    await create_duel_indexes(table)
+    await ensure_duel_partitions(tables=[table])
+    await register_duel_ids(table)
+
+
+def partitioned_duel_table_queries(table: str, columns: str) -> List[str]:
+    """The partitioned duel table and its compressed archive."""
+    queries = [
+        (
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            f"{columns},"
+            "PRIMARY KEY (duel_id, start_time)"
+            ") PARTITION BY RANGE (start_time)"
+        ),
+        f"CREATE TABLE IF NOT EXISTS {table}_archive (LIKE {table})",
+        # packed full as archived rows are never updated. Postgres only compresses
+        # the values of rows past toast_tuple_target, 2kB by default and far more
+        # than a duel, at 128 bytes the problems and progress get compressed inline
+        f"ALTER TABLE {table}_archive SET (fillfactor = 100, toast_tuple_target = 128)",
+    ]
+    if DUEL_ARCHIVE_COMPRESSION != "default":
+        names = [definition.split()[0] for definition in columns.split(",")]
+        queries += [
+            f"ALTER TABLE {table}_archive ALTER COLUMN {column} SET COMPRESSION {DUEL_ARCHIVE_COMPRESSION}"
+            for column in ARCHIVE_COMPRESSED_COLUMNS
+            if column in names
+        ]
+    return queries
+
+
+async def migrate_duel_table(table: str, columns: str):
+    """
+    Moves a plain duel table left over from before partitioning into a new
+    partitioned one. It runs as one transaction, a migration failing halfway
+    leaves the plain table as it was, to be migrated again on the next start.
+    """
+    print(f"Migrating {table} to a partitioned table.")
+    result = await DB.execute_query(DB.backend.columns_query(table))
+    # the plain table may predate some of ADDED_DUEL_COLUMNS
+    legacy_columns = ", ".join(row["name"] for row in result)
+    result = await DB.execute_query(f"SELECT MIN(start_time) AS start FROM {table}")
+
+    queries = [
+        f"ALTER TABLE {table} RENAME TO {table}_legacy",
+        f"ALTER TABLE {table}_legacy RENAME CONSTRAINT {table}_pkey TO {table}_legacy_pkey",
+        *partitioned_duel_table_queries(table, columns),
+        *[
+            f"ALTER TABLE {name} ADD COLUMN IF NOT EXISTS {column} {column_type}"
+            for name in [table, f"{table}_archive"]
+            for column, column_type in ADDED_DUEL_COLUMNS
+        ],
+        *duel_index_queries(table),
+        *duel_partition_queries(from_time=result[0]["start"], tables=[table]),
+        f"INSERT INTO {table} ({legacy_columns}) SELECT {legacy_columns} FROM {table}_legacy",
+        f"DROP TABLE {table}_legacy",
+        *register_duel_ids_queries(table),
+    ]
+    await DB.execute_transaction([(query, ()) for query in queries])
+
+
+async def create_duel_ids_table():
+    """
+    Every duel_id along with the table and start_time of its duel. The primary
+    key of a partitioned table has to include the partition key, so this is
+    what keeps duel ids unique, across partitions, archives and detached ones.
+    """
+    query = (
+        "CREATE TABLE IF NOT EXISTS duel_ids ("
+        "duel_id TEXT PRIMARY KEY,"
+        "duel_table TEXT NOT NULL,"
+        "start_time BIGINT NOT NULL"
+        ")"
+    )
+    await DB.execute_query(query)
+
+
+async def register_duel_ids(table: str):
+    """Adds the ids of the duels created before duel_ids existed."""
+    for query in register_duel_ids_queries(table):
+        await DB.execute_query(query)
+
+
+def register_duel_ids_queries(table: str) -> List[str]:
+    return [
+        # SQLite needs a WHERE to tell the upsert's ON from a join's
+        f"INSERT INTO duel_ids (duel_id, duel_table, start_time) SELECT duel_id, '{table}', start_time FROM {name} "
+        "WHERE true ON CONFLICT (duel_id) DO NOTHING"
+        for name in [table, f"{table}_archive"]
+    ]
+
+
+async def add_duel_columns(table: str):
+    """
+    Adds the columns of ADDED_DUEL_COLUMNS to tables created before them, the
+    parent and archive alike so that their column order still matches.
+    """
+    for name in [table, f"{table}_archive"]:
+        result = await DB.execute_query(DB.backend.columns_query(name))
+        columns = {row["name"] for row in result}
+        for column, column_type in ADDED_DUEL_COLUMNS:
+            if column not in columns:
+                print(f"Adding {column} to {name}.")
+                await DB.execute_query(f"ALTER TABLE {name} ADD COLUMN {column} {column_type}")
+
+
+async def create_duel_indexes(table: str):
+    for query in duel_index_queries(table):
+        await DB.execute_query(query)
+
+
+def duel_index_queries(table: str) -> List[str]:
+    return [
+        f"CREATE INDEX IF NOT EXISTS {table}_ongoing_idx ON {table} (start_time) WHERE status = 'ongoing'",
+        f"CREATE INDEX IF NOT EXISTS {table}_player1_idx ON {table} (player1, start_time DESC)",
+        f"CREATE INDEX IF NOT EXISTS {table}_player2_idx ON {table} (player2, start_time DESC)",
+        f"CREATE INDEX IF NOT EXISTS {table}_archive_duel_id_idx ON {table}_archive (duel_id)",
+    ]
@@ -1,23 +1,46 @@
+from asyncio import Task, create_task, sleep
 from tortoise import BaseDBAsyncClient, Tortoise
 from logging import info, error
-from typing import Optional, List, Dict, Any
+from time import perf_counter
+from typing import Optional, List, Dict, Any, Tuple
 
-from config import TORTOISE_ORM
+from config import (
+    TORTOISE_ORM,
+    DB_BACKEND,
+    DB_POOL_MIN_SIZE,
+    DB_POOL_MAX_SIZE,
+    DB_POOL_ACQUIRE_TIMEOUT,
+    DB_POOL_MAX_LIFETIME,
+)
+from database.backends import StorageBackend, get_backend
+from database.pool import PoolGate
+from database.query_stats import QueryStats
 
 
 class DB:
     conn: Optional[BaseDBAsyncClient] = None
+    backend: StorageBackend = get_backend(DB_BACKEND)
+    pool_gate = PoolGate(DB_POOL_MAX_SIZE, DB_POOL_ACQUIRE_TIMEOUT)
+    _recycle_task: Optional["Task[None]"] = None
 
     @staticmethod
-    async def establish_connection():
-        await Tortoise.init(config=TORTOISE_ORM)
+    async def establish_connection(
+        config: Dict[str, Any] = TORTOISE_ORM, backend: str = DB_BACKEND
+    ):
+        DB.backend = get_backend(backend)
+        await Tortoise.init(config=config)
         DB.conn = Tortoise.get_connection("default")
         await DB.conn.execute_query_dict("SELECT 1")  # type: ignore
+        DB._recycle_task = create_task(DB._recycle_connections())
         info("Database connection established")
     
     @staticmethod
     async def close_connection():
+        if DB._recycle_task is not None:
+            DB._recycle_task.cancel()
+            DB._recycle_task = None
         await Tortoise.close_connections()
+        DB.conn = None
         info("Database connection closed")
     
     @staticmethod
@@ -25,30 +48,91 @@ class DB:
         if DB.conn is None:
             DB.conn = Tortoise.get_connection("default")
         return DB.conn
+
+    @staticmethod
+    def get_pool() -> Any:
+        """
+        Returns the driver's pool (asyncpg.Pool), None if it isn't open.
+        """
+        return getattr(DB.get_connection(), "_pool", None)
+
+    @staticmethod
+    async def _recycle_connections():
+        """
+        asyncpg only retires idle connections, so every connection is marked
+        expired once per DB_POOL_MAX_LIFETIME and replaced on its next release.
+        """
+        while True:
+            await sleep(DB_POOL_MAX_LIFETIME)
+            pool = DB.get_pool()
+            if pool is not None:
+                await pool.expire_connections()
+                info("Database connections expired for recycling")
+
+    @staticmethod
+    def pool_stats() -> Dict[str, Any]:
+        pool = DB.get_pool()
+        gate = DB.pool_gate
+        return {
+            "min_size": DB_POOL_MIN_SIZE,
+            "max_size": DB_POOL_MAX_SIZE,
+            "open": pool.get_size() if pool is not None else 0,
+            "idle": pool.get_idle_size() if pool is not None else 0,
+            "in_use": gate.in_use,
+            "waiters": gate.waiters,
+            "max_waiters": gate.max_waiters,
+            "timeouts": gate.timeouts,
+            "acquire_wait": gate.acquire_wait,
+        }
     
     @staticmethod
     def format_query(query: str):
-        formatted_query = ""
-        i = 0
-        ctr = 1
-        while i < len(query):
-            if query[i] != "?":
-                formatted_query += query[i]
-            elif i < len(query) - 1 and query[i + 1] == "?":
-                formatted_query += "?"
-            else:
-                formatted_query += f"${ctr}"
-                ctr += 1
-            i += 1
-        return formatted_query
+        return DB.backend.format_query(query)
     
     @staticmethod
     async def execute_query(query: str, *args: Any):
+        # only the time spent holding a connection counts towards the query
+        start: Optional[float] = None
+        rows = 0
+        failed = False
         try:
-            query = DB.format_query(query)
+            formatted_query = DB.format_query(query)
+            values = DB.backend.adapt_args(args)
             conn = DB.get_connection()
-            result: List[Dict[str, Any]] = await conn.execute_query_dict(query, args)  # type: ignore
-            return result
+            async with DB.pool_gate.acquire():
+                start = perf_counter()
+                result: List[Dict[str, Any]] = await conn.execute_query_dict(formatted_query, values)  # type: ignore
+            rows = len(result)
+            return DB.backend.adapt_rows(result)
         except Exception as exc:
+            failed = True
             error(f"Error executing query: {exc}, query: {query}, args: {args}")
             raise exc
+        finally:
+            elapsed_ms = (perf_counter() - start) * 1000 if start is not None else None
+            QueryStats.record(query, elapsed_ms, rows, failed, args)
+
+    @staticmethod
+    async def execute_transaction(statements: List[Tuple[str, Tuple[Any, ...]]]):
+        """
+        Executes the (query, args) statements in order inside a single transaction.
+        """
+        from tortoise.transactions import in_transaction
+
+        query = ""
+        args: Tuple[Any, ...] = ()
+        # when the statement being run started, None outside of one
+        start: Optional[float] = None
+        try:
+            async with DB.pool_gate.acquire(), in_transaction("default") as conn:
+                for query, args in statements:
+                    start = perf_counter()
+                    values = DB.backend.adapt_args(args)
+                    result = await conn.execute_query_dict(DB.format_query(query), values)  # type: ignore
+                    QueryStats.record(query, (perf_counter() - start) * 1000, len(result), False, args)
+                    start = None
+        except Exception as exc:
+            elapsed_ms = (perf_counter() - start) * 1000 if start is not None else None
+            QueryStats.record(query, elapsed_ms, 0, True, args)
+            error(f"Error executing transaction: {exc}, query: {query}, args: {args}")
+            raise exc
@@ -1,18 +1,24 @@
-from typing import TYPE_CHECKING
+from typing import Any, Dict, List, Tuple, Union, TYPE_CHECKING
 
 from database.db import DB
+from database.partition_queries import ensure_current_partitions
 
 if TYPE_CHECKING:
-    from duels.tictac_duel import TicTacDuel
+    from duels.tictac_duel import TicTacDuel, GridDuel
     from duels.b3_duel import B3Duel
 
+    AnyDuel = Union[TicTacDuel, GridDuel, B3Duel]
+
 
 async def create_tictac_duel(duel: "TicTacDuel"):
+    await ensure_current_partitions()
     query = (
-        "INSERT INTO duels_tictac (duel_id, player1, player2, start_time, time_limit, end_time, status, winner, rating, problems, progress, tournament_id) "
-        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+        "INSERT INTO duels_tictac (duel_id, player1, player2, start_time, time_limit, end_time, status, winner, rating, problems, progress, tournament_id, mode) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
     )
-    await DB.execute_query(
+    await _insert_duel(
+        "duels_tictac",
+        duel,
         query,
         duel.duel_id,
         duel.player1,
@@ -26,11 +32,15 @@ async def create_tictac_duel(duel: "TicTacDuel"):
         duel.problems,
         duel.progress,
         duel.tournament_id,
+        duel.mode.name,
     )
 
 
 async def save_tictac_duel(duel: "TicTacDuel"):
-    query = "UPDATE duels_tictac SET end_time = ?, status = ?, winner = ?, progress = ? WHERE duel_id = ?"
+    query = (
+        "UPDATE duels_tictac SET end_time = ?, status = ?, winner = ?, progress = ? "
+        "WHERE duel_id = ? AND start_time = ?"
+    )
     await DB.execute_query(
         query,
         duel.end_time,
@@ -38,15 +48,63 @@ async def save_tictac_duel(duel: "TicTacDuel"):
         duel.winner,
         duel.progress,
         duel.duel_id,
+        duel.start_time,
     )
 
 
-async def create_b3_duel(duel: "B3Duel"):
+async def create_grid_duel(duel: "GridDuel"):
+    await ensure_current_partitions()
     query = (
-        "INSERT INTO duels_tictac (duel_id, player1, player2, start_time, time_limit, end_time, status, winner, rating, problems, progress, tournament_id) "
-        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+        "INSERT INTO duels_grid (duel_id, player1, player2, start_time, time_limit, end_time, status, winner, rating, problems, progress, tournament_id, board_size, win_length, mode) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+    )
+    await _insert_duel(
+        "duels_grid",
+        duel,
+        query,
+        duel.duel_id,
+        duel.player1,
+        duel.player2,
+        duel.start_time,
+        duel.time_limit,
+        duel.end_time,
+        duel.status,
+        duel.winner,
+        duel.rating,
+        duel.problems,
+        duel.progress,
+        duel.tournament_id,
+        duel.board.size,
+        duel.board.win_length,
+        duel.mode.name,
+    )
+
+
+async def save_grid_duel(duel: "GridDuel"):
+    query = (
+        "UPDATE duels_grid SET end_time = ?, status = ?, winner = ?, progress = ? "
+        "WHERE duel_id = ? AND start_time = ?"
     )
     await DB.execute_query(
+        query,
+        duel.end_time,
+        duel.status,
+        duel.winner,
+        duel.progress,
+        duel.duel_id,
+        duel.start_time,
+    )
+
+
+async def create_b3_duel(duel: "B3Duel"):
+    await ensure_current_partitions()
+    query = (
+        "INSERT INTO duels_tictac (duel_id, player1, player2, start_time, time_limit, end_time, status, winner, rating, problems, progress, tournament_id, mode) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+    )
+    await _insert_duel(
+        "duels_tictac",
+        duel,
         query,
         duel.duel_id,
         duel.player1,
@@ -60,11 +118,15 @@ async def create_b3_duel(duel: "B3Duel"):
         duel.problems,
         duel.progress,
         duel.tournament_id,
+        duel.mode.name,
     )
 
 
 async def save_b3_duel(duel: "B3Duel"):
-    query = "UPDATE duels_tictac SET end_time = ?, status = ?, winner = ?, progress = ? WHERE duel_id = ?"
+    query = (
+        "UPDATE duels_tictac SET end_time = ?, status = ?, winner = ?, progress = ? "
+        "WHERE duel_id = ? AND start_time = ?"
+    )
     await DB.execute_query(
         query,
         duel.end_time,
@@ -72,4 +134,60 @@ async def save_b3_duel(duel: "B3Duel"):
         duel.winner,
         duel.progress,
         duel.duel_id,
+        duel.start_time,
+    )
+
+
+async def _insert_duel(table: str, duel: "AnyDuel", query: str, *args: Any):
+    """
+    Inserts the duel along with its id into duel_ids, which fails on an id
+    that is already taken.
+    """
+    await DB.execute_transaction(
+        [
+            (
+                "INSERT INTO duel_ids (duel_id, duel_table, start_time) VALUES (?, ?, ?)",
+                (duel.duel_id, table, duel.start_time),
+            ),
+            (query, args),
+        ]
+    )
+
+
+async def save_tictac_duel_message(duel: "TicTacDuel"):
+    await _save_duel_message("duels_tictac", duel)
+
+
+async def save_b3_duel_message(duel: "B3Duel"):
+    await _save_duel_message("duels_tictac", duel)
+
+
+async def save_grid_duel_message(duel: "GridDuel"):
+    await _save_duel_message("duels_grid", duel)
+
+
+async def _save_duel_message(table: str, duel: "AnyDuel"):
+    query = f"UPDATE {table} SET channel_id = ?, message_id = ? WHERE duel_id = ? AND start_time = ?"
+    await DB.execute_query(query, duel.channel_id, duel.message_id, duel.duel_id, duel.start_time)
+
+
+async def expire_duel(table: str, duel_id: str, start_time: int):
+    """
+    Closes an ongoing duel at the end_time it was created with, for duels that
+    can't be brought back after a restart.
+    """
+    query = f"UPDATE {table} SET status = 'timed_out' WHERE duel_id = ? AND start_time = ? AND status = 'ongoing'"
+    await DB.execute_query(query, duel_id, start_time)
+
+
+async def get_ongoing_duels(table: str, after: Tuple[int, str], limit: int) -> List[Dict[str, Any]]:
+    """
+    A page of the ongoing duels of a table in (start_time, duel_id) order, starting
+    after the given key. Served by the partial index on ongoing duels, so the cost
+    follows the number of live duels and not the size of the table.
+    """
+    query = (
+        f"SELECT * FROM {table} WHERE status = 'ongoing' AND (start_time, duel_id) > (?, ?) "
+        "ORDER BY start_time, duel_id LIMIT ?"
     )
+    return await DB.execute_query(query, *after, limit)
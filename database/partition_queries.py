@@ -0,0 +1,154 @@
+"""
+Monthly range partitioning of the duel tables on start_time, and archival of
+partitions which fall outside the retention window.
+"""
+
+from datetime import datetime, timezone
+from logging import info
+from typing import Any, List, Optional, Tuple
+
+from config import DUEL_RETENTION_MONTHS, DUEL_PARTITIONS_AHEAD, DUEL_ARCHIVE_MODE
+from database.db import DB
+from utils.general import get_time
+
+DUEL_TABLES = ["duels_tictac", "duels_mini", "duels_grid", "duels_classic"]
+
+# month start for which partitions have been ensured in this process
+_ensured_month: Optional[int] = None
+
+
+def month_start(timestamp: int, offset: int = 0) -> int:
+    """
+    Returns the UTC epoch of the start of the month containing `timestamp`,
+    shifted by `offset` months.
+    """
+    date = datetime.fromtimestamp(timestamp, tz=timezone.utc)
+    year, month = divmod(date.year * 12 + date.month - 1 + offset, 12)
+    return int(datetime(year, month + 1, 1, tzinfo=timezone.utc).timestamp())
+
+
+def partition_name(table: str, start: int) -> str:
+    date = datetime.fromtimestamp(start, tz=timezone.utc)
+    return f"{table}_p{date.year:04d}{date.month:02d}"
+
+
+def partition_start(table: str, name: str) -> Optional[int]:
+    """
+    Returns the month start of a partition created by `ensure_duel_partitions`,
+    None if the name doesn't follow the naming scheme.
+    """
+    suffix = name[len(f"{table}_p"):]
+    if not name.startswith(f"{table}_p") or len(suffix) != 6 or not suffix.isdigit():
+        return None
+    year, month = int(suffix[:4]), int(suffix[4:])
+    return int(datetime(year, month, 1, tzinfo=timezone.utc).timestamp())
+
+
+async def ensure_duel_partitions(
+    from_time: Optional[int] = None, tables: Optional[List[str]] = None
+):
+    """
+    Creates the monthly partitions of the duel tables from the month of
+    `from_time` (default: now) up to DUEL_PARTITIONS_AHEAD months ahead.
+    """
+    if not DB.backend.supports_partitions:
+        return
+
+    for query in duel_partition_queries(from_time, tables):
+        await DB.execute_query(query)
+
+
+def duel_partition_queries(
+    from_time: Optional[int] = None, tables: Optional[List[str]] = None
+) -> List[str]:
+    """The queries of `ensure_duel_partitions`, to run them inside a transaction."""
+    queries: List[str] = []
+    month = month_start(from_time or get_time())
+    last = month_start(get_time(), DUEL_PARTITIONS_AHEAD)
+    while month <= last:
+        next_month = month_start(month, 1)
+        for table in tables or DUEL_TABLES:
+            queries.append(
+                f"CREATE TABLE IF NOT EXISTS {partition_name(table, month)} "
+                f"PARTITION OF {table} FOR VALUES FROM ({month}) TO ({next_month})"
+            )
+        month = next_month
+    return queries
+
+
+async def ensure_current_partitions():
+    """
+    Cheap guard for the insert path, only touches the DB once per month.
+    """
+    global _ensured_month
+
+    current = month_start(get_time())
+    if _ensured_month != current:
+        await ensure_duel_partitions()
+        _ensured_month = current
+
+
+async def list_duel_partitions(table: str) -> List[str]:
+    query = (
+        "SELECT child.relname AS name FROM pg_inherits "
+        "JOIN pg_class parent ON pg_inherits.inhparent = parent.oid "
+        "JOIN pg_class child ON pg_inherits.inhrelid = child.oid "
+        "WHERE parent.relname = ? ORDER BY child.relname"
+    )
+    result = await DB.execute_query(query, table)
+    return [row["name"] for row in result]
+
+
+async def archive_old_duels() -> List[Tuple[str, int]]:
+    """
+    Detaches every partition which ended before the retention window.
+    In "move" mode the rows are copied into `<table>_archive` and the partition
+    is dropped, in "detach" mode the partition is left as a standalone table.
+
+    Returns a list of (partition, row count) that were archived.
+    Backends without partitioning move the rows one table at a time instead.
+    """
+    cutoff = month_start(get_time(), -DUEL_RETENTION_MONTHS)
+    if not DB.backend.supports_partitions:
+        return await _archive_old_duel_rows(cutoff)
+
+    archived: List[Tuple[str, int]] = []
+    for table in DUEL_TABLES:
+        for name in await list_duel_partitions(table):
+            start = partition_start(table, name)
+            if start is None or month_start(start, 1) > cutoff:
+                continue
+
+            result = await DB.execute_query(f"SELECT COUNT(*) AS count FROM {name}")
+            statements: List[Tuple[str, Tuple[Any, ...]]] = [
+                (f"ALTER TABLE {table} DETACH PARTITION {name}", ()),
+            ]
+            if DUEL_ARCHIVE_MODE == "move":
+                statements.append((f"INSERT INTO {table}_archive SELECT * FROM {name}", ()))
+                statements.append((f"DROP TABLE {name}", ()))
+            await DB.execute_transaction(statements)
+
+            info(f"Archived partition {name} ({result[0]['count']} rows, mode: {DUEL_ARCHIVE_MODE})")
+            archived.append((name, result[0]["count"]))
+
+    await ensure_duel_partitions()
+    return archived
+
+
+async def _archive_old_duel_rows(cutoff: int) -> List[Tuple[str, int]]:
+    archived: List[Tuple[str, int]] = []
+    for table in DUEL_TABLES:
+        result = await DB.execute_query(
+            f"SELECT COUNT(*) AS count FROM {table} WHERE start_time < ?", cutoff
+        )
+        if result[0]["count"] == 0:
+            continue
+        await DB.execute_transaction(
+            [
+                (f"INSERT INTO {table}_archive SELECT * FROM {table} WHERE start_time < ?", (cutoff,)),
+                (f"DELETE FROM {table} WHERE start_time < ?", (cutoff,)),
+            ]
+        )
+        info(f"Archived {result[0]['count']} rows of {table}")
+        archived.append((table, result[0]["count"]))
+    return archived
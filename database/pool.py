@@ -0,0 +1,81 @@
+from asyncio import Semaphore, Task, create_task, wait
+from contextlib import asynccontextmanager
+from time import perf_counter
+from typing import AsyncIterator, Optional
+
+from utils.metrics import Histogram
+
+
+class PoolAcquireTimeout(Exception):
+    """Raised when no DB connection frees up within the acquire timeout."""
+
+    pass
+
+
+class PoolGate:
+    """
+    Admits at most `size` concurrent queries (the size of the driver's pool) so
+    that time spent waiting for a connection can be told apart from time spent
+    in Postgres.
+    """
+
+    def __init__(self, size: int, acquire_timeout: float):
+        self.size = size
+        self.acquire_timeout = acquire_timeout
+        self._semaphore: Optional[Semaphore] = None
+
+        self.in_use = 0
+        self.waiters = 0
+        self.max_waiters = 0
+        self.timeouts = 0
+        self.acquire_wait = Histogram()
+
+    @asynccontextmanager
+    async def acquire(self) -> AsyncIterator[None]:
+        """
+        :raises PoolAcquireTimeout: If no slot frees up within acquire_timeout
+        """
+        if self._semaphore is None:
+            self._semaphore = Semaphore(self.size)
+
+        start = perf_counter()
+        if not self._semaphore.locked():
+            # a free slot is taken without suspending, no task needed
+            await self._semaphore.acquire()
+        else:
+            await self._wait_for_slot()
+        self.acquire_wait.observe((perf_counter() - start) * 1000)
+
+        self.in_use += 1
+        try:
+            yield
+        finally:
+            self.in_use -= 1
+            self._semaphore.release()
+
+    async def _wait_for_slot(self):
+        assert self._semaphore is not None
+        self.waiters += 1
+        self.max_waiters = max(self.max_waiters, self.waiters)
+        # waited on as a task, a slot taken just as the timeout fires is handed back
+        acquire = create_task(self._semaphore.acquire())
+        try:
+            finished, _ = await wait([acquire], timeout=self.acquire_timeout)
+        except BaseException:
+            self._give_back(acquire)
+            raise
+        finally:
+            self.waiters -= 1
+        if not finished:
+            self._give_back(acquire)
+            self.timeouts += 1
+            raise PoolAcquireTimeout(
+                f"No DB connection available after {self.acquire_timeout} seconds"
+            )
+
+    def _give_back(self, acquire: "Task[bool]"):
+        assert self._semaphore is not None
+        if acquire.done() and not acquire.cancelled():
+            self._semaphore.release()
+        else:
+            acquire.cancel()
@@ -0,0 +1,87 @@
+"""
+Per statement timing of the queries going through DB.
+"""
+
+import re
+from functools import lru_cache
+from logging import warning
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import DB_SLOW_QUERY_MS
+from utils.metrics import Histogram
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+
+class QueryStat:
+    def __init__(self, statement: str):
+        self.statement = statement
+        self.latency = Histogram()
+        self.calls = 0
+        self.rows = 0
+        self.errors = 0
+
+
+class QueryStats:
+    stats: Dict[str, QueryStat] = {}
+
+    @staticmethod
+    @lru_cache(maxsize=1024)
+    def normalize(query: str) -> str:
+        """
+        Strips literals and collapses placeholder lists so that queries differing
+        only in their values map to the same statement.
+        """
+        statement = _STRING_LITERAL.sub("?", query)
+        statement = _NUMBER_LITERAL.sub("?", statement)
+        statement = _IN_LIST.sub("(...)", statement)
+        return _WHITESPACE.sub(" ", statement).strip()
+
+    @staticmethod
+    def redact(args: Tuple[Any, ...]) -> str:
+        redacted: List[str] = []
+        for arg in args:
+            if isinstance(arg, (list, tuple)):
+                redacted.append(f"<{type(arg).__name__}[{len(arg)}]>")  # type: ignore
+            else:
+                redacted.append(f"<{type(arg).__name__}>")
+        return ", ".join(redacted)
+
+    @staticmethod
+    def record(query: str, elapsed_ms: Optional[float], rows: int, failed: bool, args: Tuple[Any, ...]):
+        """
+        :param elapsed_ms: None for a query that failed before it reached the DB,
+            it counts as an error without a latency sample
+        """
+        statement = QueryStats.normalize(query)
+        stat = QueryStats.stats.get(statement)
+        if stat is None:
+            stat = QueryStats.stats[statement] = QueryStat(statement)
+
+        stat.calls += 1
+        stat.rows += rows
+        stat.errors += failed
+        if elapsed_ms is None:
+            return
+        stat.latency.observe(elapsed_ms)
+
+        if elapsed_ms >= DB_SLOW_QUERY_MS:
+            warning(
+                f"Slow query: {elapsed_ms:.1f} ms, rows: {rows}, "
+                f"query: {statement}, args: ({QueryStats.redact(args)})"
+            )
+
+    @staticmethod
+    def top(count: int = 10) -> List[QueryStat]:
+        """
+        Returns the statements which spent the most total time in the DB.
+        """
+        stats = sorted(QueryStats.stats.values(), key=lambda x: x.latency.total, reverse=True)
+        return stats[:count]
+
+    @staticmethod
+    def reset():
+        QueryStats.stats.clear()
@@ -0,0 +1,405 @@
+"""
+base_duel.py
+What every board duel shares: its players, its solves, and the view showing it.
+The board itself, its game rules and how it is drawn, is left to each mode.
+"""
+
+from asyncio import gather
+from datetime import datetime
+from io import BytesIO
+from logging import warning
+from typing import Any, Dict, Hashable, List, Optional, Tuple, Union, TYPE_CHECKING
+
+from discord import Attachment, File, Interaction, Message
+
+from duels.engine import DuelTimeline, SolveEvent
+from duels.game_state import GameState
+from duels.poller import duel_poller
+from duels.spectators import duel_hub
+from orz_modules.duel import Duel, DuelStatus
+from utils import image_handling as imgh
+from utils.avatar_cache import AvatarCache
+from utils.context_manager import ctx_mgr
+from utils.discord import BaseView, BaseEmbed, Messenger
+from utils.discord.disc_utils import disc_utils
+from utils.general import generate_string, get_time
+from utils.image_encoding import BOARD_FILENAME
+from utils.render_cache import RenderCache, find_attachment
+from utils.render_service import RenderError
+
+if TYPE_CHECKING:
+    from codeforces.models import CFProblem
+    from orz_modules.user import User
+
+
+class BaseDuel:
+    # stored with the duel to tell the modes sharing a table apart
+    mode: Duel
+
+    @classmethod
+    async def create_duel(
+        cls,
+        player1: int,
+        player2: int,
+        problems_loaded: List["CFProblem"],
+        rating: int,
+        time_limit: int,
+        tournament_id: Optional[str] = None,
+        **duel_data: Any,
+    ):
+        """
+        :param duel_data: fields of the mode's own, like the board
+        """
+        start_time = get_time()
+        duel_data.update(
+            {
+                "duel_id": generate_string(16),
+                "player1": player1,
+                "player2": player2,
+                "start_time": start_time,
+                "time_limit": time_limit,
+                "end_time": start_time + time_limit * 60,
+                "status": DuelStatus.ONGOING.value,
+                "problems": [
+                    f"{problem.contestId}~{problem.index}" for problem in problems_loaded
+                ],
+                "progress": ["~"] * len(problems_loaded),
+                "problems_loaded": problems_loaded,
+                "rating": rating,
+                "tournament_id": tournament_id,
+            }
+        )
+        duel = cls(duel_data)
+        await duel._create()
+        await duel.load_players()
+        return duel
+
+    def __init__(self, duel_data: Dict[str, Any]):
+        self.duel_id: str = duel_data["duel_id"]
+
+        self.player1: int = duel_data["player1"]
+        self.player2: int = duel_data["player2"]
+
+        self.player1_loaded: Optional["User"] = None
+        self.player2_loaded: Optional["User"] = None
+
+        self.start_time: int = duel_data["start_time"]
+        self.time_limit: int = duel_data["time_limit"]
+        self.end_time: int = duel_data["end_time"]
+
+        self.status: str = duel_data["status"]
+        self.winner: Optional[int] = duel_data.get("winner")
+        self.progress: List[str] = duel_data["progress"]
+
+        self.first_solve: Optional[int] = None
+
+        self.rating: int = duel_data["rating"]
+        self.problems: List[str] = duel_data["problems"]
+        self.problems_loaded: List["CFProblem"] = duel_data.get("problems_loaded", [])
+
+        self.tournament_id: Optional[str] = duel_data.get("tournament_id")
+
+        # the message showing the duel, to reattach its view after a restart
+        self.channel_id: Optional[int] = duel_data.get("channel_id")
+        self.message_id: Optional[int] = duel_data.get("message_id")
+
+        self.deadline: int = self.start_time + 60 * self.time_limit
+        self.timeline = DuelTimeline(self._new_game_state(), self.deadline)
+        if any(progress != "~" for progress in self.progress):
+            self.timeline.add_events(self._progress_events())
+            self._apply_timeline()
+
+    def _new_game_state(self) -> GameState:
+        raise NotImplementedError
+
+    def _progress_events(self) -> List[SolveEvent]:
+        """
+        Solve events of the cells already claimed in `progress`.
+        """
+        events: List[SolveEvent] = []
+        for i, progress in enumerate(self.progress):
+            if progress != "~":
+                player, time = map(int, progress.split("~"))
+                events.append((time, i, player))
+        return events
+
+    async def load_players(self):
+        from orz_modules.user import User
+
+        self.player1_loaded = await User.load_user(self.player1)
+        self.player2_loaded = await User.load_user(self.player2)
+
+        await self.player1_loaded.load_disc_user()
+        await self.player2_loaded.load_disc_user()
+
+    async def update_progress(
+        self,
+        player1_progress: Dict["CFProblem", List[Tuple[int, str]]],
+        player2_progress: Dict["CFProblem", List[Tuple[int, str]]],
+    ) -> bool:
+        """
+        Replays both players' submissions onto the board.
+        Returns whether the board changed, the state is only saved if it did.
+        """
+        from codeforces.cf import Verdict
+
+        previous = (self.status, list(self.progress))
+
+        events: List[SolveEvent] = []
+        for i, problem in enumerate(self.problems_loaded):
+            for player, progress in [(self.player1, player1_progress), (self.player2, player2_progress)]:
+                for time, verdict in progress[problem]:
+                    if verdict == Verdict.OK.value:
+                        events.append((time, i, player))
+                        break
+        self.timeline.sync(events)
+        self._apply_timeline()
+
+        if self.status == DuelStatus.ONGOING.value and get_time() > self.deadline:
+            self.status = DuelStatus.TIMED_OUT.value
+
+        changed = (self.status, self.progress) != previous
+        if changed:
+            await self.save_state()
+        return changed
+
+    def _apply_timeline(self):
+        timeline = self.timeline
+        self.progress = ["~"] * len(self.problems)
+        for time, cell, player in timeline.claims:
+            self.progress[cell] = f"{player}~{time}"
+
+        self.status = timeline.status
+        self.winner = timeline.state.winner
+        self.first_solve = timeline.claims[0][2] if timeline.claims else None
+        if timeline.state.status != DuelStatus.ONGOING.value:
+            self.end_time = timeline.claims[-1][0]
+        else:
+            self.end_time = self.deadline
+
+    async def _get_player_imgs(self, size: Tuple[int, int]) -> Tuple[imgh.LayerSpec, imgh.LayerSpec]:
+        """
+        Both players' avatar layers at the given size. The avatars are fetched
+        concurrently and only once, the render workers decode them once each.
+        """
+        assert self.player1_loaded is not None
+        assert self.player1_loaded.disc_user is not None
+        assert self.player2_loaded is not None
+        assert self.player2_loaded.disc_user is not None
+        avatar1 = self.player1_loaded.disc_user.display_avatar
+        avatar2 = self.player2_loaded.disc_user.display_avatar
+        data1, data2 = await gather(AvatarCache.get_data(avatar1), AvatarCache.get_data(avatar2))
+        return imgh.avatar_layer(avatar1.key, data1, size), imgh.avatar_layer(avatar2.key, data2, size)
+
+    def render_key(self) -> str:
+        """
+        Content address of the board image, equal keys render identical images.
+        """
+        assert self.player1_loaded is not None and self.player1_loaded.disc_user is not None
+        assert self.player2_loaded is not None and self.player2_loaded.disc_user is not None
+        owners = tuple(
+            0 if progress == "~" else 1 if int(progress.split("~")[0]) == self.player1 else 2
+            for progress in self.progress
+        )
+        return RenderCache.key(
+            *self._render_key_parts(owners),
+            self.player1_loaded.disc_user.display_avatar.key,
+            self.player2_loaded.disc_user.display_avatar.key,
+        )
+
+    def _render_key_parts(self, owners: Tuple[int, ...]) -> Tuple[Hashable, ...]:
+        """
+        What the board image depends on besides the avatars.
+        :param owners: 0, 1 or 2 for each cell, whether it's free or whose it is
+        """
+        raise NotImplementedError
+
+    async def get_board_img(self) -> BytesIO:
+        return await RenderCache.get_or_render(self.render_key(), self._render_board_img)
+
+    async def _render_board_img(self) -> BytesIO:
+        raise NotImplementedError
+
+    async def _create(self):
+        raise NotImplementedError
+
+    async def save_state(self):
+        raise NotImplementedError
+
+    async def _save_message(self):
+        raise NotImplementedError
+
+    async def save_message(self, message: Message):
+        if (message.channel.id, message.id) == (self.channel_id, self.message_id):
+            return
+        self.channel_id, self.message_id = message.channel.id, message.id
+        await self._save_message()
+
+    async def expire(self) -> bool:
+        """
+        Closes the duel once past its deadline with the solves known so far, for
+        when its players' submissions can't be fetched one last time.
+        Returns whether the duel was still ongoing.
+        """
+        if self.status != DuelStatus.ONGOING.value:
+            return False
+        self.status = DuelStatus.TIMED_OUT.value
+        await self.save_state()
+        return True
+
+
+class BaseDuelView(BaseView):
+    @classmethod
+    async def send_view(cls, duel: BaseDuel):
+        view = cls(duel)
+        await view._send_view()
+        duel_poller().track(duel, view.on_duel_update)
+
+    @classmethod
+    def restore_view(cls, duel: BaseDuel, message: Message) -> "BaseDuelView":
+        """
+        Reattaches the view of an ongoing duel to its message after a restart.
+        """
+        ctx_mgr().set_active_msg(message)
+        view = cls(duel)
+        view._add_items()
+        disc_utils().add_view(view, message.id)
+        duel_poller().track(duel, view.on_duel_update)
+        view._publish()
+        return view
+
+    def __init__(self, duel: BaseDuel):
+        self.duel = duel
+        # stable across restarts so that clicks on the old message still land here
+        self._refresh_id = f"duel~{self.duel.duel_id}~refresh"
+        # render key of the board on the message, and of the one being sent
+        self._board_key: Optional[str] = None
+        self._next_board_key: Optional[str] = None
+        super().__init__(
+            users=[self.duel.player1, self.duel.player2],
+            # the poller closes the duel at its deadline, and the view along with it
+            timeout=None,
+        )
+
+    def _add_items(self):
+        self.clear_items()
+
+        if self.duel.status == DuelStatus.ONGOING.value:
+            self._add_button(label="REFRESH", custom_id=self._refresh_id, row=3)
+
+    def _action_key(self, interaction: Interaction, custom_id: str) -> Hashable:
+        # a refresh shows both players the same board
+        return custom_id
+
+    async def _button_clicked(self, interaction: Interaction, custom_id: str) -> None:
+        await self._defer(interaction)
+
+        if custom_id == self._refresh_id:
+            await self._send_refreshing_duel_dropdown()
+            await self.refresh_duel()
+            return
+
+        else:
+            raise ValueError(f"Invalid custom_id: {custom_id}")
+
+    async def _send_view(self):
+        await super()._send_view()
+        self._board_key = self._next_board_key
+        assert self._active_msg is not None
+        await self.duel.save_message(self._active_msg)
+        self._publish()
+
+    def _publish(self):
+        """
+        Hands the duel to its spectators along with the board just uploaded, so
+        that they show the same image rather than a render and upload of their own.
+        """
+        attachment = find_attachment(self._active_msg, BOARD_FILENAME)
+        duel_hub().publish(self.duel, attachment.url if attachment is not None else None)  # type: ignore
+
+    async def _get_board_file(self) -> Optional[Union[File, Attachment]]:
+        """
+        The board image to send, the attachment already on the message when the
+        board hasn't changed since it was uploaded.
+        A render that is turned away or times out keeps the last board, if any.
+        """
+        key = self.duel.render_key()
+        attachment = find_attachment(self._active_msg, BOARD_FILENAME)
+        if key == self._board_key and attachment is not None:
+            self._next_board_key = key
+            RenderCache.uploads_skipped += 1
+            return attachment
+
+        try:
+            board_img = await self.duel.get_board_img()
+        except RenderError as e:
+            warning(f"Board render failed for duel {self.duel.duel_id}: {e}")
+            self._next_board_key = self._board_key
+            return attachment
+        self._next_board_key = key
+        return File(board_img, BOARD_FILENAME)
+
+    async def _send_refreshing_duel_dropdown(self):
+        self.clear_items()
+        self._add_text_dropdown("Refreshing . . .")
+        self._active_msg = await Messenger.send_message_no_reset(view=self)
+
+    async def refresh_duel(self) -> None:
+        # the poller pushes the board itself if anything changed
+        if not await duel_poller().poll_now(self.duel):  # type: ignore
+            await self._show_duel()
+
+    async def on_duel_update(self) -> None:
+        ctx_mgr().set_init_interaction(self._init_interaction)
+        assert self._active_msg is not None
+        ctx_mgr().set_active_msg(self._active_msg)
+        await self._show_duel()
+
+    async def _show_duel(self) -> None:
+        if self.duel.status == DuelStatus.TIMED_OUT.value:
+            await self.stop_and_disable(custom_text="Time's up!")
+            self._publish()
+            return
+        await self._send_view()
+        if self.duel.status == DuelStatus.FINISHED.value:
+            self.stop()
+
+    def _embed_title(self) -> str:
+        raise NotImplementedError
+
+    def _add_board_fields(self, embed: BaseEmbed):
+        """Adds the board's problems, and who solved each, to the embed."""
+        raise NotImplementedError
+
+    async def _get_embed(self):
+        embed = BaseEmbed(title=self._embed_title())
+        if self.duel.status != DuelStatus.ONGOING.value:
+            embed.add_field(name="")
+            if self.duel.status == DuelStatus.FINISHED.value:
+                embed.add_field(name="Winner 👑", value=f"<@{self.duel.winner}>")
+            elif self.duel.status == DuelStatus.DRAW.value:
+                embed.add_field(name="Draw 😕")
+            else:
+                raise ValueError(f"Invalid status: {self.duel.status}")
+            embed.add_field(name="")
+
+        embed.timestamp = datetime.fromtimestamp(self.duel.start_time)
+        embed.add_field(name="Player 1", value=f"<@{self.duel.player1}>")
+        embed.add_field(name="Rating", value=f"{self.duel.rating}")
+        embed.add_field(name="Player 2", value=f"<@{self.duel.player2}>")
+        embed.add_field(
+            name="",
+            value=(
+                f"**Duration:** {self.duel.time_limit} mins\n"
+                f"**Start:** <t:{self.duel.start_time}:t> \\~\\~ <t:{self.duel.start_time}:R>\n"
+                f"**End:** <t:{self.duel.end_time}:t> \\~\\~ <t:{self.duel.end_time}:R>"
+            ),
+            inline=False,
+        )
+        embed.add_field(name="x - > - o - < - x", inline=False)
+        self._add_board_fields(embed)
+
+        # message.edit keeps an Attachment as is instead of uploading it again
+        board_file = await self._get_board_file()
+        files: List[File] = [board_file] if board_file is not None else []  # type: ignore
+        return embed, files
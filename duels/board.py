@@ -0,0 +1,125 @@
+"""
+board.py
+Square grid boards of the line duel modes, N x N cells with k in a row to win.
+"""
+
+from typing import Dict, List, Tuple
+
+from duels.game_state import LineSet
+from utils import image_handling as imgh
+
+BOARD_PX = 900  # canvas width and height of every board image
+GRID_COLOR = (0, 255, 255, 255)
+LINE_COLOR = (255, 0, 0, 255)
+
+# (row step, col step) of rows, columns, main diagonals and anti diagonals
+DIRECTIONS = [(0, 1), (1, 0), (1, 1), (1, -1)]
+
+
+def grid_lines(size: int, win_length: int) -> List[List[int]]:
+    """
+    Every run of `win_length` cells along a row, column or diagonal of a
+    `size` x `size` grid, cells numbered row by row.
+    Lines are grouped by direction in the order of DIRECTIONS, so the 3 x 3
+    board keeps the rows, columns, main and anti diagonal order of TicTac.
+    """
+    lines: List[List[int]] = []
+    for d_row, d_col in DIRECTIONS:
+        for row in range(size):
+            for col in range(size):
+                end_row = row + d_row * (win_length - 1)
+                end_col = col + d_col * (win_length - 1)
+                if not (0 <= end_row < size and 0 <= end_col < size):
+                    continue
+                lines.append([(row + d_row * i) * size + col + d_col * i for i in range(win_length)])
+    return lines
+
+
+class BoardSpec:
+    """
+    Geometry of a grid board: problem count, winning lines and image layout.
+    """
+
+    _cache: Dict[Tuple[int, int], "BoardSpec"] = {}
+
+    MIN_SIZE = 3
+    MAX_SIZE = 5
+
+    @classmethod
+    def get(cls, size: int, win_length: int) -> "BoardSpec":
+        if (size, win_length) not in cls._cache:
+            cls._cache[(size, win_length)] = cls(size, win_length)
+        return cls._cache[(size, win_length)]
+
+    def __init__(self, size: int, win_length: int):
+        if not self.MIN_SIZE <= size <= self.MAX_SIZE:
+            raise ValueError(f"Invalid board size: {size}")
+        if not self.MIN_SIZE <= win_length <= size:
+            raise ValueError(f"Invalid win length: {win_length}")
+
+        self.size = size
+        self.win_length = win_length
+        self.cell_count = size * size
+        self.line_set = LineSet.get(self.cell_count, grid_lines(size, win_length))
+
+        self.cell_px = BOARD_PX // size
+        self.margin = self.cell_px // 6
+        self.move_size = (self.cell_px - 2 * self.margin, self.cell_px - 2 * self.margin)
+
+    @property
+    def is_tictac(self) -> bool:
+        return self.size == 3 and self.win_length == 3
+
+    @property
+    def name(self) -> str:
+        if self.is_tictac:
+            return "TicTac"
+        return f"{self.size}x{self.size} Grid ({self.win_length} in a row)"
+
+    def coords(self, cell: int) -> Tuple[int, int]:
+        """(row, col) of a cell."""
+        return divmod(cell, self.size)
+
+    def move_location(self, cell: int) -> Tuple[int, int]:
+        """Top left pixel of the avatar placed on a cell."""
+        row, col = self.coords(cell)
+        return col * self.cell_px + self.margin, row * self.cell_px + self.margin
+
+    def _cell_center(self, cell: int) -> Tuple[int, int]:
+        row, col = self.coords(cell)
+        return col * self.cell_px + self.cell_px // 2, row * self.cell_px + self.cell_px // 2
+
+    def board_layer(self) -> imgh.LayerSpec:
+        if self.is_tictac:
+            return imgh.asset_layer("bin/tictac_board.png")
+        return imgh.grid_layer((BOARD_PX, BOARD_PX), self.size, GRID_COLOR, max(8, self.cell_px // 10))
+
+    def line_layer(self, line: int) -> Tuple[imgh.LayerSpec, Tuple[int, int]]:
+        """
+        Overlay striking through a winning line, and where to place it.
+        """
+        cells = self.line_set.lines[line]
+        (start_row, start_col), (end_row, end_col) = self.coords(cells[0]), self.coords(cells[-1])
+
+        if self.is_tictac:
+            if start_row == end_row:
+                return imgh.asset_layer("bin/tictac_across.png"), (0, self.cell_px * start_row)
+            if start_col == end_col:
+                return imgh.asset_layer("bin/tictac_across.png", rotation=1), (self.cell_px * start_col, 0)
+            return imgh.asset_layer("bin/tictac_diag.png", flipped=end_col < start_col), (0, 0)
+
+        # run the stroke from the first cell's far edge to the last cell's
+        (x0, y0), (x1, y1) = self._cell_center(cells[0]), self._cell_center(cells[-1])
+        step_x = (x1 - x0) // (len(cells) - 1) * 2 // 5
+        step_y = (y1 - y0) // (len(cells) - 1) * 2 // 5
+        line_spec = imgh.line_layer(
+            (BOARD_PX, BOARD_PX),
+            (x0 - step_x, y0 - step_y),
+            (x1 + step_x, y1 + step_y),
+            LINE_COLOR,
+            max(8, self.cell_px // 12),
+        )
+        return line_spec, (0, 0)
+
+
+TICTAC_BOARD = BoardSpec.get(3, 3)
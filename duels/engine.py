@@ -0,0 +1,114 @@
+"""
+engine.py
+Incremental timeline of a duel's solves.
+"""
+
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Tuple
+
+from duels.game_state import GameState
+from orz_modules.duel import DuelStatus
+
+# (time, cell, player)
+SolveEvent = Tuple[int, int, int]
+
+
+class DuelTimeline:
+    """
+    Keeps every known solve event in time order along with the game state after
+    the processed prefix. Events later than the processed prefix are applied on
+    top of the current state. An event earlier than that (e.g. a submission that
+    was still TESTING on the last poll) rewinds to the snapshot taken before its
+    position and replays from there.
+    """
+
+    def __init__(self, state: GameState, deadline: int):
+        self.deadline = deadline
+        self.state = state
+        self.timed_out = False
+
+        self.events: List[SolveEvent] = []
+        self.claims: List[SolveEvent] = []  # events which claimed a cell, in order
+        self.processed = 0
+
+        self._initial = state.copy()
+        self._earliest: Dict[Tuple[int, int], int] = {}  # (cell, player) -> time
+        self._snapshots: List[Tuple[GameState, int, bool]] = []  # before events[i]
+
+    @property
+    def status(self) -> str:
+        if self.state.status == DuelStatus.ONGOING.value and self.timed_out:
+            return DuelStatus.TIMED_OUT.value
+        return self.state.status
+
+    def is_over(self) -> bool:
+        return self.timed_out or self.state.status != DuelStatus.ONGOING.value
+
+    def sync(self, events: Iterable[SolveEvent]):
+        """
+        Brings the timeline in line with the full set of events known right now.
+        Only new or earlier events are applied incrementally, an event going
+        away (a rejudged submission) rebuilds the timeline.
+        """
+        events = list(events)
+        earliest: Dict[Tuple[int, int], int] = {}
+        for time, cell, player in events:
+            key = (cell, player)
+            earliest[key] = min(time, earliest.get(key, time))
+
+        if any(earliest.get(key, time + 1) > time for key, time in self._earliest.items()):
+            self.reset()
+        self.add_events(events)
+
+    def add_events(self, events: Iterable[SolveEvent]):
+        rewind_to = len(self.events)
+        for time, cell, player in events:
+            key = (cell, player)
+            known = self._earliest.get(key)
+            if known is not None and known <= time:
+                continue
+            if known is not None:
+                index = bisect_left(self.events, (known, cell, player))
+                del self.events[index]
+                rewind_to = min(rewind_to, index)
+
+            self._earliest[key] = time
+            index = bisect_left(self.events, (time, cell, player))
+            self.events.insert(index, (time, cell, player))
+            rewind_to = min(rewind_to, index)
+
+        if rewind_to < self.processed:
+            self._rewind(rewind_to)
+        self._process()
+
+    def reset(self):
+        self.state = self._initial.copy()
+        self.timed_out = False
+        self.events = []
+        self.claims = []
+        self.processed = 0
+        self._earliest = {}
+        self._snapshots = []
+
+    def _rewind(self, index: int):
+        state, claim_count, timed_out = self._snapshots[index]
+        self.state = state
+        self.timed_out = timed_out
+        del self.claims[claim_count:]
+        del self._snapshots[index:]
+        self.processed = index
+
+    def _process(self):
+        while self.processed < len(self.events) and not self.is_over():
+            event = self.events[self.processed]
+            time, cell, player = event
+            self._snapshots.append((self.state.copy(), len(self.claims), self.timed_out))
+            self.processed += 1
+
+            if self.state.is_claimed(cell):
+                continue
+            if time > self.deadline:
+                self.timed_out = True
+                continue
+            self.state.apply(cell, player)
+            self.claims.append(event)
@@ -0,0 +1,138 @@
+"""
+game_state.py
+Board rules of the duel modes on bitboards, updated one move at a time.
+
+Each player's cells are an int bitmask (bit i = cell i). Winning lines are
+precomputed cell masks, and every cell knows the lines through it as a mask
+over line indices, so a move touches a handful of ints.
+"""
+
+from typing import Dict, List, Optional, Tuple
+
+from orz_modules.duel import DuelStatus
+
+# enum member lookups are slow next to the bit operations
+ONGOING = DuelStatus.ONGOING.value
+FINISHED = DuelStatus.FINISHED.value
+DRAW = DuelStatus.DRAW.value
+
+
+class LineSet:
+    """
+    Precomputed masks of a set of winning lines over `cell_count` cells.
+    """
+
+    _cache: Dict[Tuple[int, Tuple[Tuple[int, ...], ...]], "LineSet"] = {}
+
+    @classmethod
+    def get(cls, cell_count: int, lines: List[List[int]]) -> "LineSet":
+        key = (cell_count, tuple(tuple(line) for line in lines))
+        if key not in cls._cache:
+            cls._cache[key] = cls(cell_count, lines)
+        return cls._cache[key]
+
+    def __init__(self, cell_count: int, lines: List[List[int]]):
+        self.cell_count = cell_count
+        self.lines = lines
+        self.masks: List[int] = [sum(1 << cell for cell in line) for line in lines]
+        self.all_lines: int = (1 << len(lines)) - 1
+
+        # mask of the line indices passing through each cell
+        self.cell_lines: List[int] = [0] * cell_count
+        for i, line in enumerate(lines):
+            for cell in line:
+                self.cell_lines[cell] |= 1 << i
+
+
+class GameState:
+    def __init__(self, player1: int, player2: int, cell_count: int):
+        self.players = (player1, player2)
+        self.cell_count = cell_count
+        self.cells = [0, 0]  # bitmask of the cells owned by each player
+
+        self.status: str = ONGOING
+        self.winner: Optional[int] = None
+        self.winning_line: Optional[int] = None
+
+    def copy(self) -> "GameState":
+        # the timeline snapshots a state before every event, skip copy.copy's dispatch
+        state = object.__new__(self.__class__)
+        state.__dict__.update(self.__dict__)
+        state.cells = list(self.cells)
+        return state
+
+    def is_claimed(self, cell: int) -> bool:
+        return bool((self.cells[0] | self.cells[1]) >> cell & 1)
+
+    def owner(self, cell: int) -> int:
+        if self.cells[0] >> cell & 1:
+            return self.players[0]
+        if self.cells[1] >> cell & 1:
+            return self.players[1]
+        return 0
+
+    def apply(self, cell: int, player: int):
+        """
+        Claims the cell for the player and updates the status.
+        """
+        raise NotImplementedError
+
+    def _slot(self, player: int) -> int:
+        return 0 if player == self.players[0] else 1
+
+
+class LineGameState(GameState):
+    """
+    First player to own every cell of a line wins, a draw once neither player
+    can complete any line.
+    """
+
+    def __init__(self, player1: int, player2: int, line_set: LineSet):
+        super().__init__(player1, player2, line_set.cell_count)
+        self.line_set = line_set
+        # lines without any cell of the opponent, as masks over line indices
+        self.open_lines = [line_set.all_lines, line_set.all_lines]
+
+    def copy(self) -> "LineGameState":
+        state = super().copy()
+        state.open_lines = list(self.open_lines)
+        return state
+
+    def apply(self, cell: int, player: int):
+        slot = self._slot(player)
+        through = self.line_set.cell_lines[cell]
+        self.cells[slot] |= 1 << cell
+        self.open_lines[1 - slot] &= ~through
+
+        # only lines through the new cell that the opponent hasn't blocked can be complete
+        candidates = through & self.open_lines[slot]
+        while candidates:
+            lowest = candidates & -candidates
+            i = lowest.bit_length() - 1
+            mask = self.line_set.masks[i]
+            if self.cells[slot] & mask == mask:
+                self.status = FINISHED
+                self.winner = player
+                self.winning_line = i
+                return
+            candidates ^= lowest
+
+        if not self.open_lines[0] | self.open_lines[1]:
+            self.status = DRAW
+
+
+class CountGameState(GameState):
+    """
+    First player to own `target` cells wins.
+    """
+
+    def __init__(self, player1: int, player2: int, cell_count: int, target: int):
+        super().__init__(player1, player2, cell_count)
+        self.target = target
+
+    def apply(self, cell: int, player: int):
+        slot = self._slot(player)
+        self.cells[slot] |= 1 << cell
+        if bin(self.cells[slot]).count("1") >= self.target:
+            self.status = FINISHED
+            self.winner = player
@@ -0,0 +1,210 @@
+"""
+matchmaking.py
+Pairs queued players of close rating and starts their duels.
+"""
+
+from asyncio import Task, create_task, gather, sleep
+from bisect import bisect_left
+from itertools import count
+from logging import info, exception
+from time import monotonic
+from typing import Dict, List, Optional, Set, Tuple, TYPE_CHECKING
+
+from config import QUEUE_BASE_GAP, QUEUE_GAP_PER_SECOND, QUEUE_MAX_GAP, QUEUE_MATCH_INTERVAL
+from orz_modules.duel import Duel
+from utils.context_manager import ctx_mgr
+from utils.metrics import Histogram
+
+if TYPE_CHECKING:
+    from orz_modules.duel import QueueView
+
+# players only meet players queued for the same (duel mode, time limit)
+QueueKey = Tuple[Duel, int]
+
+# upper bounds of the queue time buckets in seconds, and of the rating gap buckets
+WAIT_BUCKETS_S = [5, 10, 20, 30, 60, 90, 120, 180, 300, 600, 900]
+GAP_BUCKETS = [25, 50, 100, 200, 300, 400, 600, 800]
+
+
+class QueueTicket:
+    def __init__(
+        self, user_id: int, rating: int, problem_rating: int, duel_mode: Duel, time_limit: int, view: "QueueView"
+    ):
+        self.user_id = user_id
+        self.rating = rating
+        self.problem_rating = problem_rating
+        self.duel_mode = duel_mode
+        self.time_limit = time_limit
+        self.view = view
+
+        self.joined = monotonic()
+        self.seq = 0
+
+    @property
+    def key(self) -> QueueKey:
+        return self.duel_mode, self.time_limit
+
+    def gap_allowed(self, now: float) -> float:
+        """The rating gap the player accepts, widening the longer they wait."""
+        return min(QUEUE_MAX_GAP, QUEUE_BASE_GAP + QUEUE_GAP_PER_SECOND * (now - self.joined))
+
+
+class Matchmaker:
+    """
+    Keeps each queue sorted by rating, so the closest rated player to a newcomer
+    is one of its two neighbours, found by bisection. Two players are paired once
+    their rating gap is within what the longer waiting of them accepts, which
+    widens with the wait. A pass every QUEUE_MATCH_INTERVAL seconds pairs the
+    neighbours whose windows have since widened enough, closest first.
+    """
+
+    _instance = None
+
+    @classmethod
+    def setup_matchmaker(cls):
+        cls._instance = cls()
+        cls._instance.start()
+        info("Matchmaker has been setup.")
+
+    @classmethod
+    def get_instance(cls):
+        assert cls._instance is not None, "Matchmaker has not been setup."
+        return cls._instance
+
+    def __init__(self):
+        self._queues: Dict[QueueKey, List[Tuple[int, int]]] = {}  # sorted (rating, seq)
+        self._tickets: Dict[int, QueueTicket] = {}  # user_id: ticket
+        self._by_seq: Dict[int, QueueTicket] = {}
+        self._seq = count()
+        self._task: Optional["Task[None]"] = None
+
+        self.matched = 0
+        self.max_queued = 0
+        self.wait_time = Histogram(WAIT_BUCKETS_S)
+        self.rating_gap = Histogram(GAP_BUCKETS)
+
+    def start(self):
+        self._task = create_task(self._run())
+
+    def is_queued(self, user_id: int) -> bool:
+        return user_id in self._tickets
+
+    def queued(self, key: Optional[QueueKey] = None) -> int:
+        if key is None:
+            return len(self._tickets)
+        return len(self._queues.get(key, []))
+
+    def queue_sizes(self) -> Dict[QueueKey, int]:
+        return {key: len(queue) for key, queue in self._queues.items() if queue}
+
+    def join(self, ticket: QueueTicket):
+        """
+        Queues the player, replacing an earlier ticket of theirs, unless the
+        closest rated player already queued accepts them right away.
+        """
+        self.leave(ticket.user_id)
+        ticket.seq = next(self._seq)
+        queue = self._queues.setdefault(ticket.key, [])
+
+        now = monotonic()
+        i = bisect_left(queue, (ticket.rating, ticket.seq))
+        best: Optional[QueueTicket] = None
+        for j in [i - 1, i]:
+            if 0 <= j < len(queue):
+                other = self._by_seq[queue[j][1]]
+                if self._acceptable(ticket, other, now) and (
+                    best is None or abs(other.rating - ticket.rating) < abs(best.rating - ticket.rating)
+                ):
+                    best = other
+        if best is not None:
+            self._remove(best)
+            self._start(best, ticket, now)
+            return
+
+        queue.insert(i, (ticket.rating, ticket.seq))
+        self._tickets[ticket.user_id] = ticket
+        self._by_seq[ticket.seq] = ticket
+        self.max_queued = max(self.max_queued, len(self._tickets))
+
+    def leave(self, user_id: int) -> bool:
+        ticket = self._tickets.get(user_id)
+        if ticket is None:
+            return False
+        self._remove(ticket)
+        return True
+
+    def _remove(self, ticket: QueueTicket):
+        queue = self._queues[ticket.key]
+        del queue[bisect_left(queue, (ticket.rating, ticket.seq))]
+        del self._tickets[ticket.user_id]
+        del self._by_seq[ticket.seq]
+
+    @staticmethod
+    def _acceptable(ticket: QueueTicket, other: QueueTicket, now: float) -> bool:
+        gap = abs(ticket.rating - other.rating)
+        return gap <= max(ticket.gap_allowed(now), other.gap_allowed(now))
+
+    def match_pass(self):
+        """
+        Pairs the neighbours of every queue within each other's window, the
+        closest pairs first and every player at most once.
+        """
+        now = monotonic()
+        for queue in self._queues.values():
+            tickets = [self._by_seq[seq] for _, seq in queue]
+            candidates = [
+                (tickets[i + 1].rating - tickets[i].rating, i)
+                for i in range(len(tickets) - 1)
+                if self._acceptable(tickets[i], tickets[i + 1], now)
+            ]
+            paired: Set[int] = set()
+            for _, i in sorted(candidates):
+                if i in paired or i + 1 in paired:
+                    continue
+                paired.update([i, i + 1])
+                self._remove(tickets[i])
+                self._remove(tickets[i + 1])
+                self._start(tickets[i], tickets[i + 1], now)
+
+    async def _run(self):
+        while True:
+            await sleep(QUEUE_MATCH_INTERVAL)
+            try:
+                self.match_pass()
+            except Exception:
+                exception("Matchmaking pass failed.")
+
+    def _start(self, ticket1: QueueTicket, ticket2: QueueTicket, now: float):
+        for ticket in [ticket1, ticket2]:
+            self.wait_time.observe(now - ticket.joined)
+        self.rating_gap.observe(abs(ticket1.rating - ticket2.rating))
+        self.matched += 1
+        create_task(self._start_duel(ticket1, ticket2))
+
+    async def _start_duel(self, ticket1: QueueTicket, ticket2: QueueTicket):
+        """
+        Closes both queue messages and sends the duel as a reply to the one of
+        the player who queued last.
+        """
+        from orz_modules.duel import _orz_duel_b3, _orz_duel_tictac
+
+        first, last = sorted([ticket1, ticket2], key=lambda ticket: ticket.joined)
+        # the middle of both players' problem ratings, on the 100 point grid problems are rated on
+        rating = int(round((first.problem_rating + last.problem_rating) / 200) * 100)
+        try:
+            await gather(first.view.on_matched(), last.view.on_matched())
+
+            ctx_mgr().set_init_interaction(last.view._init_interaction)
+            assert last.view._active_msg is not None
+            ctx_mgr().set_active_msg(last.view._active_msg)
+            ctx_mgr().set_send_new_msg(True)
+            if first.duel_mode == Duel.B3:
+                await _orz_duel_b3(first.user_id, last.user_id, rating, first.time_limit)
+            else:
+                await _orz_duel_tictac(first.user_id, last.user_id, rating, first.time_limit)
+        except Exception:
+            exception(f"Failed to start the queued duel of {first.user_id} ~ {last.user_id}")
+
+
+def matchmaker() -> Matchmaker:
+    return Matchmaker.get_instance()
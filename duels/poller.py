@@ -0,0 +1,302 @@
+"""
+poller.py
+Polls the Codeforces submissions of every ongoing duel from a single task.
+"""
+
+from asyncio import (
+    Event,
+    Future,
+    Task,
+    create_task,
+    get_running_loop,
+    to_thread,
+    wait_for,
+    TimeoutError as AsyncTimeoutError,
+)
+from functools import partial
+from heapq import heappop, heappush
+from logging import info, exception
+from time import monotonic
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple, Union, TYPE_CHECKING
+
+from codeforces.rate_limiter import cf_rate_limiter
+from config import CF_POLL_MIN_INTERVAL, CF_POLL_MAX_INTERVAL
+from orz_modules.duel import DuelStatus
+from utils.deadlines import deadline_scheduler
+from utils.general import get_time
+
+if TYPE_CHECKING:
+    from codeforces.models import CFSubmission
+    from duels.tictac_duel import TicTacDuel
+    from duels.b3_duel import B3Duel
+
+    AnyDuel = Union[TicTacDuel, B3Duel]
+
+DuelUpdateCallback = Callable[[], Awaitable[None]]
+DuelEndListener = Callable[["AnyDuel"], Awaitable[None]]
+
+# submissions fetched on the first poll of a handle, and on the later ones
+INITIAL_FETCH_COUNT = 100
+FETCH_COUNT = 20
+
+# seconds after its deadline a duel is closed, for the last submissions to show up,
+# and how long the final poll may take before the duel is closed without it
+DEADLINE_GRACE = 5
+DEADLINE_POLL_TIMEOUT = 30
+
+
+class HandleState:
+    def __init__(self, handle: str):
+        self.handle = handle
+        self.duel_ids: Set[str] = set()
+        self.interval = CF_POLL_MIN_INTERVAL
+        self.next_poll = monotonic()
+        self.polled = False
+        self.submissions: Dict[int, "CFSubmission"] = {}
+        self.fingerprint: Optional[int] = None
+        self.waiters: List["Future[None]"] = []
+
+
+class TrackedDuel:
+    def __init__(self, duel: "AnyDuel", callback: DuelUpdateCallback):
+        self.duel = duel
+        self.callback = callback
+
+        assert duel.player1_loaded is not None and duel.player1_loaded.cf_handle is not None
+        assert duel.player2_loaded is not None and duel.player2_loaded.cf_handle is not None
+        self.handles = (duel.player1_loaded.cf_handle, duel.player2_loaded.cf_handle)
+
+
+class DuelPoller:
+    """
+    Tracks every ongoing duel, polls each distinct handle once no matter how many
+    duels it is in, and makes its calls within the API budget shared through
+    cf_rate_limiter, ahead of any background fetches.
+    A handle is polled every CF_POLL_MIN_INTERVAL seconds after a change, backing
+    off towards CF_POLL_MAX_INTERVAL while nothing happens.
+    Every duel is closed at its deadline through the deadline scheduler, after
+    one last poll of its handles.
+    Duels are only pushed to their views when their progress actually changed,
+    and every end listener hears of a duel once it is no longer ongoing.
+    """
+
+    _instance = None
+
+    @classmethod
+    def setup_duel_poller(cls):
+        cls._instance = cls()
+        cls._instance.start()
+        info("DuelPoller has been setup.")
+
+    @classmethod
+    def get_instance(cls):
+        assert cls._instance is not None, "DuelPoller has not been setup."
+        return cls._instance
+
+    def __init__(self):
+        self._duels: Dict[str, TrackedDuel] = {}
+        self._handles: Dict[str, HandleState] = {}
+        self._queue: List[Tuple[float, str]] = []  # (next_poll, handle), stale entries are skipped
+        self._wakeup = Event()
+        self._task: Optional["Task[None]"] = None
+        self._end_listeners: List[DuelEndListener] = []
+
+    def start(self):
+        self._task = create_task(self._run())
+
+    def track(self, duel: "AnyDuel", callback: DuelUpdateCallback):
+        tracked = TrackedDuel(duel, callback)
+        self._duels[duel.duel_id] = tracked
+        for handle in tracked.handles:
+            state = self._handles.get(handle)
+            if state is None:
+                state = self._handles[handle] = HandleState(handle)
+                self._schedule(state, monotonic())
+            state.duel_ids.add(duel.duel_id)
+        deadline_scheduler().schedule(
+            ("duel", duel.duel_id), duel.deadline + DEADLINE_GRACE, partial(self._close_duel, duel.duel_id)
+        )
+
+    def add_end_listener(self, listener: DuelEndListener):
+        self._end_listeners.append(listener)
+
+    def untrack(self, duel: "AnyDuel"):
+        tracked = self._duels.pop(duel.duel_id, None)
+        if tracked is None:
+            return
+        deadline_scheduler().cancel(("duel", duel.duel_id))
+        for handle in tracked.handles:
+            state = self._handles[handle]
+            state.duel_ids.discard(duel.duel_id)
+            if not state.duel_ids:
+                del self._handles[handle]
+                for waiter in state.waiters:
+                    if not waiter.done():
+                        waiter.set_result(None)
+
+    async def poll_now(self, duel: "AnyDuel", timeout: float = 60) -> bool:
+        """
+        Moves the duel's handles to the front of the queue and waits for both to
+        be polled. Returns whether the duel changed.
+        """
+        tracked = self._duels.get(duel.duel_id)
+        if tracked is None:
+            return False
+
+        progress = (duel.status, list(duel.progress))
+        loop = get_running_loop()
+        waiters: List["Future[None]"] = []
+        for handle in tracked.handles:
+            state = self._handles[handle]
+            state.interval = CF_POLL_MIN_INTERVAL
+            waiter: "Future[None]" = loop.create_future()
+            state.waiters.append(waiter)
+            waiters.append(waiter)
+            self._schedule(state, monotonic())
+
+        for waiter in waiters:
+            try:
+                await wait_for(waiter, timeout)
+            except AsyncTimeoutError:
+                break
+        return (duel.status, duel.progress) != progress
+
+    def _schedule(self, state: HandleState, when: float):
+        if state.polled and when >= state.next_poll and state.next_poll > monotonic():
+            return
+        state.next_poll = when
+        heappush(self._queue, (when, state.handle))
+        self._wakeup.set()
+
+    async def _next_due_handle(self) -> HandleState:
+        while True:
+            while self._queue:
+                when, handle = self._queue[0]
+                state = self._handles.get(handle)
+                if state is None or state.next_poll != when:
+                    heappop(self._queue)
+                    continue
+                delay = when - monotonic()
+                if delay <= 0:
+                    heappop(self._queue)
+                    return state
+                break
+
+            self._wakeup.clear()
+            timeout = self._queue[0][0] - monotonic() if self._queue else None
+            try:
+                await wait_for(self._wakeup.wait(), timeout)
+            except AsyncTimeoutError:
+                pass
+
+    async def _run(self):
+        while True:
+            state = await self._next_due_handle()
+            try:
+                await self._poll_handle(state)
+            except Exception:
+                exception(f"Failed to poll handle: {state.handle}")
+                state.interval = min(state.interval * 2, CF_POLL_MAX_INTERVAL)
+                if state.handle in self._handles:
+                    self._schedule(state, monotonic() + state.interval)
+
+    async def _fetch_submissions(self, state: HandleState) -> List["CFSubmission"]:
+        from codeforces.api import get_user_submissions
+
+        count = FETCH_COUNT if state.polled else INITIAL_FETCH_COUNT
+        await cf_rate_limiter().acquire()
+        submissions = await to_thread(get_user_submissions, state.handle, count)
+
+        # more than FETCH_COUNT submissions since the last poll, fetch the gap as well
+        if state.submissions and len(submissions) == count and min(sub.id for sub in submissions) > max(state.submissions):
+            await cf_rate_limiter().acquire()
+            submissions = await to_thread(get_user_submissions, state.handle, INITIAL_FETCH_COUNT)
+        return submissions
+
+    async def _poll_handle(self, state: HandleState):
+        submissions = await self._fetch_submissions(state)
+        for submission in submissions:
+            state.submissions[submission.id] = submission
+        state.polled = True
+
+        # duels untracked while the submissions were fetched are skipped
+        duels = [self._duels[duel_id].duel for duel_id in state.duel_ids if duel_id in self._duels]
+        problems = {problem for duel in duels for problem in duel.problems_loaded}
+        start_time = min((duel.start_time for duel in duels), default=get_time())
+        state.submissions = {
+            sub_id: sub for sub_id, sub in state.submissions.items() if sub.creationTimeSeconds >= start_time
+        }
+        fingerprint = hash(
+            tuple(
+                (sub.id, sub.verdict)
+                for sub in sorted(state.submissions.values(), key=lambda x: x.id)
+                if sub.problem in problems
+            )
+        )
+
+        changed = fingerprint != state.fingerprint
+        state.fingerprint = fingerprint
+        state.interval = CF_POLL_MIN_INTERVAL if changed else min(state.interval * 1.5, CF_POLL_MAX_INTERVAL)
+
+        # duels past their deadline need one last update even without new submissions
+        now = get_time()
+        for duel_id in list(state.duel_ids):
+            # the updates before may have closed it, or another handle's poll
+            tracked = self._duels.get(duel_id)
+            if tracked is None:
+                continue
+            if changed or now > tracked.duel.end_time:
+                await self._update_duel(tracked)
+
+        waiters, state.waiters = state.waiters, []
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+        if state.handle in self._handles:
+            self._schedule(state, monotonic() + state.interval)
+
+    async def _update_duel(self, tracked: TrackedDuel):
+        from codeforces.cf import group_problems_status
+
+        duel = tracked.duel
+        handle1, handle2 = tracked.handles
+        state1, state2 = self._handles.get(handle1), self._handles.get(handle2)
+        if state1 is None or state2 is None or not state1.polled or not state2.polled:
+            return
+
+        player1_progress = group_problems_status(
+            list(state1.submissions.values()), duel.problems_loaded, duel.start_time
+        )
+        player2_progress = group_problems_status(
+            list(state2.submissions.values()), duel.problems_loaded, duel.start_time
+        )
+        changed = await duel.update_progress(player1_progress, player2_progress)
+        self._settle(tracked, changed)
+
+    def _settle(self, tracked: TrackedDuel, changed: bool):
+        duel = tracked.duel
+        # untracked while it was saved, whoever untracked it already settled it
+        if duel.status != DuelStatus.ONGOING.value and self._duels.get(duel.duel_id) is tracked:
+            self.untrack(duel)
+            for listener in self._end_listeners:
+                create_task(listener(duel))
+        if changed:
+            create_task(tracked.callback())
+
+    async def _close_duel(self, duel_id: str):
+        """
+        Fired at the duel's deadline. The final poll closes the duel as timed out
+        if it is still ongoing, and if that poll fails or doesn't come back in
+        time the duel is closed with the solves known so far.
+        """
+        tracked = self._duels.get(duel_id)
+        if tracked is None:
+            return
+        await self.poll_now(tracked.duel, DEADLINE_POLL_TIMEOUT)
+        if duel_id in self._duels:
+            self._settle(tracked, await tracked.duel.expire())
+
+
+def duel_poller() -> DuelPoller:
+    return DuelPoller.get_instance()
@@ -0,0 +1,114 @@
+"""
+recovery.py
+Brings the ongoing duels back after a restart.
+"""
+
+from functools import partial
+from logging import info, exception, warning
+from typing import Any, Dict, List, Tuple, Type, Union, TYPE_CHECKING
+
+from database import cf_queries, duel_queries
+from duels.poller import duel_poller
+from duels.spectators import duel_hub
+from utils.discord.disc_utils import disc_utils
+
+if TYPE_CHECKING:
+    from codeforces.models import CFProblem
+    from duels.tictac_duel import TicTacDuel, GridDuel
+    from duels.b3_duel import B3Duel
+
+    AnyDuel = Union[TicTacDuel, GridDuel, B3Duel]
+
+PAGE_SIZE = 50
+
+
+async def rehydrate_duels() -> int:
+    """
+    Pages through the ongoing duels of every duel table, rebuilds each duel with
+    its problems and players, and reattaches its view to the message it was
+    shown on. The poller picks every duel up right away, so duels whose time ran
+    out while the bot was down are closed on its first pass.
+    Returns the number of duels restored.
+    """
+    restored = 0
+    for table in ["duels_tictac", "duels_grid"]:
+        after: Tuple[int, str] = (-1, "")
+        while True:
+            rows = await duel_queries.get_ongoing_duels(table, after, PAGE_SIZE)
+            if not rows:
+                break
+            after = (rows[-1]["start_time"], rows[-1]["duel_id"])
+
+            problems = await _load_problems(rows)
+            for row in rows:
+                try:
+                    restored += await _restore_duel(table, row, problems)
+                except Exception:
+                    exception(f"Failed to restore duel: {row['duel_id']}")
+
+    info(f"Restored {restored} ongoing duels.")
+    return restored
+
+
+async def _load_problems(rows: List[Dict[str, Any]]) -> Dict[str, "CFProblem"]:
+    """
+    The problems of a page of duels from the catalog in a single query, keyed
+    the way they are stored on the duels.
+    """
+    from codeforces.models import CFProblem
+
+    keys = {tuple(problem.split("~")) for row in rows for problem in row["problems"]}
+    result = await cf_queries.get_problems_by_keys([(int(contest_id), index) for contest_id, index in keys])
+
+    problems: Dict[str, CFProblem] = {}
+    for data in result:
+        problem = CFProblem.only_problem(data)
+        problems.setdefault(f"{problem.contestId}~{problem.index}", problem)
+    return problems
+
+
+async def _restore_duel(table: str, row: Dict[str, Any], problems: Dict[str, "CFProblem"]) -> int:
+    """
+    Duels whose mode is unknown or whose problems are missing from the catalog
+    can't be rebuilt and are closed at their end_time instead. Duels that never
+    got a message are polled to their end without a view.
+    """
+    from orz_modules.duel import Duel
+    from duels.tictac_duel import TicTacDuel, GridDuel, TickTacDuelView
+    from duels.b3_duel import B3Duel, B3DuelView
+
+    modes: Dict[Duel, Tuple[Type["AnyDuel"], Any]] = {
+        Duel.TICTAC: (TicTacDuel, TickTacDuelView),
+        Duel.GRID: (GridDuel, TickTacDuelView),
+        Duel.B3: (B3Duel, B3DuelView),
+    }
+    mode = Duel.__members__.get(row["mode"] or "")
+    if mode not in modes:
+        warning(f"Duel {row['duel_id']} has an unknown mode {row['mode']}, closing it.")
+        await duel_queries.expire_duel(table, row["duel_id"], row["start_time"])
+        return 0
+
+    missing = [problem for problem in row["problems"] if problem not in problems]
+    if missing:
+        warning(f"Duel {row['duel_id']} has problems missing from the catalog, closing it: {missing}")
+        await duel_queries.expire_duel(table, row["duel_id"], row["start_time"])
+        return 0
+
+    duel_cls, view_cls = modes[mode]
+    duel_data = dict(row)
+    duel_data["problems_loaded"] = [problems[problem] for problem in row["problems"]]
+    duel: "AnyDuel" = duel_cls(duel_data)
+    await duel.load_players()
+
+    if row["channel_id"] is None or row["message_id"] is None:
+        warning(f"Duel {row['duel_id']} has no message to reattach to, polling it without one.")
+        duel_poller().track(duel, partial(_publish, duel))
+        return 1
+
+    message = await disc_utils().get_partial_message(row["channel_id"], row["message_id"])
+    view_cls.restore_view(duel, message)
+    return 1
+
+
+async def _publish(duel: "AnyDuel"):
+    duel_hub().publish(duel)
@@ -0,0 +1,269 @@
+"""
+spectators.py
+Live duel boards and scoreboards on any number of messages, from one shared state.
+"""
+
+from asyncio import Task, create_task, sleep
+from collections import deque
+from logging import info, exception, warning
+from typing import Deque, Dict, Hashable, List, Optional, Tuple, Union, TYPE_CHECKING
+
+from discord import Forbidden, HTTPException, Message, NotFound
+
+from config import SPECTATOR_EDIT_INTERVAL, SPECTATOR_MAX_SUBSCRIPTIONS
+from orz_modules.duel import Duel, DuelStatus
+from utils.discord import BaseEmbed, Messenger
+from utils.general import get_time
+
+if TYPE_CHECKING:
+    from duels.tictac_duel import TicTacDuel
+    from duels.b3_duel import B3Duel
+
+    AnyDuel = Union[TicTacDuel, B3Duel]
+
+# ("duel", duel_id), ("tournament", tournament_id) or ("all",)
+Topic = Tuple[Hashable, ...]
+ALL_DUELS: Topic = ("all",)
+
+# duels listed on a scoreboard, a description holds 4096 characters
+SCOREBOARD_ONGOING = 30
+SCOREBOARD_FINISHED = 5
+
+
+def duel_topics(duel: "AnyDuel") -> List[Topic]:
+    topics: List[Topic] = [("duel", duel.duel_id), ALL_DUELS]
+    if duel.tournament_id is not None:
+        topics.append(("tournament", duel.tournament_id))
+    return topics
+
+
+def duel_mode_name(duel: "AnyDuel") -> str:
+    board = getattr(duel, "board", None)
+    return board.name if board is not None else Duel.B3.value
+
+
+def duel_score(duel: "AnyDuel") -> Tuple[int, int]:
+    """Problems claimed by player 1 and by player 2."""
+    owners = [int(progress.split("~")[0]) for progress in duel.progress if progress != "~"]
+    return owners.count(duel.player1), owners.count(duel.player2)
+
+
+def duel_line(duel: "AnyDuel") -> str:
+    score1, score2 = duel_score(duel)
+    line = f"<@{duel.player1}> **{score1} : {score2}** <@{duel.player2}> · {duel_mode_name(duel)}"
+    if duel.status == DuelStatus.ONGOING.value:
+        return f"{line} · ends <t:{duel.deadline}:R>"
+    if duel.status == DuelStatus.FINISHED.value:
+        return f"{line} · 👑 <@{duel.winner}>"
+    if duel.status == DuelStatus.DRAW.value:
+        return f"{line} · draw"
+    return f"{line} · time's up"
+
+
+class Subscription:
+    """A message kept showing the duels of a topic."""
+
+    def __init__(self, topic: Topic, message: Message):
+        self.topic = topic
+        self.message = message
+        self.edits = 0
+
+    @property
+    def channel_id(self) -> int:
+        return self.message.channel.id
+
+
+class DuelHub:
+    """
+    Duels publish every change of theirs here once their own message shows it,
+    and every message subscribed to one of the duel's topics is marked to be
+    edited. Pending edits are coalesced: however many changes come in, a
+    message is edited once with the latest state when its channel's turn
+    comes, and each channel gets an edit at most every SPECTATOR_EDIT_INTERVAL
+    seconds, so subscribers stay well under Discord's per channel rate limit.
+    The board image is the one already uploaded on the duel's own message, and
+    each topic's embed is built once per change for all of its subscribers.
+    """
+
+    _instance = None
+
+    @classmethod
+    def setup_duel_hub(cls):
+        cls._instance = cls()
+        info("DuelHub has been setup.")
+
+    @classmethod
+    def get_instance(cls):
+        assert cls._instance is not None, "DuelHub has not been setup."
+        return cls._instance
+
+    def __init__(self):
+        self._duels: Dict[str, "AnyDuel"] = {}  # ongoing duels published so far
+        self._finished: Deque["AnyDuel"] = deque(maxlen=50)
+        self._board_urls: Dict[str, str] = {}
+
+        self._subscriptions: Dict[Topic, List[Subscription]] = {}
+        self._versions: Dict[Topic, int] = {}
+        self._embeds: Dict[Topic, Tuple[int, BaseEmbed]] = {}
+
+        # channel_id: subscriptions waiting for an edit, in the order they were marked
+        self._pending: Dict[int, Dict[Subscription, None]] = {}
+        self._flushers: Dict[int, "Task[None]"] = {}
+
+        self.published = 0
+        self.edits = 0
+        self.coalesced = 0
+
+    def subscription_count(self) -> int:
+        return sum(len(subscriptions) for subscriptions in self._subscriptions.values())
+
+    def find_duel(self, player: int) -> Optional["AnyDuel"]:
+        """The ongoing duel of a player, the latest one if they are in several."""
+        duels = [duel for duel in self._duels.values() if player in [duel.player1, duel.player2]]
+        return max(duels, key=lambda duel: duel.start_time, default=None)
+
+    def publish(self, duel: "AnyDuel", board_url: Optional[str] = None):
+        self.published += 1
+        if duel.status == DuelStatus.ONGOING.value:
+            self._duels[duel.duel_id] = duel
+        elif self._duels.pop(duel.duel_id, None) is not None:
+            if len(self._finished) == self._finished.maxlen:
+                evicted = self._finished.pop()
+                self._board_urls.pop(evicted.duel_id, None)
+            self._finished.appendleft(duel)
+
+        # only the duels still shown anywhere keep their board
+        if board_url is not None and self._is_shown(duel.duel_id):
+            self._board_urls[duel.duel_id] = board_url
+
+        for topic in duel_topics(duel):
+            self._versions[topic] = self._versions.get(topic, 0) + 1
+            for subscription in self._subscriptions.get(topic, []):
+                self._mark(subscription)
+
+    def _is_shown(self, duel_id: str) -> bool:
+        return duel_id in self._duels or any(duel.duel_id == duel_id for duel in self._finished)
+
+    def is_full(self) -> bool:
+        return self.subscription_count() >= SPECTATOR_MAX_SUBSCRIPTIONS
+
+    async def spectate(self, topic: Topic) -> Subscription:
+        """
+        Sends a message showing the topic in the current context, kept up to date from then on.
+        :raises ValueError: If SPECTATOR_MAX_SUBSCRIPTIONS messages are already subscribed
+        """
+        if self.is_full():
+            raise ValueError("Too many spectator messages.")
+        message = await Messenger.send_message_new(embed=self.get_embed(topic))
+        return self.subscribe(topic, message)
+
+    def subscribe(self, topic: Topic, message: Message) -> Subscription:
+        subscription = Subscription(topic, message)
+        self._subscriptions.setdefault(topic, []).append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        subscriptions = self._subscriptions.get(subscription.topic, [])
+        if subscription in subscriptions:
+            subscriptions.remove(subscription)
+        if not subscriptions:
+            self._subscriptions.pop(subscription.topic, None)
+            self._versions.pop(subscription.topic, None)
+            self._embeds.pop(subscription.topic, None)
+        self._pending.get(subscription.channel_id, {}).pop(subscription, None)
+
+    def _mark(self, subscription: Subscription):
+        pending = self._pending.setdefault(subscription.channel_id, {})
+        if subscription in pending:
+            self.coalesced += 1
+            return
+        pending[subscription] = None
+        if subscription.channel_id not in self._flushers:
+            self._flushers[subscription.channel_id] = create_task(self._flush(subscription.channel_id))
+
+    async def _flush(self, channel_id: int):
+        pending = self._pending[channel_id]
+        try:
+            while pending:
+                subscription = next(iter(pending))
+                del pending[subscription]
+                await self._edit(subscription)
+                await sleep(SPECTATOR_EDIT_INTERVAL)
+        finally:
+            del self._pending[channel_id]
+            del self._flushers[channel_id]
+
+    async def _edit(self, subscription: Subscription):
+        embed = self.get_embed(subscription.topic)
+        try:
+            subscription.message = await Messenger.edit_message(subscription.message, embed=embed)
+        except (NotFound, Forbidden):
+            warning(f"Spectator message gone, unsubscribing: {subscription.message.id}")
+            self.unsubscribe(subscription)
+            return
+        except HTTPException:
+            exception(f"Failed to edit spectator message: {subscription.message.id}")
+            return
+        subscription.edits += 1
+        self.edits += 1
+
+        # a single duel's message is left showing how it ended
+        if subscription.topic[0] == "duel" and subscription.topic[1] not in self._duels:
+            self.unsubscribe(subscription)
+
+    def get_embed(self, topic: Topic) -> BaseEmbed:
+        version = self._versions.get(topic, 0)
+        cached = self._embeds.get(topic)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+
+        embed = self._duel_embed(topic[1]) if topic[0] == "duel" else self._scoreboard_embed(topic)  # type: ignore
+        if topic in self._subscriptions:
+            self._embeds[topic] = (version, embed)
+        return embed
+
+    def _duel_embed(self, duel_id: str) -> BaseEmbed:
+        duel = self._duels.get(duel_id) or next(
+            (duel for duel in self._finished if duel.duel_id == duel_id), None
+        )
+        if duel is None:
+            return BaseEmbed(title="Spectating", description="This duel is over.")
+
+        embed = BaseEmbed(title=f"{duel_mode_name(duel)} Duel · Spectating", description=duel_line(duel))
+        board_url = self._board_urls.get(duel_id)
+        if board_url is not None:
+            embed.set_image_url(board_url)
+        return embed
+
+    def _scoreboard_embed(self, topic: Topic) -> BaseEmbed:
+        def in_topic(duel: "AnyDuel") -> bool:
+            return topic == ALL_DUELS or duel.tournament_id == topic[1]
+
+        ongoing = sorted(
+            (duel for duel in self._duels.values() if in_topic(duel)), key=lambda duel: duel.deadline
+        )
+        finished = [duel for duel in self._finished if in_topic(duel)][:SCOREBOARD_FINISHED]
+
+        title = "Scoreboard" if topic == ALL_DUELS else "Tournament Scoreboard"
+        lines = [duel_line(duel) for duel in ongoing[:SCOREBOARD_ONGOING]]
+        if len(ongoing) > SCOREBOARD_ONGOING:
+            lines.append(f"... and {len(ongoing) - SCOREBOARD_ONGOING} more")
+        embed = BaseEmbed(title=title, description="\n".join(lines) or "No duels right now.")
+        if finished:
+            embed.add_field(name="Just Finished", value="\n".join(duel_line(duel) for duel in finished), inline=False)
+        embed.add_field(name="", value=f"{len(ongoing)} ongoing · updated <t:{get_time()}:R>", inline=False)
+        return embed
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "duels": len(self._duels),
+            "subscriptions": self.subscription_count(),
+            "published": self.published,
+            "edits": self.edits,
+            "coalesced": self.coalesced,
+            "pending": sum(len(pending) for pending in self._pending.values()),
+        }
+
+
+def duel_hub() -> DuelHub:
+    return DuelHub.get_instance()
@@ -0,0 +1,693 @@
+"""
+tournament.py
+Single elimination, double elimination and Swiss tournaments of TicTac and B3 duels.
+"""
+
+from asyncio import Lock, Semaphore, Task, create_task, gather, to_thread
+from collections import Counter
+from enum import Enum
+from logging import info, exception, warning
+from math import ceil, log2
+from typing import Dict, FrozenSet, Hashable, List, Optional, Set, Tuple, Union, TYPE_CHECKING
+
+from discord import File, Interaction
+
+from codeforces.rate_limiter import PRIORITY_BACKGROUND, cf_rate_limiter
+from config import ADMINS, TOURNAMENT_START_CONCURRENCY
+from duels.b3_duel import B3Duel, B3DuelView
+from duels.board import TICTAC_BOARD
+from duels.poller import duel_poller
+from duels.spectators import duel_hub
+from duels.tictac_duel import TicTacDuel, TickTacDuelView
+from orz_modules.duel import Duel, DuelStatus
+from orz_modules.user import User
+from utils.context_manager import ctx_mgr
+from utils.discord import BaseView, BaseEmbed
+from utils.general import generate_string
+
+if TYPE_CHECKING:
+    from codeforces.models import CFProblem
+
+    AnyDuel = Union[TicTacDuel, B3Duel]
+
+# (player, opponent), a bye when there is no opponent
+Pairing = Tuple[int, Optional[int]]
+
+# players listed on the tournament message, the embed field holds 1024 characters
+STANDINGS_SHOWN = 20
+
+
+class TournamentFormat(Enum):
+    SINGLE_ELIMINATION = "Single Elimination"
+    DOUBLE_ELIMINATION = "Double Elimination"
+    SWISS = "Swiss"
+
+
+class TournamentStatus(Enum):
+    REGISTRATION = "registration"
+    RUNNING = "running"
+    FINISHED = "finished"
+    CANCELLED = "cancelled"
+
+
+def pair_elimination(players: List[int]) -> List[Pairing]:
+    """
+    Best seed against worst seed, second best against second worst and so on.
+    The best seed gets the bye when the count is odd.
+    """
+    pairings: List[Pairing] = []
+    if len(players) % 2:
+        pairings.append((players[0], None))
+        players = players[1:]
+    for i in range(len(players) // 2):
+        pairings.append((players[i], players[-1 - i]))
+    return pairings
+
+
+def pair_double_elimination(winners: List[int], losers: List[int]) -> List[Pairing]:
+    """
+    Players without a loss are paired among themselves and players with one loss
+    among themselves. When both groups are odd the worst seed without a loss meets
+    the best seed with one, which is also how the grand final and its rematch
+    come about.
+    """
+    cross: List[Pairing] = []
+    if len(winners) % 2 and len(losers) % 2:
+        cross.append((winners[-1], losers[0]))
+        winners, losers = winners[:-1], losers[1:]
+    return pair_elimination(winners) + pair_elimination(losers) + cross
+
+
+def pair_swiss(standings: List[int], met: Set[FrozenSet[int]], had_bye: Set[int]) -> List[Pairing]:
+    """
+    Each player in standings order meets the next best player they haven't met
+    yet, or the next best one left if they have met them all. The lowest ranked
+    player without a bye sits out when the count is odd.
+    """
+    players = list(standings)
+    pairings: List[Pairing] = []
+    if len(players) % 2:
+        bye = next((player for player in reversed(players) if player not in had_bye), players[-1])
+        players.remove(bye)
+        pairings.append((bye, None))
+
+    while players:
+        player = players.pop(0)
+        opponent = next(
+            (other for other in players if frozenset((player, other)) not in met), players[0]
+        )
+        players.remove(opponent)
+        pairings.append((player, opponent))
+    return pairings
+
+
+class Match:
+    def __init__(self, round_index: int, player1: int, player2: Optional[int]):
+        self.round_index = round_index
+        self.player1 = player1
+        self.player2 = player2
+        self.duel: Optional["AnyDuel"] = None
+
+        self.done = False
+        self.winner: Optional[int] = None  # None once done is a draw
+
+    @property
+    def is_bye(self) -> bool:
+        return self.player2 is None
+
+    @property
+    def loser(self) -> Optional[int]:
+        if not self.done or self.winner is None or self.player2 is None:
+            return None
+        return self.player2 if self.winner == self.player1 else self.player1
+
+
+class Tournament:
+    """
+    Runs a bracket in rounds, every duel of a round at once. A round starts once
+    every duel of the previous one has ended, its pairings following from the
+    results so far.
+    Every player's solved problems are fetched once, in the background while
+    registration is open, and each round's problems come from a single read of
+    the catalog. The duels are polled by the DuelPoller like any other, so a
+    round of any size stays within the Codeforces API budget.
+    """
+
+    def __init__(
+        self,
+        tournament_format: TournamentFormat,
+        duel_mode: Duel,
+        host: int,
+        rating: int,
+        time_limit: int,
+        swiss_rounds: Optional[int] = None,
+    ):
+        if duel_mode not in [Duel.TICTAC, Duel.B3]:
+            raise ValueError(f"Invalid duel_mode: {duel_mode}")
+
+        self.tournament_id = generate_string(16)
+        self.format = tournament_format
+        self.duel_mode = duel_mode
+        self.host = host
+        self.rating = rating
+        self.time_limit = time_limit
+        self.swiss_rounds = swiss_rounds
+
+        self.status = TournamentStatus.REGISTRATION
+        self.players: List[int] = []  # in seed order once started
+        self.handles: Dict[int, str] = {}
+        self.rounds: List[List[Match]] = []
+
+        self.wins: Counter[int] = Counter()
+        self.losses: Counter[int] = Counter()
+        self.points: Dict[int, float] = {}
+        self.met: Set[FrozenSet[int]] = set()
+        self.had_bye: Set[int] = set()
+
+        self.view: Optional["TournamentView"] = None
+
+        self._duels: Dict[str, Match] = {}  # duel_id: match
+        self._solved: Dict[str, Set["CFProblem"]] = {}
+        self._solved_tasks: Dict[str, "Task[None]"] = {}
+        self._used: Set["CFProblem"] = set()
+        self._lock = Lock()
+
+    @property
+    def problem_count(self) -> int:
+        return 3 if self.duel_mode == Duel.B3 else TICTAC_BOARD.cell_count
+
+    @property
+    def current_round(self) -> List[Match]:
+        return self.rounds[-1] if self.rounds else []
+
+    def add_player(self, user: User):
+        assert user.cf_handle is not None
+        if user.user_id in self.players:
+            return
+        self.players.append(user.user_id)
+        self.handles[user.user_id] = user.cf_handle
+        if user.cf_handle not in self._solved_tasks:
+            self._solved_tasks[user.cf_handle] = create_task(self._fetch_solved(user.cf_handle))
+
+    def remove_player(self, user_id: int):
+        if user_id not in self.players:
+            return
+        self.players.remove(user_id)
+        handle = self.handles.pop(user_id)
+        if handle in self.handles.values():
+            return
+        # no need for their solved problems anymore, leave the API budget to the others
+        task = self._solved_tasks.pop(handle, None)
+        if task is not None:
+            task.cancel()
+        self._solved.pop(handle, None)
+
+    async def _fetch_solved(self, handle: str):
+        from codeforces.cf import fetch_user_solved_problems
+
+        try:
+            self._solved[handle] = await fetch_user_solved_problems(handle, PRIORITY_BACKGROUND)
+        except Exception:
+            exception(f"Failed to fetch the solved problems of: {handle}")
+            self._solved[handle] = set()
+
+    async def _seed_players(self):
+        """
+        Orders the players by Codeforces rating, from a single batched call.
+        Join order breaks ties and stands in if the call fails.
+        """
+        from codeforces.api import get_users_info
+
+        try:
+            await cf_rate_limiter().acquire(PRIORITY_BACKGROUND)
+            cf_users = await to_thread(get_users_info, [self.handles[player] for player in self.players])
+            ratings = {cf_user.handle.lower(): cf_user.rating for cf_user in cf_users}
+        except Exception:
+            exception(f"Failed to seed tournament: {self.tournament_id}")
+            ratings = {}
+        self.players.sort(key=lambda player: -ratings.get(self.handles[player].lower(), -1))
+
+    async def start(self):
+        self.status = TournamentStatus.RUNNING
+        self.points = {player: 0.0 for player in self.players}
+        if self.format == TournamentFormat.SWISS and self.swiss_rounds is None:
+            self.swiss_rounds = max(1, ceil(log2(len(self.players))))
+        info(f"Starting tournament {self.tournament_id} with {len(self.players)} players.")
+
+        await self._update_view()
+        await self._send_scoreboard()
+        await self._seed_players()
+        await gather(*self._solved_tasks.values())
+        async with self._lock:
+            if self.status == TournamentStatus.RUNNING:
+                await self._start_round()
+
+    async def _send_scoreboard(self):
+        """
+        The tournament hall, a live scoreboard of the tournament's duels replying
+        to the tournament message.
+        """
+        assert self.view is not None and self.view._active_msg is not None
+        ctx_mgr().set_init_interaction(self.view._init_interaction)
+        ctx_mgr().set_active_msg(self.view._active_msg)
+        ctx_mgr().set_send_new_msg(True)
+        try:
+            await duel_hub().spectate(("tournament", self.tournament_id))
+        except Exception:
+            exception(f"Failed to send tournament scoreboard: {self.tournament_id}")
+
+    def cancel(self):
+        self.status = TournamentStatus.CANCELLED
+        for task in self._solved_tasks.values():
+            task.cancel()
+        tournament_manager().remove(self)
+
+    def _next_pairings(self) -> Optional[List[Pairing]]:
+        """
+        Pairings of the next round, None once the tournament is decided.
+        """
+        if self.format == TournamentFormat.SINGLE_ELIMINATION:
+            alive = [player for player in self.players if self.losses[player] == 0]
+            return pair_elimination(alive) if len(alive) > 1 else None
+
+        if self.format == TournamentFormat.DOUBLE_ELIMINATION:
+            alive = [player for player in self.players if self.losses[player] < 2]
+            if len(alive) <= 1:
+                return None
+            winners = [player for player in alive if self.losses[player] == 0]
+            losers = [player for player in alive if self.losses[player] == 1]
+            return pair_double_elimination(winners, losers)
+
+        assert self.swiss_rounds is not None
+        if len(self.rounds) >= self.swiss_rounds:
+            return None
+        return pair_swiss(self.standings(), self.met, self.had_bye)
+
+    async def _start_round(self):
+        """
+        Starts the next round, and the ones after it right away for as long as
+        a round is decided as it starts, every match a bye or without problems.
+        """
+        from codeforces.cf import get_round_problems
+
+        while True:
+            pairings = self._next_pairings()
+            if pairings is None:
+                await self._finish()
+                return
+
+            matches = [Match(len(self.rounds), player1, player2) for player1, player2 in pairings]
+            self.rounds.append(matches)
+            for match in matches:
+                if match.player2 is None:
+                    self.had_bye.add(match.player1)
+                    self._record(match, match.player1)
+                else:
+                    self.met.add(frozenset((match.player1, match.player2)))
+
+            duel_matches = [match for match in matches if not match.done]
+            pairs = [(self.handles[match.player1], self.handles[match.player2]) for match in duel_matches]  # type: ignore
+            round_problems = await get_round_problems(
+                pairs, self._solved, self._used, self.rating - 100, self.rating + 100, self.problem_count
+            )
+            for problems in round_problems:
+                self._used.update(problems or [])
+
+            info(f"Tournament {self.tournament_id} round {len(self.rounds)}: {len(duel_matches)} duels.")
+            await self._update_view()
+
+            semaphore = Semaphore(TOURNAMENT_START_CONCURRENCY)
+            await gather(
+                *(self._start_match(match, problems, semaphore) for match, problems in zip(duel_matches, round_problems))
+            )
+
+            if not all(match.done for match in matches):
+                return
+
+    async def _start_match(
+        self, match: Match, problems: Optional[List["CFProblem"]], semaphore: Semaphore
+    ):
+        """
+        Creates the match's duel and sends it as a reply to the tournament
+        message. A match which can't be played is decided as if it timed out.
+        """
+        assert match.player2 is not None
+        async with semaphore:
+            if problems is None:
+                warning(f"No problems for tournament {self.tournament_id} match {match.player1} ~ {match.player2}.")
+                self._record(match, self._result(match, None))
+                return
+
+            try:
+                if self.duel_mode == Duel.B3:
+                    duel: "AnyDuel" = await B3Duel.create_duel(
+                        match.player1, match.player2, problems, self.rating, self.time_limit,
+                        tournament_id=self.tournament_id,
+                    )
+                else:
+                    duel = await TicTacDuel.create_duel(
+                        match.player1, match.player2, problems, self.rating, self.time_limit,
+                        tournament_id=self.tournament_id,
+                    )
+            except Exception:
+                exception(f"Failed to create tournament {self.tournament_id} match {match.player1} ~ {match.player2}.")
+                self._record(match, self._result(match, None))
+                return
+
+            match.duel = duel
+            self._duels[duel.duel_id] = match
+
+            assert self.view is not None and self.view._active_msg is not None
+            ctx_mgr().set_init_interaction(self.view._init_interaction)
+            ctx_mgr().set_active_msg(self.view._active_msg)
+            ctx_mgr().set_send_new_msg(True)
+            try:
+                if isinstance(duel, B3Duel):
+                    await B3DuelView.send_view(duel)
+                else:
+                    await TickTacDuelView.send_view(duel)
+            except Exception:
+                # the duel still counts without a message showing it
+                exception(f"Failed to send tournament duel: {duel.duel_id}")
+                duel_poller().track(duel, _ignore_update)
+
+    async def on_duel_end(self, duel: "AnyDuel"):
+        async with self._lock:
+            match = self._duels.pop(duel.duel_id, None)
+            if match is None or match.done or self.status != TournamentStatus.RUNNING:
+                return
+            self._record(match, self._result(match, duel))
+
+            if all(match.done for match in self.current_round):
+                await self._start_round()
+            else:
+                await self._update_view()
+
+    def _result(self, match: Match, duel: Optional["AnyDuel"]) -> Optional[int]:
+        """
+        The winner of the match, None for a draw. Elimination matches can't end
+        in a draw, the player who claimed more problems goes through, then the
+        one who solved first, then the better seed.
+        """
+        assert match.player2 is not None
+        if duel is not None and duel.status == DuelStatus.FINISHED.value and duel.winner is not None:
+            return duel.winner
+        if self.format == TournamentFormat.SWISS:
+            return None
+
+        if duel is not None:
+            claims = Counter(int(progress.split("~")[0]) for progress in duel.progress if progress != "~")
+            if claims[match.player1] != claims[match.player2]:
+                return match.player1 if claims[match.player1] > claims[match.player2] else match.player2
+            if duel.first_solve is not None:
+                return duel.first_solve
+        return min(match.player1, match.player2, key=self.players.index)
+
+    def _record(self, match: Match, winner: Optional[int]):
+        match.done = True
+        match.winner = winner
+        if winner is None:
+            for player in [match.player1, match.player2]:
+                assert player is not None
+                self.points[player] += 0.5
+            return
+
+        self.wins[winner] += 1
+        self.points[winner] += 1
+        if match.loser is not None:
+            self.losses[match.loser] += 1
+
+    def buchholz(self, player: int) -> float:
+        """Sum of the points of every opponent the player has met."""
+        opponents = [other for pair in self.met if player in pair for other in pair if other != player]
+        return sum(self.points[opponent] for opponent in opponents)
+
+    def standings(self) -> List[int]:
+        if self.format == TournamentFormat.SWISS:
+            return sorted(
+                self.players,
+                key=lambda player: (-self.points[player], -self.buchholz(player), self.players.index(player)),
+            )
+        return sorted(
+            self.players,
+            key=lambda player: (self.losses[player], -self.wins[player], self.players.index(player)),
+        )
+
+    def is_eliminated(self, player: int) -> bool:
+        if self.format == TournamentFormat.SINGLE_ELIMINATION:
+            return self.losses[player] >= 1
+        if self.format == TournamentFormat.DOUBLE_ELIMINATION:
+            return self.losses[player] >= 2
+        return False
+
+    @property
+    def champion(self) -> Optional[int]:
+        if self.status != TournamentStatus.FINISHED or not self.players:
+            return None
+        return self.standings()[0]
+
+    async def _finish(self):
+        self.status = TournamentStatus.FINISHED
+        info(f"Tournament {self.tournament_id} finished, champion: {self.champion}")
+        tournament_manager().remove(self)
+        await self._update_view()
+
+    async def _update_view(self):
+        if self.view is None:
+            return
+        try:
+            await self.view.on_tournament_update()
+        except Exception:
+            exception(f"Failed to update tournament view: {self.tournament_id}")
+
+
+async def _ignore_update():
+    pass
+
+
+class TournamentManager:
+    """
+    The running tournaments, handed the duels the DuelPoller sees end.
+    """
+
+    _instance = None
+
+    @classmethod
+    def setup_tournament_manager(cls):
+        cls._instance = cls()
+        duel_poller().add_end_listener(cls._instance.on_duel_end)
+        info("TournamentManager has been setup.")
+
+    @classmethod
+    def get_instance(cls):
+        assert cls._instance is not None, "TournamentManager has not been setup."
+        return cls._instance
+
+    def __init__(self):
+        self._tournaments: Dict[str, Tournament] = {}
+
+    def create(
+        self,
+        tournament_format: TournamentFormat,
+        duel_mode: Duel,
+        host: int,
+        rating: int,
+        time_limit: int,
+        swiss_rounds: Optional[int] = None,
+    ) -> Tournament:
+        tournament = Tournament(tournament_format, duel_mode, host, rating, time_limit, swiss_rounds)
+        self._tournaments[tournament.tournament_id] = tournament
+        return tournament
+
+    def remove(self, tournament: Tournament):
+        self._tournaments.pop(tournament.tournament_id, None)
+
+    def tournaments(self) -> List[Tournament]:
+        return list(self._tournaments.values())
+
+    async def on_duel_end(self, duel: "AnyDuel"):
+        if duel.tournament_id is None:
+            return
+        tournament = self._tournaments.get(duel.tournament_id)
+        if tournament is not None:
+            await tournament.on_duel_end(duel)
+
+
+def tournament_manager() -> TournamentManager:
+    return TournamentManager.get_instance()
+
+
+class TournamentView(BaseView):
+    @classmethod
+    async def send_view(cls, tournament: Tournament):
+        view = cls(tournament)
+        tournament.view = view
+        await view._send_view()
+
+    def __init__(self, tournament: Tournament):
+        self.tournament = tournament
+        # a tournament runs for hours, the view lasts as long as it does
+        super().__init__(user=tournament.host, timeout=None)
+
+    def _add_items(self):
+        self.clear_items()
+
+        status = self.tournament.status
+        if status == TournamentStatus.REGISTRATION:
+            self._add_button(label="Join", custom_id="join", row=0)
+            self._add_button(label="Leave", custom_id="leave", row=0)
+            self._add_button(label="Start", custom_id="start", row=1)
+            self._add_button(label="Cancel", custom_id="cancel", row=1)
+
+        elif status == TournamentStatus.RUNNING:
+            self._add_button(label="REFRESH", custom_id="refresh", row=0)
+
+    async def interaction_check(self, interaction: Interaction) -> bool:
+        self._time_interaction(interaction)
+        ctx_mgr().set_init_interaction(self._init_interaction)
+        ctx_mgr().set_responding(interaction)
+        assert self._active_msg is not None
+        ctx_mgr().set_active_msg(self._active_msg)
+
+        user_id = interaction.user.id
+        custom_id = interaction.data["custom_id"]  # type: ignore
+
+        if custom_id == "join":
+            if user_id in self.tournament.players:
+                await interaction.response.send_message(
+                    content="You have already joined the tournament.",
+                    ephemeral=True
+                )
+                return False
+
+            try:
+                await User.load_user(user_id)
+                return True
+            except IndexError:
+                await interaction.response.send_message(
+                    content="You need to register yourself first!",
+                    ephemeral=True
+                )
+                return False
+
+        elif custom_id == "leave":
+            if user_id in self.tournament.players:
+                return True
+
+        elif custom_id in ["start", "cancel"]:
+            if user_id == self.tournament.host or user_id in ADMINS:
+                return True
+
+        elif custom_id == "refresh":
+            return True
+
+        else:
+            raise ValueError(f"Invalid custom_id: {custom_id}")
+
+        await interaction.response.send_message(
+            content="You aren't allowed to interact with this!",
+            ephemeral=True
+        )
+        return False
+
+    def _action_key(self, interaction: Interaction, custom_id: str) -> Hashable:
+        if custom_id == "refresh":
+            return custom_id
+        return super()._action_key(interaction, custom_id)
+
+    async def _button_clicked(self, interaction: Interaction, custom_id: str) -> None:
+        # the tournament may have moved on while the click was waiting
+        if custom_id in ["join", "leave", "start", "cancel"] and self.tournament.status != TournamentStatus.REGISTRATION:
+            await self._reply_ephemeral(interaction, "Registration has closed.")
+            return
+
+        if custom_id == "start" and len(self.tournament.players) < 2:
+            await self._reply_ephemeral(interaction, "A tournament needs at least 2 players.")
+            return
+
+        await self._defer(interaction)
+
+        if custom_id == "join":
+            self.tournament.add_player(await User.load_user(interaction.user.id))
+
+        elif custom_id == "leave":
+            self.tournament.remove_player(interaction.user.id)
+
+        elif custom_id == "start":
+            await self.tournament.start()
+            return
+
+        elif custom_id == "cancel":
+            self.tournament.cancel()
+            await self.stop_and_disable(custom_text="Cancelled . . .")
+            return
+
+        elif custom_id == "refresh":
+            pass
+
+        else:
+            raise ValueError(f"Invalid custom_id: {custom_id}")
+
+        await self._send_view()
+
+    async def on_tournament_update(self) -> None:
+        ctx_mgr().set_init_interaction(self._init_interaction)
+        assert self._active_msg is not None
+        ctx_mgr().set_active_msg(self._active_msg)
+        ctx_mgr().set_send_new_msg(False)
+        await self._send_view()
+        if self.tournament.status == TournamentStatus.FINISHED:
+            self.stop()
+
+    def _standings_lines(self) -> List[str]:
+        tournament = self.tournament
+        lines: List[str] = []
+        for rank, player in enumerate(tournament.standings()[:STANDINGS_SHOWN], start=1):
+            if tournament.format == TournamentFormat.SWISS:
+                line = f"{rank}. <@{player}> · {tournament.points[player]:g} pts"
+            else:
+                line = f"{rank}. <@{player}> · {tournament.wins[player]} W {tournament.losses[player]} L"
+                if tournament.is_eliminated(player):
+                    line += " · out"
+            lines.append(line)
+        if len(tournament.players) > STANDINGS_SHOWN:
+            lines.append(f"... and {len(tournament.players) - STANDINGS_SHOWN} more")
+        return lines
+
+    async def _get_embed(self):
+        tournament = self.tournament
+        embed = BaseEmbed(title=f"{tournament.format.value} Tournament")
+
+        if tournament.status == TournamentStatus.REGISTRATION:
+            embed.description = "Registration is open, join before the host starts it!"
+        elif tournament.status == TournamentStatus.RUNNING:
+            if tournament.rounds:
+                matches = tournament.current_round
+                finished = sum(match.done for match in matches)
+                embed.description = f"**Round {len(tournament.rounds)}** · {finished} / {len(matches)} matches finished"
+            else:
+                embed.description = "Seeding players and picking problems . . ."
+        elif tournament.status == TournamentStatus.FINISHED:
+            embed.description = f"**Champion 👑** <@{tournament.champion}>"
+        else:
+            embed.description = "Cancelled."
+
+        embed.add_field(name="Duel Mode", value=f"{tournament.duel_mode.value}")
+        embed.add_field(name="Rating", value=f"{tournament.rating}")
+        embed.add_field(name="Time Limit", value=f"{tournament.time_limit} minutes")
+        embed.add_field(name="Host", value=f"<@{tournament.host}>")
+        embed.add_field(name="Players", value=f"{len(tournament.players)}")
+        if tournament.format == TournamentFormat.SWISS:
+            embed.add_field(name="Rounds", value=f"{tournament.swiss_rounds or 'auto'}")
+
+        if tournament.players:
+            if tournament.status == TournamentStatus.REGISTRATION:
+                shown = " ".join(f"<@{player}>" for player in tournament.players[:STANDINGS_SHOWN])
+                if len(tournament.players) > STANDINGS_SHOWN:
+                    shown += f" ... and {len(tournament.players) - STANDINGS_SHOWN} more"
+                embed.add_field(name="Joined", value=shown, inline=False)
+            else:
+                embed.add_field(name="Standings", value="\n".join(self._standings_lines()), inline=False)
+
+        files: List[File] = []
+        return embed, files
@@ -4,10 +4,20 @@ from discord.ext import commands
 from logging import basicConfig, INFO, info
 
 from database.db import DB
+from database.partition_queries import ensure_current_partitions
+from duels.poller import DuelPoller
+from duels.matchmaking import Matchmaker
+from duels.recovery import rehydrate_duels
+from duels.spectators import DuelHub
+from duels.tournament import TournamentManager
 from orzduck_cog import OrzDuckCog
 from config import DISCORD_API_TOKEN, HQ_CHANNEL_ID
 from utils.discord.disc_utils import DiscUtils, disc_utils
+from utils.discord.messenger import OutboundQueue
 from utils.context_manager import ContextManager
+from utils.deadlines import DeadlineScheduler
+from utils import image_handling as imgh
+from utils.render_service import RenderService
 
 
 basicConfig(level=INFO)
@@ -15,7 +25,16 @@ basicConfig(level=INFO)
 
 async def main():
     await DB.establish_connection()
+    await ensure_current_partitions()
     ContextManager.setup_context_manager()
+    OutboundQueue.setup_outbound_queue()
+    DeadlineScheduler.setup_deadline_scheduler()
+    DuelPoller.setup_duel_poller()
+    DuelHub.setup_duel_hub()
+    TournamentManager.setup_tournament_manager()
+    Matchmaker.setup_matchmaker()
+    imgh.load_assets()
+    RenderService.setup_render_service()
 
     bot = commands.Bot(command_prefix="!", intents=Intents.all(), help_command=None)
     DiscUtils.setup_disc_utils(bot)
@@ -31,10 +50,17 @@ async def main():
             f"Hi, I've logged in as **User:** `{bot.user.name}` (**ID:** `{bot.user.id}`)"
         )
 
+    # on_ready fires again on every reconnect, duels are only restored once
+    duels_restored = False
+
     @bot.event
     async def on_ready():  # type: ignore
+        nonlocal duels_restored
         await bot.add_cog(OrzDuckCog(bot))
         await sync_tree()
+        if not duels_restored:
+            duels_restored = True
+            await rehydrate_duels()
         await announce_online()
 
     await bot.start(DISCORD_API_TOKEN)
@@ -27,18 +27,58 @@ class AdminMainView(BaseView):
             self._add_button(label="RELOAD USERS", custom_id="reload_users", row=0)
 
             self._add_button(label="TOURNAMENT", custom_id="tournament", row=1)
+            self._add_button(label="ARCHIVE DUELS", custom_id="archive_duels", row=1)
 
             self._add_button(label="ADD ADMIN", custom_id="add_admin", row=2)
             self._add_button(label="REMOVE ADMIN", custom_id="remove_admin", row=2)
             self._add_button(label="LIST ADMINS", custom_id="list_admins", row=2)
+
+            self._add_button(label="QUERY STATS", custom_id="query_stats", row=3)
+            self._add_button(label="POOL STATS", custom_id="pool_stats", row=3)
+            self._add_button(label="RENDER STATS", custom_id="render_stats", row=3)
+            self._add_button(label="QUEUE STATS", custom_id="queue_stats", row=3)
+            self._add_button(label="MESSAGE STATS", custom_id="message_stats", row=3)
+
+            self._add_button(label="INTERACTION STATS", custom_id="interaction_stats", row=4)
+
+        elif self.mode == "query_stats":
+            self._add_button(label="REFRESH", custom_id="query_stats", row=0)
+            self._add_button(label="RESET", custom_id="reset_query_stats", row=0)
+            self._add_button(label="BACK", custom_id="no", row=0)
+
+        elif self.mode == "pool_stats":
+            self._add_button(label="REFRESH", custom_id="pool_stats", row=0)
+            self._add_button(label="BACK", custom_id="no", row=0)
+
+        elif self.mode == "render_stats":
+            self._add_button(label="REFRESH", custom_id="render_stats", row=0)
+            self._add_button(label="BACK", custom_id="no", row=0)
+
+        elif self.mode == "queue_stats":
+            self._add_button(label="REFRESH", custom_id="queue_stats", row=0)
+            self._add_button(label="BACK", custom_id="no", row=0)
+
+        elif self.mode == "message_stats":
+            self._add_button(label="REFRESH", custom_id="message_stats", row=0)
+            self._add_button(label="BACK", custom_id="no", row=0)
+
+        elif self.mode == "interaction_stats":
+            self._add_button(label="REFRESH", custom_id="interaction_stats", row=0)
+            self._add_button(label="RESET", custom_id="reset_interaction_stats", row=0)
+            self._add_button(label="BACK", custom_id="no", row=0)
+
+        elif self.mode == "tournament":
+            self._add_button(label="CREATE", custom_id="create_tournament", row=0)
+            self._add_button(label="REFRESH", custom_id="tournament", row=0)
+            self._add_button(label="BACK", custom_id="no", row=0)
         
-        elif self.mode in ["reload_problems", "reload_users"]:
+        elif self.mode in ["reload_problems", "reload_users", "archive_duels"]:
             self._add_button(label="YES", custom_id="yes", row=0)
             self._add_button(label="NO", custom_id="no", row=0)
 
     async def _button_clicked(self, interaction: Interaction, custom_id: str) -> None:
-        if custom_id not in ["add_admin", "remove_admin"]:
-            await interaction.response.defer()
+        if custom_id not in ["add_admin", "remove_admin", "create_tournament"]:
+            await self._defer(interaction)
 
         if custom_id == "yes":
             if self.mode == "reload_problems":
@@ -50,6 +90,11 @@ class AdminMainView(BaseView):
                 self.stop()
                 await admin_reload_users()
                 return
+
+            elif self.mode == "archive_duels":
+                self.stop()
+                await admin_archive_duels()
+                return
             
             else:
                 raise ValueError(f"Unknown mode: {self.mode}")
@@ -65,7 +110,38 @@ class AdminMainView(BaseView):
             self.mode = "reload_users"
 
         elif custom_id == "tournament":
-            pass
+            self.mode = "tournament"
+
+        elif custom_id == "archive_duels":
+            self.mode = "archive_duels"
+
+        elif custom_id == "query_stats":
+            self.mode = "query_stats"
+
+        elif custom_id == "pool_stats":
+            self.mode = "pool_stats"
+
+        elif custom_id == "render_stats":
+            self.mode = "render_stats"
+
+        elif custom_id == "queue_stats":
+            self.mode = "queue_stats"
+
+        elif custom_id == "message_stats":
+            self.mode = "message_stats"
+
+        elif custom_id == "interaction_stats":
+            self.mode = "interaction_stats"
+
+        elif custom_id == "reset_query_stats":
+            from database.query_stats import QueryStats
+
+            QueryStats.reset()
+
+        elif custom_id == "reset_interaction_stats":
+            from utils.interaction_stats import InteractionStats
+
+            InteractionStats.reset()
 
         elif custom_id == "add_admin":
             callback = partial(self._modal_submit, custom_id=custom_id)
@@ -105,6 +181,28 @@ class AdminMainView(BaseView):
             await interaction.response.send_modal(modal)
             return
         
+        elif custom_id == "create_tournament":
+            callback = partial(self._modal_submit, custom_id=custom_id)
+            modal = BaseModal(
+                title="Create Tournament",
+                custom_id="create_tournament",
+                view=self,
+                modal_submit_callback=callback,
+            )
+            modal.add_text_input(
+                label="Format", custom_id="format", long=False, placeholder="single, double or swiss"
+            )
+            modal.add_text_input(label="Duel Mode", custom_id="mode", long=False, placeholder="tictac or b3")
+            modal.add_text_input(label="Rating", custom_id="rating", long=False, default="900", max_length=4)
+            modal.add_text_input(
+                label="Time Limit (minutes)", custom_id="time_limit", long=False, default="60", max_length=3
+            )
+            modal.add_text_input(
+                label="Swiss Rounds", custom_id="rounds", long=False, placeholder="auto", required=False, max_length=2
+            )
+            await interaction.response.send_modal(modal)
+            return
+
         elif custom_id == "list_admins":
             self.stop()
             await list_admins()
@@ -116,7 +214,7 @@ class AdminMainView(BaseView):
         await self._send_view()
     
     async def _modal_submit(self, interaction: Interaction, custom_id: str, values: Dict[str, str]) -> None:
-        await interaction.response.defer()
+        await self._defer(interaction)
 
         if custom_id == "add_admin":
             self.stop()
@@ -129,6 +227,11 @@ class AdminMainView(BaseView):
             user_id = values["user_id"]
             await remove_admin(int(user_id))
             return
+
+        elif custom_id == "create_tournament":
+            self.stop()
+            await admin_create_tournament(values)
+            return
             
         else:
             raise ValueError(f"Unknown custom_id: {custom_id}")
@@ -140,12 +243,214 @@ class AdminMainView(BaseView):
             embed = BaseEmbed(title="Reload Problems", description="Are you sure you want to reload the problems?")
         elif self.mode == "reload_users":
             embed = BaseEmbed(title="Reload Users", description="Are you sure you want to reload the users?")
+        elif self.mode == "archive_duels":
+            from config import DUEL_RETENTION_MONTHS
+
+            embed = BaseEmbed(
+                title="Archive Duels",
+                description=f"Are you sure you want to archive duels older than {DUEL_RETENTION_MONTHS} months?",
+            )
+        elif self.mode == "query_stats":
+            embed = get_query_stats_embed()
+        elif self.mode == "pool_stats":
+            embed = get_pool_stats_embed()
+        elif self.mode == "render_stats":
+            embed = get_render_stats_embed()
+        elif self.mode == "queue_stats":
+            embed = get_queue_stats_embed()
+        elif self.mode == "message_stats":
+            embed = get_message_stats_embed()
+        elif self.mode == "interaction_stats":
+            embed = get_interaction_stats_embed()
+        elif self.mode == "tournament":
+            embed = get_tournaments_embed()
         else:
             raise ValueError(f"Unknown mode: {self.mode}")
         files: List[File] = []
         return embed, files
 
 
+def get_query_stats_embed() -> BaseEmbed:
+    from config import DB_SLOW_QUERY_MS
+    from database.query_stats import QueryStats
+
+    stats = QueryStats.top(10)
+    embed = BaseEmbed(
+        title="Query Stats",
+        description=f"Top statements by total time. Slow query threshold: {DB_SLOW_QUERY_MS:.0f} ms",
+    )
+    if not stats:
+        embed.add_field(name="No queries recorded yet.")
+    for stat in stats:
+        latency = stat.latency
+        embed.add_field(
+            name=stat.statement[:250],
+            value=(
+                f"**Calls:** {stat.calls} · **Errors:** {stat.errors} · **Rows:** {stat.rows}\n"
+                f"**Total:** {latency.total:.0f} ms · **Mean:** {latency.mean:.1f} ms\n"
+                f"{latency.summary()}"
+            ),
+            inline=False,
+        )
+    return embed
+
+
+def get_pool_stats_embed() -> BaseEmbed:
+    from database.db import DB
+
+    stats = DB.pool_stats()
+    embed = BaseEmbed(
+        title="Pool Stats",
+        description="High acquire wait with low query time means the pool is starved, not Postgres.",
+    )
+    embed.add_field(name="Size", value=f"{stats['min_size']} ~ {stats['max_size']}")
+    embed.add_field(name="Open", value=f"{stats['open']}")
+    embed.add_field(name="Idle", value=f"{stats['idle']}")
+    embed.add_field(name="In Use", value=f"{stats['in_use']}")
+    embed.add_field(name="Waiters", value=f"{stats['waiters']} (max {stats['max_waiters']})")
+    embed.add_field(name="Timeouts", value=f"{stats['timeouts']}")
+    embed.add_field(name="Acquire Wait", value=stats["acquire_wait"].summary(), inline=False)
+    return embed
+
+
+def get_render_stats_embed() -> BaseEmbed:
+    from utils.avatar_cache import AvatarCache
+    from utils.render_cache import RenderCache
+    from utils.render_service import render_service
+
+    avatars = AvatarCache.stats()
+    renders = RenderCache.stats()
+    service = render_service().stats()
+    embed = BaseEmbed(title="Render Stats")
+    embed.add_field(name="Avatar Cache", inline=False)
+    embed.add_field(name="Entries", value=f"{avatars['entries']}")
+    embed.add_field(
+        name="Memory",
+        value=f"{avatars['bytes_used'] / 2**20:.1f} / {avatars['max_bytes'] / 2**20:.0f} MiB",
+    )
+    embed.add_field(
+        name="Hit Ratio",
+        value=f"{avatars['hit_ratio']:.1%} ({avatars['hits']} / {avatars['hits'] + avatars['misses']})",
+    )
+    embed.add_field(name="Evictions", value=f"{avatars['evictions']}")
+
+    embed.add_field(name="Render Cache", inline=False)
+    embed.add_field(name="Entries", value=f"{renders['entries']}")
+    embed.add_field(
+        name="Memory",
+        value=f"{renders['bytes_used'] / 2**20:.1f} / {renders['max_bytes'] / 2**20:.0f} MiB",
+    )
+    embed.add_field(
+        name="Hit Ratio",
+        value=f"{renders['hit_ratio']:.1%} ({renders['hits']} / {renders['hits'] + renders['misses']})",
+    )
+    embed.add_field(name="Evictions", value=f"{renders['evictions']}")
+    embed.add_field(name="Uploads Skipped", value=f"{renders['uploads_skipped']}")
+
+    embed.add_field(name="Render Workers", inline=False)
+    embed.add_field(name="Workers", value=f"{service['workers'] or 'thread'}")
+    embed.add_field(
+        name="Pending",
+        value=f"{service['pending']} / {service['queue_size']} (max {service['max_pending']})",
+    )
+    embed.add_field(name="Rejected / Timeouts", value=f"{service['rejected']} / {service['timeouts']}")
+    embed.add_field(name="Render Time", value=service["render_time"].summary(), inline=False)
+    return embed
+
+
+def get_queue_stats_embed() -> BaseEmbed:
+    from duels.matchmaking import matchmaker
+
+    stats = matchmaker()
+    embed = BaseEmbed(title="Queue Stats", description="Time from /queue to an opponent being found.")
+    embed.add_field(name="Queued", value=f"{stats.queued()} (max {stats.max_queued})")
+    embed.add_field(name="Matched", value=f"{stats.matched}")
+    embed.add_field(name="Queue Time", value=stats.wait_time.summary(unit="s"), inline=False)
+    embed.add_field(name="Rating Gap", value=stats.rating_gap.summary(unit="pts"), inline=False)
+    for (duel_mode, time_limit), size in list(stats.queue_sizes().items())[:15]:
+        embed.add_field(name=f"{duel_mode.value} · {time_limit} mins", value=f"{size} waiting")
+    return embed
+
+
+def get_message_stats_embed() -> BaseEmbed:
+    from duels.spectators import duel_hub
+
+    stats = Messenger.stats()
+    hub = duel_hub().stats()
+    embed = BaseEmbed(title="Message Stats", description="Discord API calls made sending and editing messages.")
+    embed.add_field(name="API Calls", value=f"{stats['total_calls']}")
+    embed.add_field(name="Edits Skipped", value=f"{stats['edits_skipped']}")
+    embed.add_field(name="Messages Cached", value=f"{stats['messages']}")
+    for kind, calls in sorted(stats["api_calls"].items()):
+        embed.add_field(name=kind.replace("_", " ").title(), value=f"{calls}")
+    embed.add_field(name="Calls per Interaction", value=stats["per_interaction"].summary(unit="calls"), inline=False)
+
+    outbound = stats["outbound"]
+    embed.add_field(name="Outbound Queue", inline=False)
+    embed.add_field(name="Pending", value=f"{outbound['pending']} (max {outbound['max_pending']})")
+    embed.add_field(name="Coalesced", value=f"{outbound['coalesced']} / {outbound['queued'] + outbound['coalesced']}")
+    embed.add_field(name="Rate Limited / Late", value=f"{outbound['rate_limited']} / {outbound['late']}")
+    embed.add_field(name="Lag Answering Users", value=outbound["lag_urgent"].summary(), inline=False)
+    embed.add_field(name="Lag in Background", value=outbound["lag_background"].summary(), inline=False)
+
+    embed.add_field(name="Spectators", inline=False)
+    embed.add_field(name="Subscriptions", value=f"{hub['subscriptions']}")
+    embed.add_field(name="Edits", value=f"{hub['edits']}")
+    embed.add_field(name="Coalesced", value=f"{hub['coalesced']}")
+    return embed
+
+
+def get_interaction_stats_embed() -> BaseEmbed:
+    from utils.interaction_stats import ACK_DEADLINE_MS, InteractionStats
+
+    stats = InteractionStats.top(10)
+    embed = BaseEmbed(
+        title="Interaction Stats",
+        description=(
+            f"Flows closest to the {ACK_DEADLINE_MS / 1000:.0f} s acknowledgement deadline, "
+            "from when Discord created the interaction."
+        ),
+    )
+    if not stats:
+        embed.add_field(name="No interactions recorded yet.")
+    for stat in stats:
+        embed.add_field(
+            name=stat.flow[:250],
+            value=(
+                f"**Calls:** {stat.final.count} · **Missed Deadline:** {stat.missed}\n"
+                f"**Ack:** {stat.ack.summary()}\n"
+                f"**Final:** {stat.final.summary()}"
+            ),
+            inline=False,
+        )
+    return embed
+
+
+def get_tournaments_embed() -> BaseEmbed:
+    from duels.tournament import TournamentStatus, tournament_manager
+
+    tournaments = tournament_manager().tournaments()
+    embed = BaseEmbed(title="Tournaments", description="Tournaments in registration or running.")
+    if not tournaments:
+        embed.add_field(name="No tournaments right now.")
+    for tournament in tournaments[:20]:
+        if tournament.status == TournamentStatus.RUNNING and tournament.rounds:
+            matches = tournament.current_round
+            progress = f"Round {len(tournament.rounds)} · {sum(match.done for match in matches)} / {len(matches)} done"
+        else:
+            progress = tournament.status.value.capitalize()
+        embed.add_field(
+            name=f"{tournament.format.value} · {tournament.duel_mode.value}",
+            value=(
+                f"**Host:** <@{tournament.host}> · **Players:** {len(tournament.players)}\n"
+                f"**Rating:** {tournament.rating} · **Time Limit:** {tournament.time_limit} mins\n"
+                f"{progress}"
+            ),
+            inline=False,
+        )
+    return embed
+
+
 async def orz_admin():
     await AdminMainView.send_view()
 
@@ -197,6 +502,30 @@ async def admin_reload_users():
     await Messenger.send_message(embed=embed)
 
 
+async def admin_archive_duels():
+    from config import DUEL_ARCHIVE_MODE
+    from database.partition_queries import archive_old_duels
+    from utils.general import get_time
+
+    embed = BaseEmbed(title="Archiving Duels")
+    embed.add_field(name="Moving old partitions to the archive.", value="Please wait...")
+    await Messenger.send_message(embed=embed)
+
+    start_time = get_time()
+    archived = await archive_old_duels()
+    end_time = get_time()
+
+    embed = BaseEmbed(title="Duels Archived")
+    embed.add_field(name="Partition Count", value=f"{len(archived)}")
+    embed.add_field(name="Duel Count", value=f"{sum(count for _, count in archived)}")
+    embed.add_field(name="Mode", value=DUEL_ARCHIVE_MODE)
+    embed.add_field(name="Time Taken", value=f"{end_time - start_time} seconds")
+    for name, count in archived[:20]:
+        embed.add_field(name=name, value=f"{count} duels")
+
+    await Messenger.send_message(embed=embed)
+
+
 async def add_admin(admin_user_id: int):
     from config import ADMINS
 
@@ -236,4 +565,40 @@ async def list_admins():
     for i, admin_user_id in enumerate(ADMINS):
         embed.add_field(name=f"{i + 1}", value=f"<@{admin_user_id}>")
 
-    await Messenger.send_message(embed=embed)
\ No newline at end of file
+    await Messenger.send_message(embed=embed)
+
+
+async def admin_create_tournament(values: Dict[str, str]):
+    from orz_modules.duel import Duel
+    from duels.tournament import TournamentFormat, TournamentView, tournament_manager
+
+    formats = {
+        "single": TournamentFormat.SINGLE_ELIMINATION,
+        "double": TournamentFormat.DOUBLE_ELIMINATION,
+        "swiss": TournamentFormat.SWISS,
+    }
+    modes = {"tictac": Duel.TICTAC, "b3": Duel.B3}
+
+    tournament_format = formats.get(values["format"].strip().lower())
+    duel_mode = modes.get(values["mode"].strip().lower())
+    try:
+        rating = int(values["rating"])
+        time_limit = min(int(values["time_limit"]), 300)
+        swiss_rounds = int(values["rounds"]) if values.get("rounds", "").strip() else None
+    except ValueError:
+        rating = time_limit = -1
+        swiss_rounds = None
+
+    if tournament_format is None or duel_mode is None or rating <= 0 or time_limit <= 0 or (swiss_rounds or 1) <= 0:
+        embed = BaseEmbed(title="Invalid Tournament", description="Please check the values and try again.")
+        embed.add_field(name="Format", value=values["format"] or "~")
+        embed.add_field(name="Duel Mode", value=values["mode"] or "~")
+        embed.add_field(name="Rating", value=values["rating"] or "~")
+        embed.add_field(name="Time Limit", value=values["time_limit"] or "~")
+        await Messenger.send_message(embed=embed)
+        return
+
+    tournament = tournament_manager().create(
+        tournament_format, duel_mode, ctx_mgr().get_user_id(), rating, time_limit, swiss_rounds
+    )
+    await TournamentView.send_view(tournament)
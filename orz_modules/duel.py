@@ -1,15 +1,20 @@
 from enum import Enum
 from discord import File, Interaction
-from typing import List, Optional
+from typing import List, Optional, TYPE_CHECKING
 
 from utils.context_manager import ctx_mgr
 from utils.discord import BaseView, Messenger, BaseEmbed
 from orz_modules.user import User
 
+if TYPE_CHECKING:
+    from duels.board import BoardSpec
+    from duels.spectators import Topic
+
 
 class Duel(Enum):
     TICTAC = "TicTac"
     B3 = "Best of 3"
+    GRID = "Grid"
     CLASSIC = "Classic"
 
 
@@ -23,12 +28,17 @@ class DuelStatus(Enum):
 
 class DuelWaitingView(BaseView):
     @classmethod
-    async def send_view(cls, duel_mode: Duel, player1: int, rating: int, time_limit: int):
-        view = cls(duel_mode, player1, rating, time_limit)
+    async def send_view(
+        cls, duel_mode: Duel, player1: int, rating: int, time_limit: int, board: Optional["BoardSpec"] = None
+    ):
+        view = cls(duel_mode, player1, rating, time_limit, board)
         await view._send_view()
     
-    def __init__(self, duel_mode: Duel, player1: int, rating: int, time_limit: int):
+    def __init__(
+        self, duel_mode: Duel, player1: int, rating: int, time_limit: int, board: Optional["BoardSpec"] = None
+    ):
         self.duel_mode = duel_mode
+        self.board = board
         self.player1: int = player1
         self.player2: Optional[int] = None
         self.rating = rating
@@ -52,7 +62,9 @@ class DuelWaitingView(BaseView):
             raise ValueError(f"Invalid mode: {self.mode}")
     
     async def interaction_check(self, interaction: Interaction) -> bool:
+        self._time_interaction(interaction)
         ctx_mgr().set_init_interaction(self._init_interaction)
+        ctx_mgr().set_responding(interaction)
         assert self._active_msg is not None
         ctx_mgr().set_active_msg(self._active_msg)
 
@@ -99,7 +111,11 @@ class DuelWaitingView(BaseView):
         return False
     
     async def _button_clicked(self, interaction: Interaction, custom_id: str) -> None:
-        await interaction.response.defer()
+        if custom_id == "join" and self.mode != "one_player":
+            await self._reply_ephemeral(interaction, "Someone has already joined the duel.")
+            return
+
+        await self._defer(interaction)
 
         if custom_id == "join":
             self.mode = "two_players"
@@ -116,6 +132,13 @@ class DuelWaitingView(BaseView):
                 await _orz_duel_tictac(self.player1, self.player2, self.rating, self.time_limit)
                 return
             
+            if self.duel_mode == Duel.GRID:
+                await self.stop_and_disable(custom_text="Starting . . .")
+                assert self.player2 is not None
+                assert self.board is not None
+                await _orz_duel_grid(self.player1, self.player2, self.rating, self.time_limit, self.board)
+                return
+
             if self.duel_mode == Duel.B3:
                 await self.stop_and_disable(custom_text="Starting . . .")
                 assert self.player2 is not None
@@ -134,6 +157,8 @@ class DuelWaitingView(BaseView):
         if self.mode == "one_player":
             embed = BaseEmbed(title="Waiting for player . . .")
             embed.add_field(name="Duel Mode", value=f"{self.duel_mode.value}", inline=False)
+            if self.board is not None:
+                embed.add_field(name="Board", value=self.board.name, inline=False)
             embed.add_field(name="Player 1", value=f"<@{self.player1}>")
             embed.add_field(name="")
             embed.add_field(name="Player 2", value="???")
@@ -144,6 +169,8 @@ class DuelWaitingView(BaseView):
         elif self.mode == "two_players":
             embed = BaseEmbed(title="Ready to Start!")
             embed.add_field(name="Duel Mode", value=f"{self.duel_mode.value}", inline=False)
+            if self.board is not None:
+                embed.add_field(name="Board", value=self.board.name, inline=False)
             embed.add_field(name="Player 1", value=f"<@{self.player1}>")
             embed.add_field(name="")
             embed.add_field(name="Player 2", value=f"<@{self.player2}>")
@@ -159,6 +186,131 @@ class DuelWaitingView(BaseView):
         return embed, files
 
 
+class QueueView(BaseView):
+    @classmethod
+    async def send_view(cls, duel_mode: Duel, rating: int, problem_rating: int, time_limit: int) -> "QueueView":
+        view = cls(duel_mode, rating, problem_rating, time_limit)
+        await view._send_view()
+        return view
+
+    def __init__(self, duel_mode: Duel, rating: int, problem_rating: int, time_limit: int):
+        from config import QUEUE_TIMEOUT
+
+        self.user_id = ctx_mgr().get_user_id()
+        self.duel_mode = duel_mode
+        self.rating = rating
+        self.problem_rating = problem_rating
+        self.time_limit = time_limit
+        super().__init__(user=self.user_id, timeout=QUEUE_TIMEOUT)
+
+    def _add_items(self):
+        self.clear_items()
+        self._add_button(label="Leave", custom_id="leave")
+
+    async def _button_clicked(self, interaction: Interaction, custom_id: str) -> None:
+        from duels.matchmaking import matchmaker
+
+        await self._defer(interaction)
+
+        if custom_id == "leave":
+            matchmaker().leave(self.user_id)
+            await self.stop_and_disable(custom_text="Left the queue . . .")
+            return
+
+        else:
+            raise ValueError(f"Invalid custom_id: {custom_id}")
+
+    async def on_matched(self):
+        ctx_mgr().set_init_interaction(self._init_interaction)
+        assert self._active_msg is not None
+        ctx_mgr().set_active_msg(self._active_msg)
+        ctx_mgr().set_send_new_msg(False)
+        await self.stop_and_disable(custom_text="Opponent found, starting . . .")
+
+    async def on_timeout(self):
+        from duels.matchmaking import matchmaker
+
+        if not matchmaker().leave(self.user_id):
+            return
+        await super().on_timeout()
+
+    async def _get_embed(self):
+        from duels.matchmaking import matchmaker
+
+        wait_time = matchmaker().wait_time
+        embed = BaseEmbed(title="Looking for an opponent . . .")
+        embed.add_field(name="Duel Mode", value=f"{self.duel_mode.value}", inline=False)
+        embed.add_field(name="Player", value=f"<@{self.user_id}>")
+        embed.add_field(name="Rating", value=f"{self.rating}")
+        embed.add_field(name="Problem Rating", value=f"{self.problem_rating}")
+        embed.add_field(name="Time Limit", value=f"{self.time_limit} minutes")
+        embed.add_field(name="In Queue", value=f"{matchmaker().queued((self.duel_mode, self.time_limit))}")
+        if wait_time.count:
+            embed.add_field(
+                name="Usual Wait",
+                value=f"{wait_time.percentile(50):.0f} s, {wait_time.percentile(95):.0f} s at worst",
+            )
+
+        files: List[File] = []
+        return embed, files
+
+
+async def orz_queue(mode: str, rating: int, time_limit: int):
+    from database.cf_queries import get_user_rating
+    from duels.matchmaking import QueueTicket, matchmaker
+
+    if matchmaker().is_queued(ctx_mgr().get_user_id()):
+        await ctx_mgr().get_init_interaction().response.send_message(
+            content="You are already in the queue!",
+            ephemeral=True
+        )
+        return
+
+    user = await User.load_user(ctx_mgr().get_user_id())
+    assert user.cf_handle is not None
+    duel_mode = Duel.B3 if mode == "b3" else Duel.TICTAC
+    time_limit = min(time_limit, 300)
+
+    # players missing from the last users reload, or unrated, are matched on the rating they asked for
+    player_rating = await get_user_rating(user.cf_handle)
+    if player_rating is None or player_rating <= 0:
+        player_rating = rating
+
+    view = await QueueView.send_view(duel_mode, player_rating, rating, time_limit)
+    matchmaker().join(QueueTicket(user.user_id, player_rating, rating, duel_mode, time_limit, view))
+
+
+async def orz_spectate(player: int):
+    from duels.spectators import duel_hub
+
+    duel = duel_hub().find_duel(player)
+    if duel is None:
+        await ctx_mgr().get_init_interaction().response.send_message(
+            content=f"<@{player}> is not in a duel right now!",
+            ephemeral=True
+        )
+        return
+    await _orz_spectate(("duel", duel.duel_id))
+
+
+async def orz_scoreboard():
+    from duels.spectators import ALL_DUELS
+
+    await _orz_spectate(ALL_DUELS)
+
+
+async def _orz_spectate(topic: "Topic"):
+    from duels.spectators import duel_hub
+
+    if duel_hub().is_full():
+        await ctx_mgr().get_init_interaction().response.send_message(
+            content="Too many people are watching, try again later!",
+            ephemeral=True
+        )
+        return
+    await duel_hub().spectate(topic)
+
+
 async def orz_duel_tictac(rating: int, time_limit: int):
     player1 = ctx_mgr().get_user_id()
     time_limit = min(time_limit, 300)
@@ -172,29 +324,52 @@ async def _orz_duel_tictac(p1: int, p2: int, rating: int, time_limit: int):
     await _orz_duel_tictac_select_problems(player1, player2, rating, time_limit)
 
 
-async def _orz_duel_tictac_select_problems(player1: User, player2: User, rating: int, time_limit: int):
+async def _orz_duel_tictac_select_problems(
+    player1: User, player2: User, rating: int, time_limit: int, board: Optional["BoardSpec"] = None
+):
     from codeforces.cf import get_duel_problems
-    from duels.tictac_duel import TicTacDuel, TickTacDuelView
+    from duels.board import TICTAC_BOARD
+    from duels.tictac_duel import TicTacDuel, GridDuel, TickTacDuelView
 
+    board = board or TICTAC_BOARD
+    duel_mode = Duel.TICTAC if board.is_tictac else Duel.GRID
     try:
         assert player1.cf_handle is not None
         assert player2.cf_handle is not None
         problems = await get_duel_problems(
-            player1.cf_handle, player2.cf_handle, rating - 100, rating + 100, 9
+            player1.cf_handle, player2.cf_handle, rating - 100, rating + 100, board.cell_count
         )
     except ValueError:
         embed = BaseEmbed(title="No Problems Found", description="No problems found for the given rating range.")
-        embed.add_field(name="Duel Mode", value=f"{Duel.TICTAC}", inline=False)
+        embed.add_field(name="Duel Mode", value=f"{duel_mode}", inline=False)
         embed.add_field(name="Player 1", value=f"<@{player1.user_id}>")
         embed.add_field(name="Player 2", value=f"<@{player2.user_id}>")
         embed.add_field(name="Rating", value=f"{rating}", inline=False)
         await Messenger.send_message(embed=embed)
         return
     
-    duel = await TicTacDuel.create_duel(player1.user_id, player2.user_id, problems, rating, time_limit) 
+    duel_cls = TicTacDuel if duel_mode == Duel.TICTAC else GridDuel
+    duel = await duel_cls.create_duel(player1.user_id, player2.user_id, problems, rating, time_limit, board)
     await TickTacDuelView.send_view(duel)
 
 
+async def orz_duel_grid(rating: int, time_limit: int, size: int, win_length: int):
+    from duels.board import BoardSpec
+
+    player1 = ctx_mgr().get_user_id()
+    time_limit = min(time_limit, 300)
+    size = max(BoardSpec.MIN_SIZE, min(size, BoardSpec.MAX_SIZE))
+    win_length = max(BoardSpec.MIN_SIZE, min(win_length, size))
+    await DuelWaitingView.send_view(Duel.GRID, player1, rating, time_limit, BoardSpec.get(size, win_length))
+
+
+async def _orz_duel_grid(p1: int, p2: int, rating: int, time_limit: int, board: "BoardSpec"):
+    player1 = await User.load_user(p1)
+    player2 = await User.load_user(p2)
+
+    await _orz_duel_tictac_select_problems(player1, player2, rating, time_limit, board)
+
+
 async def orz_duel_b3(rating: int, time_limit: int):
     player1 = ctx_mgr().get_user_id()
     time_limit = min(time_limit, 300)
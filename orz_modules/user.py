@@ -15,6 +15,9 @@ from codeforces.cf import (
 if TYPE_CHECKING:
     from codeforces.api import CFUser, CFProblem
 
+# seconds a user has to submit the verification compilation error
+VERIFICATION_SECONDS = 300
+
 
 class User:
     @classmethod
@@ -124,6 +127,8 @@ async def _orz_register(interaction: Interaction, values: Dict[str, Any]):
 
 
 class UserVerificationView(BaseView):
+    timeout_text = "Verification Timed Out"
+
     @classmethod
     async def send_view(cls, user: User, problem: "CFProblem"):
         view = cls(user, problem)
@@ -138,7 +143,7 @@ class UserVerificationView(BaseView):
 
         self.mode = "default"
 
-        super().__init__(user=user.user_id, timeout=360)
+        super().__init__(user=user.user_id, timeout=None, expires_at=self.start_time + VERIFICATION_SECONDS)
 
     def _add_items(self):
         self.clear_items()
@@ -149,7 +154,7 @@ class UserVerificationView(BaseView):
             self._add_button(label="CHECKING", custom_id="checking", disabled=True)
 
     async def _button_clicked(self, interaction: Interaction, custom_id: str) -> None:
-        await interaction.response.defer()
+        await self._defer(interaction)
 
         if custom_id == "done":
             self.mode = "checking"
@@ -175,8 +180,8 @@ class UserVerificationView(BaseView):
 
     async def check_done(self):
         curr_time = get_time()
-        if curr_time - self.start_time > 300:
-            await self.stop_and_disable(custom_text="Verification Timed Out")
+        if curr_time - self.start_time > VERIFICATION_SECONDS:
+            await self.stop_and_disable(custom_text=self.timeout_text)
             return
 
         submissions = get_user_problem_status(
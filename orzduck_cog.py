@@ -1,8 +1,10 @@
-from discord import Interaction, app_commands
+from discord import Interaction, Member, app_commands
 from discord.ext.commands import Cog, Bot  # type: ignore
 from logging import info
+from typing import Literal
 
 from utils.context_manager import ctx_mgr
+from utils.interaction_stats import interaction_timer, time_interaction
 from orz_modules.utils import is_admin_app_command, is_user_app_command
 
 
@@ -12,9 +14,27 @@ class OrzDuckCog(Cog):
         info("OrzDuckCog has been initialized.")
     
     async def cog_app_command_error(self, interaction: Interaction, error: app_commands.AppCommandError):
+        self._finish_timing(interaction)
         if isinstance(error, app_commands.CheckFailure):
             return
         await super().cog_app_command_error(interaction, error)
+
+    async def interaction_check(self, interaction: Interaction) -> bool:
+        command_name = interaction.command.name if interaction.command is not None else "unknown"
+        time_interaction(interaction, f"/{command_name}")
+        # runs in the command's own task, its messages go out ahead of background edits
+        ctx_mgr().set_responding(interaction)
+        return True
+
+    @Cog.listener()
+    async def on_app_command_completion(self, interaction: Interaction, command: app_commands.Command):  # type: ignore
+        self._finish_timing(interaction)
+
+    @staticmethod
+    def _finish_timing(interaction: Interaction):
+        timer = interaction_timer(interaction)
+        if timer is not None:
+            timer.finish()
     
     @app_commands.command(
         name="orz", description="OTZ"
@@ -46,6 +66,16 @@ class OrzDuckCog(Cog):
         ctx_mgr().set_init_interaction(interaction)
         await orz_duel_tictac(rating, time_limit)
 
+    @app_commands.command(name="duel_grid", description="Start a k in a row duel on a bigger board!")
+    @is_user_app_command()
+    async def orz_duel_grid(
+        self, interaction: Interaction, rating: int = 900, time_limit: int = 90, size: int = 4, win_length: int = 4
+    ):
+        from orz_modules.duel import orz_duel_grid
+
+        ctx_mgr().set_init_interaction(interaction)
+        await orz_duel_grid(rating, time_limit, size, win_length)
+
     @app_commands.command(name="duel_b3", description="Start a B3 duel!")
     @is_user_app_command()
     async def orz_duel_b3(self, interaction: Interaction, rating: int = 900, time_limit: int = 60):
@@ -53,4 +83,29 @@ class OrzDuckCog(Cog):
 
         ctx_mgr().set_init_interaction(interaction)
         await orz_duel_b3(rating, time_limit)
-    
\ No newline at end of file
+
+    @app_commands.command(name="queue", description="Find an opponent of your rating!")
+    @is_user_app_command()
+    async def orz_queue(
+        self, interaction: Interaction, mode: Literal["tictac", "b3"] = "tictac", rating: int = 900, time_limit: int = 60
+    ):
+        from orz_modules.duel import orz_queue
+
+        ctx_mgr().set_init_interaction(interaction)
+        await orz_queue(mode, rating, time_limit)
+
+    @app_commands.command(name="spectate", description="Watch a player's duel live!")
+    @is_user_app_command()
+    async def orz_spectate(self, interaction: Interaction, player: Member):
+        from orz_modules.duel import orz_spectate
+
+        ctx_mgr().set_init_interaction(interaction)
+        await orz_spectate(player.id)
+
+    @app_commands.command(name="scoreboard", description="All ongoing duels, live!")
+    @is_admin_app_command()
+    async def orz_scoreboard(self, interaction: Interaction):
+        from orz_modules.duel import orz_scoreboard
+
+        ctx_mgr().set_init_interaction(interaction)
+        await orz_scoreboard()
@@ -0,0 +1,139 @@
+"""
+avatar_cache.py
+Downloaded avatars, and their decoded and resized frames, kept across renders.
+"""
+
+from asyncio import Future, get_running_loop, shield
+from collections import OrderedDict
+from io import BytesIO
+from threading import Lock
+from typing import Any, Dict, Tuple, Union, TYPE_CHECKING
+
+from config import AVATAR_CACHE_MB
+from utils import image_handling as imgh
+
+if TYPE_CHECKING:
+    from discord import Asset
+
+# (avatar hash,) for the encoded avatar, (avatar hash, width, height) for its frames
+AvatarKey = Union[Tuple[str], Tuple[str, int, int]]
+
+
+class AvatarCache:
+    """
+    LRU cache of avatars keyed by the avatar's hash, bounded by bytes. The
+    encoded avatar is kept to hand to render workers, and the frames resized to
+    a given size wherever they are composited, the render workers keep their
+    own. A changed avatar gets a new hash, so entries never go stale.
+    Concurrent requests for the same avatar share a single download.
+    With RENDER_WORKERS=0 renders decode from a thread next to the event
+    loop, so the entries and their byte count are only touched under `_lock`.
+    """
+
+    max_bytes: int = int(AVATAR_CACHE_MB * 1024 * 1024)
+
+    _entries: "OrderedDict[AvatarKey, Tuple[Any, int]]" = OrderedDict()
+    _pending: Dict[str, "Future[bytes]"] = {}
+    _lock = Lock()
+
+    bytes_used = 0
+    hits = 0
+    misses = 0
+    evictions = 0
+
+    @classmethod
+    async def get_data(cls, avatar: "Asset") -> bytes:
+        """The encoded avatar, downloaded once."""
+        key = (avatar.key,)
+        entry = cls._get(key)
+        if entry is not None:
+            return entry
+
+        pending = cls._pending.get(avatar.key)
+        if pending is not None:
+            cls.hits += 1
+            # shielded, a caller giving up must not cancel the download for the others
+            return await shield(pending)
+
+        cls.misses += 1
+        future: "Future[bytes]" = get_running_loop().create_future()
+        cls._pending[avatar.key] = future
+        try:
+            data = await avatar.read()
+        except Exception as e:
+            future.set_exception(e)
+            # nobody else may be waiting, mark the exception as retrieved
+            future.exception()
+            raise
+        except BaseException:
+            # cancelled, the requests sharing the download are cancelled along
+            future.cancel()
+            raise
+        finally:
+            del cls._pending[avatar.key]
+
+        future.set_result(data)
+        cls._put(key, data, len(data))
+        return data
+
+    @classmethod
+    def decode(cls, key: str, data: bytes, size: Tuple[int, int]) -> imgh.Frames:
+        """Frames of an encoded avatar resized to `size`, decoded once per process."""
+        frames_key = (key, *size)
+        entry = cls._get(frames_key)
+        if entry is not None:
+            return entry
+
+        cls.misses += 1
+        frames = imgh.extract_frames(imgh.load_image(BytesIO(data)))
+        frames = tuple(imgh.resize(frame, size) for frame in frames)
+        cls._put(frames_key, frames, sum(len(frame.getbands()) * frame.width * frame.height for frame in frames))
+        return frames
+
+    @classmethod
+    def _get(cls, key: AvatarKey) -> Any:
+        with cls._lock:
+            entry = cls._entries.get(key)
+            if entry is None:
+                return None
+            cls._entries.move_to_end(key)
+            cls.hits += 1
+            return entry[0]
+
+    @classmethod
+    def _put(cls, key: AvatarKey, value: Any, size: int):
+        if size > cls.max_bytes:
+            return
+        with cls._lock:
+            # decoded by two threads at once, the second one replaces the first
+            previous = cls._entries.pop(key, None)
+            if previous is not None:
+                cls.bytes_used -= previous[1]
+            cls._entries[key] = (value, size)
+            cls.bytes_used += size
+            while cls.bytes_used > cls.max_bytes:
+                _, (_, evicted_size) = cls._entries.popitem(last=False)
+                cls.bytes_used -= evicted_size
+                cls.evictions += 1
+
+    @classmethod
+    def stats(cls) -> Dict[str, Any]:
+        lookups = cls.hits + cls.misses
+        with cls._lock:
+            entries, bytes_used = len(cls._entries), cls.bytes_used
+        return {
+            "entries": entries,
+            "bytes_used": bytes_used,
+            "max_bytes": cls.max_bytes,
+            "hits": cls.hits,
+            "misses": cls.misses,
+            "hit_ratio": cls.hits / lookups if lookups else 0.0,
+            "evictions": cls.evictions,
+        }
+
+    @classmethod
+    def clear(cls):
+        with cls._lock:
+            cls._entries.clear()
+            cls.bytes_used = 0
+        cls.hits = cls.misses = cls.evictions = 0
@@ -21,8 +21,10 @@ class ContextManager:
         self._init_interaction: ContextVar[Optional[Interaction]] = ContextVar("InitInteraction", default=None)
         self._active_msg: ContextVar[Optional[Message]] = ContextVar("ActiveMsg", default=None)
         self._send_new_msg: ContextVar[bool] = ContextVar("SendNewMsg", default=False)
+        # the interaction a user is waiting on an answer to, unset in background tasks
+        self._responding: ContextVar[Optional[Interaction]] = ContextVar("Responding", default=None)
     
-    def set_init_interaction(self, interaction: Interaction):
+    def set_init_interaction(self, interaction: Optional[Interaction]):
         self._init_interaction.set(interaction)
     
     def get_init_interaction(self) -> Interaction:
@@ -30,6 +32,9 @@ class ContextManager:
         assert interaction is not None, "InitInteraction is not set."
         return interaction
     
+    def has_init_interaction(self) -> bool:
+        return self._init_interaction.get() is not None
+
     def get_user_id(self) -> int:
         return self.get_init_interaction().user.id
     
@@ -48,6 +53,12 @@ class ContextManager:
     def get_send_new_msg(self) -> bool:
         return self._send_new_msg.get()
 
+    def set_responding(self, interaction: Optional[Interaction]):
+        self._responding.set(interaction)
+
+    def is_responding(self) -> bool:
+        return self._responding.get() is not None
+
 
 def ctx_mgr() -> ContextManager:
     return ContextManager.get_instance()
\ No newline at end of file
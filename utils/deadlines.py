@@ -0,0 +1,95 @@
+"""
+deadlines.py
+A single task firing every duel deadline, verification deadline and view expiry.
+"""
+
+from asyncio import Event, Task, create_task, wait_for, TimeoutError as AsyncTimeoutError
+from heapq import heappop, heappush
+from itertools import count
+from logging import info, exception
+from time import time
+from typing import Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+DeadlineCallback = Callable[[], Awaitable[None]]
+
+
+class DeadlineScheduler:
+    """
+    Deadlines in a heap behind one task that sleeps until the earliest of them,
+    in place of a timer per view and per duel. Scheduling a key again moves its
+    deadline and cancelling drops it, both leaving the old heap entry to be
+    skipped. A deadline fires exactly once, its key is removed before its
+    callback runs, and each callback runs in its own task so that a slow one
+    holds up no other.
+    """
+
+    _instance = None
+
+    @classmethod
+    def setup_deadline_scheduler(cls):
+        cls._instance = cls()
+        cls._instance.start()
+        info("DeadlineScheduler has been setup.")
+
+    @classmethod
+    def get_instance(cls):
+        assert cls._instance is not None, "DeadlineScheduler has not been setup."
+        return cls._instance
+
+    def __init__(self):
+        self._heap: List[Tuple[float, int, Hashable]] = []  # (when, seq, key), stale entries are skipped
+        self._entries: Dict[Hashable, Tuple[float, int, DeadlineCallback]] = {}
+        self._seq = count()
+        self._wakeup = Event()
+        self._task: Optional["Task[None]"] = None
+
+    def start(self):
+        self._task = create_task(self._run())
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def schedule(self, key: Hashable, when: float, callback: DeadlineCallback):
+        """
+        :param when: unix time in seconds
+        """
+        seq = next(self._seq)
+        self._entries[key] = (when, seq, callback)
+        heappush(self._heap, (when, seq, key))
+        if self._heap[0][1] == seq:
+            self._wakeup.set()
+
+    def cancel(self, key: Hashable):
+        self._entries.pop(key, None)
+
+    def _is_stale(self, when: float, seq: int, key: Hashable) -> bool:
+        entry = self._entries.get(key)
+        return entry is None or entry[1] != seq
+
+    async def _run(self):
+        while True:
+            while self._heap and self._is_stale(*self._heap[0]):
+                heappop(self._heap)
+
+            if self._heap and self._heap[0][0] <= time():
+                _, _, key = heappop(self._heap)
+                _, _, callback = self._entries.pop(key)
+                create_task(self._fire(key, callback))
+                continue
+
+            self._wakeup.clear()
+            timeout = self._heap[0][0] - time() if self._heap else None
+            try:
+                await wait_for(self._wakeup.wait(), timeout)
+            except AsyncTimeoutError:
+                pass
+
+    async def _fire(self, key: Hashable, callback: DeadlineCallback):
+        try:
+            await callback()
+        except Exception:
+            exception(f"Deadline callback failed: {key}")
+
+
+def deadline_scheduler() -> DeadlineScheduler:
+    return DeadlineScheduler.get_instance()
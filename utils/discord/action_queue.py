@@ -0,0 +1,82 @@
+"""
+action_queue.py
+Runs the handlers of a view one at a time, merging repeated ones.
+"""
+
+from asyncio import Future, Lock, create_task, get_running_loop, shield, wait
+from typing import Awaitable, Callable, Dict, Hashable
+
+Action = Callable[[], Awaitable[None]]
+
+# a handler kept waiting for its turn this long is held, its interaction
+# acknowledged before Discord's 3 seconds run out
+HOLD_AFTER_S = 2.0
+
+
+class ActionQueue:
+    """
+    A lock taken in the order actions come in, released however the action
+    ends. An action coming in while one with the same key is still waiting for
+    its turn is merged into it rather than queued: several REFRESH clicks
+    during a refresh become a single refresh after it. Once an action starts
+    running, the next one with its key queues again, as what it acts on may
+    have changed since.
+    """
+
+    # actions merged into one already waiting, across all views
+    merged = 0
+
+    def __init__(self):
+        self._lock = Lock()
+        self._waiting: Dict[Hashable, "Future[None]"] = {}
+
+    def is_busy(self) -> bool:
+        return self._lock.locked()
+
+    async def run(self, key: Hashable, action: Action, on_hold: Action) -> bool:
+        """
+        :param on_hold: runs right away when the action is merged, or once it
+            has waited HOLD_AFTER_S for its turn
+        :returns: False if the action was merged into a waiting one, once that one is done
+        """
+        waiting = self._waiting.get(key)
+        if waiting is not None:
+            ActionQueue.merged += 1
+            await on_hold()
+            await shield(waiting)
+            return False
+
+        done: "Future[None]" = get_running_loop().create_future()
+        self._waiting[key] = done
+        try:
+            await self._acquire(on_hold)
+            try:
+                # running now, the next action with this key is queued rather than merged
+                del self._waiting[key]
+                await action()
+            finally:
+                self._lock.release()
+        finally:
+            if self._waiting.get(key) is done:
+                del self._waiting[key]
+            done.set_result(None)
+        return True
+
+    async def _acquire(self, on_hold: Action):
+        if not self._lock.locked():
+            await self._lock.acquire()
+            return
+
+        acquire = create_task(self._lock.acquire())
+        try:
+            finished, _ = await wait([acquire], timeout=HOLD_AFTER_S)
+            if not finished:
+                await on_hold()
+                await acquire
+        except BaseException:
+            # given up on, the turn is passed on whether or not it came
+            if acquire.done() and not acquire.cancelled():
+                self._lock.release()
+            else:
+                acquire.cancel()
+            raise
@@ -18,4 +18,7 @@ class BaseEmbed(Embed):
         super().add_field(name=name, value=value, inline=inline)
     
     def set_image(self, filename: str):  # type: ignore
-        super().set_image(url=f"attachment://{filename}")
\ No newline at end of file
+        super().set_image(url=f"attachment://{filename}")
+
+    def set_image_url(self, url: str):
+        super().set_image(url=url)
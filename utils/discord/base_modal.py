@@ -1,8 +1,11 @@
 from discord import Interaction, TextStyle
 from discord.ui import Modal, TextInput, View
+from functools import partial
 from typing import Dict, Optional, Protocol
 
 from utils.context_manager import ctx_mgr
+from utils.discord.base_view import BaseView
+from utils.interaction_stats import time_interaction
 
 
 class ModalSubmitCallback(Protocol):
@@ -29,6 +32,7 @@ class BaseModal(Modal):
         self.view = view
 
     async def interaction_check(self, interaction: Interaction) -> bool:
+        time_interaction(interaction, f"modal:{self.custom_id}")
         ctx_mgr().set_init_interaction(self._init_interaction)
         if self._active_msg is not None:
             ctx_mgr().set_active_msg(self._active_msg)
@@ -71,6 +75,18 @@ class BaseModal(Modal):
         for item in self.children:
             if isinstance(item, TextInput):
                 values[item.custom_id] = item.value
-        if self.view is not None and self.view.is_finished():
-            return
-        await self.modal_submit_callback(interaction=interaction, values=values)
+        timer = time_interaction(interaction, f"modal:{self.custom_id}")
+        try:
+            if isinstance(self.view, BaseView):
+                # in turn with the clicks on the view it edits
+                await self.view._run_action(
+                    interaction,
+                    ("modal", self.custom_id, interaction.user.id),
+                    partial(self.modal_submit_callback, interaction=interaction, values=values),
+                )
+                return
+            if self.view is not None and self.view.is_finished():
+                return
+            await self.modal_submit_callback(interaction=interaction, values=values)
+        finally:
+            timer.finish()
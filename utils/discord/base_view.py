@@ -1,17 +1,23 @@
 from discord import Interaction, Embed, File, ButtonStyle
 from discord.ui import View
 from functools import partial
-from typing import Any, Optional, List, Tuple, Dict
+from typing import Any, Hashable, Optional, List, Tuple, Dict
 from logging import info
 
 from utils.context_manager import ctx_mgr
+from utils.deadlines import deadline_scheduler
 from utils.discord.messenger import Messenger
+from utils.discord.action_queue import Action, ActionQueue
 from utils.discord.base_button import BaseButton, BaseURLButton
 from utils.discord.base_dropdown import BaseDropdown
 from utils.general import get_time
+from utils.interaction_stats import InteractionTimer, custom_id_flow, time_interaction
 
 
 class BaseView(View):
+    # shown in place of the items once the view expires
+    timeout_text = "Timed out . . ."
+
     @classmethod
     async def send_view(cls, *args: Any, **kwargs: Any) -> None:
         raise NotImplementedError
@@ -21,43 +27,120 @@ class BaseView(View):
         *,
         user: Optional[int] = None,
         users: Optional[List[int]] = None,
-        timeout: int = 180,
+        timeout: Optional[int] = 180,
+        expires_at: Optional[int] = None,
     ):
+        """
+        :param timeout: seconds the view lasts after it was last shown or used
+        :param expires_at: unix time the view expires at however it is used
+        """
         # list of users to interact with the view
         self._users = (users or []) + ([user] if user else [])
 
-        # to lock interaction with the view
-        self._lock: Optional[int] = None
+        # handlers of the view run one at a time
+        self._actions = ActionQueue()
 
-        # context vars
-        self._init_interaction = ctx_mgr().get_init_interaction()
+        # context vars, views restored after a restart have no init interaction
+        self._init_interaction = (
+            ctx_mgr().get_init_interaction() if ctx_mgr().has_init_interaction() else None
+        )
         self._active_msg = ctx_mgr().get_active_msg()
 
-        super().__init__(timeout=timeout)
+        # expiry is left to the deadline scheduler rather than a timer task per view
+        self._expiry_timeout = timeout
+        self._expires_at = expires_at
+        self._expiry_key = ("view", id(self))
+
+        super().__init__(timeout=None)
+        self._schedule_expiry()
 
     def _add_items(self):
         pass
 
+    def _schedule_expiry(self):
+        if self.is_finished():
+            return
+        if self._expires_at is not None:
+            when = float(self._expires_at)
+        elif self._expiry_timeout is not None:
+            when = get_time() + self._expiry_timeout
+        else:
+            return
+        deadline_scheduler().schedule(self._expiry_key, when, self._expire)
+
+    async def _expire(self):
+        async def expire():
+            if self.is_finished():
+                return
+            await self.on_timeout()
+            self.stop()
+
+        # after the handler running, if any, rather than in the middle of it
+        await self._actions.run("expire", expire, on_hold=_nothing)
+
+    def _time_interaction(self, interaction: Interaction) -> InteractionTimer:
+        custom_id = (interaction.data or {}).get("custom_id", "")
+        return time_interaction(interaction, custom_id_flow(self.__class__.__name__, str(custom_id)))
+
     async def interaction_check(self, interaction: Interaction) -> bool:
+        timer = self._time_interaction(interaction)
+        if self._init_interaction is None:
+            self._init_interaction = interaction
         ctx_mgr().set_init_interaction(self._init_interaction)
+        ctx_mgr().set_responding(interaction)
         assert self._active_msg is not None
         ctx_mgr().set_active_msg(self._active_msg)
 
         if interaction.user.id in self._users:
-            if self._acquire_lock():
-                return True
-            else:
-                await interaction.response.send_message(
-                    content="Please wait while the previous interaction is being processed!",
-                    ephemeral=True,
-                )
-        else:
-            await interaction.response.send_message(
-                content="You aren't allowed to interact with this!",
-                ephemeral=True,
-            )
+            # only its own users keep the view alive
+            self._schedule_expiry()
+            return True
+
+        await interaction.response.send_message(
+            content="You aren't allowed to interact with this!",
+            ephemeral=True,
+        )
+        timer.finish()
         return False
 
+    def _action_key(self, interaction: Interaction, custom_id: str) -> Hashable:
+        """
+        Clicks with the same key waiting together are served by a single run of
+        the handler. Views whose action does the same whoever clicks, like a
+        REFRESH, key it on the custom_id alone.
+        """
+        return custom_id, interaction.user.id
+
+    async def _run_action(self, interaction: Interaction, key: Hashable, action: Action):
+        """
+        Runs the handler once the ones before it are done. A click left waiting
+        for long, or merged into an identical one, is deferred meanwhile.
+        """
+
+        async def hold():
+            if not interaction.response.is_done():
+                await interaction.response.defer()
+
+        async def run():
+            # a click queued behind the one that stopped the view has nothing left to act on
+            if self.is_finished():
+                await hold()
+                return
+            await action()
+
+        await self._actions.run(key, run, on_hold=hold)
+
+    async def _defer(self, interaction: Interaction):
+        """Defers the interaction, unless it was already while waiting for its turn."""
+        if not interaction.response.is_done():
+            await interaction.response.defer()
+
+    async def _reply_ephemeral(self, interaction: Interaction, content: str):
+        if interaction.response.is_done():
+            await interaction.followup.send(content=content, ephemeral=True)
+        else:
+            await interaction.response.send_message(content=content, ephemeral=True)
+
     async def on_error(
         self, interaction: Interaction, error: Exception, *args: Any, **kwargs: Any
     ):
@@ -65,7 +148,7 @@ class BaseView(View):
 
     async def on_timeout(self):
         self.clear_items()
-        self._add_text_dropdown("Timed out . . .")
+        self._add_text_dropdown(self.timeout_text)
 
         assert self._active_msg is not None
         ctx_mgr().set_active_msg(self._active_msg)
@@ -78,6 +161,7 @@ class BaseView(View):
 
     def stop(self):
         super().stop()
+        deadline_scheduler().cancel(self._expiry_key)
         assert self._active_msg is not None
         info(f"{self.__class__.__name__} stopped, active_msg: {self._active_msg.id}")
 
@@ -86,19 +170,8 @@ class BaseView(View):
         self._add_text_dropdown(custom_text or "Stopped . . .")
 
         self._active_msg = await Messenger.send_message_no_reset(view=self)
-        self._release_lock()
         self.stop()
 
-    def _acquire_lock(self) -> bool:
-        curr_time = get_time()
-        if self._lock is None or curr_time - self._lock >= 60:
-            self._lock = curr_time
-            return True
-        return False
-
-    def _release_lock(self):
-        self._lock = None
-
     def _add_button(
         self,
         *,
@@ -109,7 +182,7 @@ class BaseView(View):
         disabled: bool = False,
         emoji: Optional[str] = None,
     ):
-        callback = partial(self._button_clicked, custom_id=custom_id)
+        callback = partial(self._timed_button_clicked, custom_id=custom_id)
         button = BaseButton(
             label=label,
             custom_id=custom_id,
@@ -142,6 +215,16 @@ class BaseView(View):
     async def _button_clicked(self, interaction: Interaction, custom_id: str) -> None:
         raise NotImplementedError
 
+    async def _timed_button_clicked(self, interaction: Interaction, custom_id: str) -> None:
+        try:
+            await self._run_action(
+                interaction,
+                self._action_key(interaction, custom_id),
+                partial(self._button_clicked, interaction, custom_id),
+            )
+        finally:
+            self._time_interaction(interaction).finish()
+
     def _add_dropdown(
         self,
         *,
@@ -158,7 +241,7 @@ class BaseView(View):
         """
         :param options: (value: label) of the select options
         """
-        callback = partial(self._dropdown_selected, custom_id=custom_id)
+        callback = partial(self._timed_dropdown_selected, custom_id=custom_id)
         dropdown = BaseDropdown(
             custom_id=custom_id,
             options=options,
@@ -186,6 +269,18 @@ class BaseView(View):
     ) -> None:
         raise NotImplementedError
 
+    async def _timed_dropdown_selected(
+        self, interaction: Interaction, custom_id: str, values: List[str]
+    ) -> None:
+        try:
+            await self._run_action(
+                interaction,
+                (self._action_key(interaction, custom_id), tuple(values)),
+                partial(self._dropdown_selected, interaction, custom_id, values),
+            )
+        finally:
+            self._time_interaction(interaction).finish()
+
     async def _modal_submit(
         self, interaction: Interaction, custom_id: str, values: Dict[str, str]
     ) -> None:
@@ -203,5 +298,8 @@ class BaseView(View):
         self._active_msg = await Messenger.send_message(
             view=self, embed=embed, files=files
         )
-        self._release_lock()
+        self._schedule_expiry()
+
 
+async def _nothing():
+    pass
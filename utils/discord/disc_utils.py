@@ -1,3 +1,4 @@
+from discord.ui import View
 from discord.ext.commands import Bot  # type: ignore
 
 
@@ -22,6 +23,17 @@ class DiscUtils:
     async def fetch_user(self, user_id: int):
         return await self.bot.fetch_user(user_id)
 
+    async def get_partial_message(self, channel_id: int, message_id: int):
+        """
+        A message that can be edited without fetching it, the channel comes from
+        the cache when possible.
+        """
+        channel = self.bot.get_channel(channel_id) or await self.bot.fetch_channel(channel_id)
+        return channel.get_partial_message(message_id)  # type: ignore
+
+    def add_view(self, view: View, message_id: int):
+        self.bot.add_view(view, message_id=message_id)
+
 
 def disc_utils():
     return DiscUtils.get_instance()
\ No newline at end of file
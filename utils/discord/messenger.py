@@ -1,11 +1,225 @@
-from discord import Message, Embed, File, AllowedMentions
+from asyncio import Future, Task, create_task, get_running_loop, shield, sleep
+from collections import Counter, OrderedDict, deque
+from discord import Attachment, HTTPException, Message, Embed, File, AllowedMentions, PartialMessage
 from discord.ui import View
-from typing import Optional, List, Dict, Any
+from discord.utils import MISSING
+from itertools import count
+from logging import info, warning
+from time import monotonic
+from typing import Awaitable, Callable, Deque, Hashable, Optional, List, Dict, Any, Tuple, Union
 
+from config import DISCORD_CHANNEL_CALLS, DISCORD_CHANNEL_WINDOW
 from utils.context_manager import ctx_mgr
+from utils.metrics import Histogram
+
+# messages whose last shown content is remembered, and interactions whose API calls are
+MAX_MESSAGES = 1024
+MAX_INTERACTIONS = 512
+
+# upper bounds of the API calls per interaction buckets
+CALL_BUCKETS = [1, 2, 3, 4, 5, 6, 8, 10, 15, 20, 30, 50]
+
+# a user waiting on a click expects an answer within the interaction's 3 seconds
+RESPONDING_DEADLINE_MS = 3000
+
+# a call to Discord given the keyword arguments of the latest request it stands for
+OutboundCall = Callable[[Dict[str, Any]], Awaitable[Message]]
+
+
+class _Outbound:
+    """One pending call to Discord, every request coalesced into it gets its result."""
+
+    def __init__(self, call: OutboundCall, kwargs: Dict[str, Any], urgent: bool):
+        self.call = call
+        self.kwargs = kwargs
+        self.urgent = urgent
+        self.enqueued = monotonic()
+        self.future: "Future[Message]" = get_running_loop().create_future()
+        # the exception is read here should every request have been cancelled
+        self.future.add_done_callback(lambda future: future.cancelled() or future.exception())
+
+
+class _ChannelQueue:
+    def __init__(self):
+        # when the calls of the last window were made
+        self.calls: Deque[float] = deque(maxlen=DISCORD_CHANNEL_CALLS)
+        # key: call, answers to users first and the rest in the order they came
+        self.urgent: "OrderedDict[Hashable, _Outbound]" = OrderedDict()
+        self.background: "OrderedDict[Hashable, _Outbound]" = OrderedDict()
+        self.task: Optional["Task[None]"] = None
+
+    def __len__(self) -> int:
+        return len(self.urgent) + len(self.background)
+
+    def pending(self, key: Hashable) -> Optional[_Outbound]:
+        return self.urgent.get(key) or self.background.get(key)
+
+    async def take_slot(self):
+        """Waits until a call leaves at most DISCORD_CHANNEL_CALLS in the last window."""
+        if len(self.calls) == DISCORD_CHANNEL_CALLS:
+            delay = self.calls[0] + DISCORD_CHANNEL_WINDOW - monotonic()
+            if delay > 0:
+                await sleep(delay)
+        self.calls.append(monotonic())
+
+    def fill_window(self):
+        """Holds off every call for a whole window."""
+        self.calls.extend([monotonic()] * DISCORD_CHANNEL_CALLS)
+
+
+class OutboundQueue:
+    """
+    Messages sent and edited in a channel go out one at a time, paced by a
+    sliding window under Discord's per channel rate limit, rather than all at
+    once into 429s that discord.py retries one by one.
+    An edit waiting in the queue takes in any later edit of the same message,
+    the fields of the later one replacing its own, so that a burst of updates
+    becomes a single edit with the latest state. Calls made while answering a
+    user's click or command go ahead of background ones like duel updates,
+    timeouts and spectator edits.
+    """
+
+    _instance = None
+
+    @classmethod
+    def setup_outbound_queue(cls):
+        cls._instance = cls()
+        info("OutboundQueue has been setup.")
+
+    @classmethod
+    def get_instance(cls):
+        assert cls._instance is not None, "OutboundQueue has not been setup."
+        return cls._instance
+
+    def __init__(self):
+        self._channels: Dict[int, _ChannelQueue] = {}
+        self._seq = count()
+
+        self.queued = 0
+        self.coalesced = 0
+        self.rate_limited = 0
+        self.max_pending = 0
+        # answers to users sent after their interaction's 3 seconds
+        self.late = 0
+        self.lag_urgent = Histogram()
+        self.lag_background = Histogram()
+
+    def pending(self) -> int:
+        return sum(len(channel) for channel in self._channels.values())
+
+    def is_pending(self, channel_id: int, key: Hashable) -> bool:
+        channel = self._channels.get(channel_id)
+        return channel is not None and channel.pending(key) is not None
+
+    async def submit(
+        self,
+        channel_id: int,
+        key: Optional[Hashable],
+        kwargs: Dict[str, Any],
+        call: OutboundCall,
+        *,
+        background: bool = False,
+    ) -> Message:
+        """
+        :param key: calls with the same key waiting in the channel's queue are
+            coalesced, None never is
+        :param background: never goes ahead of other calls, even while answering a user
+        """
+        urgent = not background and ctx_mgr().is_responding()
+        channel = self._channels.get(channel_id)
+        if channel is None:
+            channel = self._channels[channel_id] = _ChannelQueue()
+
+        outbound = channel.pending(key) if key is not None else None
+        if outbound is not None:
+            self.coalesced += 1
+            outbound.call = call
+            outbound.kwargs.update(kwargs)
+            if urgent and not outbound.urgent:
+                outbound.urgent = True
+                channel.urgent[key] = channel.background.pop(key)
+        else:
+            self.queued += 1
+            outbound = _Outbound(call, dict(kwargs), urgent)
+            queue = channel.urgent if urgent else channel.background
+            queue[key if key is not None else ("call", next(self._seq))] = outbound
+            self.max_pending = max(self.max_pending, self.pending())
+
+        if channel.task is None:
+            channel.task = create_task(self._drain(channel_id, channel))
+        # a request given up on leaves the call to the others coalesced into it
+        return await shield(outbound.future)
+
+    async def _drain(self, channel_id: int, channel: _ChannelQueue):
+        outbound: Optional[_Outbound] = None
+        try:
+            while channel:
+                await channel.take_slot()
+                queue = channel.urgent or channel.background
+                _, outbound = queue.popitem(last=False)
+
+                lag_ms = (monotonic() - outbound.enqueued) * 1000
+                if outbound.urgent:
+                    self.lag_urgent.observe(lag_ms)
+                    if lag_ms > RESPONDING_DEADLINE_MS:
+                        self.late += 1
+                else:
+                    self.lag_background.observe(lag_ms)
+
+                try:
+                    outbound.future.set_result(await outbound.call(outbound.kwargs))
+                except HTTPException as e:
+                    if e.status == 429:
+                        # discord.py gave up retrying, leave the channel be for a while
+                        self.rate_limited += 1
+                        channel.fill_window()
+                        warning(f"Rate limited in channel {channel_id}, {len(channel)} calls waiting.")
+                    outbound.future.set_exception(e)
+                except Exception as e:
+                    outbound.future.set_exception(e)
+        finally:
+            del self._channels[channel_id]
+            # cancelled, the calls still waiting fail rather than leave their requests hanging
+            waiting = [*channel.urgent.values(), *channel.background.values()]
+            for stopped in [outbound, *waiting]:
+                if stopped is not None and not stopped.future.done():
+                    stopped.future.set_exception(RuntimeError(f"Outbound queue of channel {channel_id} stopped"))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pending": self.pending(),
+            "max_pending": self.max_pending,
+            "queued": self.queued,
+            "coalesced": self.coalesced,
+            "rate_limited": self.rate_limited,
+            "late": self.late,
+            "lag_urgent": self.lag_urgent,
+            "lag_background": self.lag_background,
+        }
+
+
+def outbound_queue() -> OutboundQueue:
+    return OutboundQueue.get_instance()
+
+
+class _Unknown:
+    """What a message shows when it is not known, equal to nothing."""
+
+    def __eq__(self, other: object) -> bool:
+        return False
 
 
 class Messenger:
+    # API calls made, by kind
+    api_calls: "Counter[str]" = Counter()
+    # edits that would have left the message as it was
+    edits_skipped = 0
+
+    # message_id: (message as last returned by Discord, what it shows)
+    _messages: "OrderedDict[int, Tuple[Message, Dict[str, Any]]]" = OrderedDict()
+    # interaction_id: API calls made on its behalf
+    _interaction_calls: "OrderedDict[int, int]" = OrderedDict()
+
     @staticmethod
     async def send_message_new(
         *,
@@ -30,22 +244,35 @@ class Messenger:
             if locals()[kwarg]:
                 kwargs[kwarg] = locals()[kwarg]
 
+        # every branch gets the message sent back, without fetching it again
         if message is not None:
-            message = await message.reply(**kwargs, allowed_mentions=allowed_mentions)
+            reference = message
+            interaction_id = Messenger._interaction_id()
+
+            async def reply(kwargs: Dict[str, Any]) -> Message:
+                Messenger._count("reply", interaction_id)
+                return await reference.reply(**kwargs)
+
+            kwargs["allowed_mentions"] = allowed_mentions
+            message = await outbound_queue().submit(message.channel.id, None, kwargs, reply)
 
         elif not interaction.response.is_done():
-            message = await interaction.response.send_message(
+            Messenger._count("respond", Messenger._interaction_id())
+            response = await interaction.response.send_message(
                 **kwargs, allowed_mentions=allowed_mentions
             )
-            message = await interaction.original_response()
-        
+            message = response.resource if isinstance(response.resource, Message) else None
+            if message is None:
+                Messenger._count("original_response", Messenger._interaction_id())
+                message = await interaction.original_response()
+
         else:
+            Messenger._count("followup", Messenger._interaction_id())
             message = await interaction.followup.send(
                 **kwargs, allowed_mentions=allowed_mentions, wait=True
             )
-        
-        message = await message.channel.fetch_message(message.id)
 
+        Messenger._remember(message, content=content, embed=embed, view=view)
         ctx_mgr().set_active_msg(message)
         ctx_mgr().set_send_new_msg(False)
         return message
@@ -71,7 +298,8 @@ class Messenger:
                 AllowedMentions.all() if mention_author else AllowedMentions.none()
             )
 
-            message = await message.edit(
+            message = await Messenger._edit(
+                message,
                 content=content,
                 embed=embed,
                 view=view,
@@ -118,7 +346,7 @@ class Messenger:
             for kwarg in ["content", "embed", "view", "attachments"]:
                 if locals()[kwarg]:  # has to exclude None and []
                     kwargs[kwarg] = locals()[kwarg]
-            message = await message.edit(**kwargs, allowed_mentions=allowed_mentions)
+            message = await Messenger._edit(message, **kwargs, allowed_mentions=allowed_mentions)
 
             ctx_mgr().set_active_msg(message)
             ctx_mgr().set_send_new_msg(False)
@@ -159,6 +387,132 @@ class Messenger:
             if locals()[kwarg]:
                 kwargs[kwarg] = locals()[kwarg]
 
+        Messenger._count("followup", Messenger._interaction_id())
         await interaction.followup.send(
             **kwargs, allowed_mentions=allowed_mentions, ephemeral=True
         )
+
+    @staticmethod
+    async def edit_message(message: Union[Message, PartialMessage], *, embed: Embed) -> Message:
+        """
+        Edits the embed of a message outside of any interaction, like the ones
+        of spectators.
+        """
+        return await Messenger._edit(message, _background=True, embed=embed)
+
+    @staticmethod
+    async def _edit(
+        message: Union[Message, PartialMessage], *, _background: bool = False, **kwargs: Any
+    ) -> Message:
+        """
+        Edits the message unless it already shows what the edit would, the
+        fields left out of `kwargs` being kept as they are. The edit waits its
+        turn in the channel's outbound queue.
+        """
+        key = ("edit", message.id)
+        # with an edit still queued, the message is about to show something else
+        if not outbound_queue().is_pending(message.channel.id, key):
+            unchanged = Messenger._unchanged(message.id, kwargs)
+            if unchanged is not None:
+                Messenger.edits_skipped += 1
+                return unchanged
+
+        # messages sent through an interaction are edited with its token, which
+        # expires after 15 minutes, their channel's partial message uses the bot's
+        target = message
+        if type(message) is not Message and type(message) is not PartialMessage:
+            target = message.channel.get_partial_message(message.id)
+        interaction_id = Messenger._interaction_id() if not _background else None
+
+        async def edit(kwargs: Dict[str, Any]) -> Message:
+            # edits coalesced in the queue may add up to no change at all
+            unchanged = Messenger._unchanged(message.id, kwargs)
+            if unchanged is not None:
+                Messenger.edits_skipped += 1
+                return unchanged
+            Messenger._count("edit", interaction_id)
+            edited = await target.edit(**kwargs)
+            Messenger._remember(
+                edited, **{name: kwargs.get(name, MISSING) for name in ["content", "embed", "view"]}
+            )
+            return edited
+
+        return await outbound_queue().submit(message.channel.id, key, kwargs, edit, background=_background)
+
+    @staticmethod
+    def _shown(name: str, value: Any) -> Any:
+        if name == "embed":
+            return value.to_dict() if value is not None else None
+        if name == "view":
+            # the same items on another view still have to be edited in, for its callbacks
+            return (value, value.to_components()) if value is not None else None
+        if name == "attachments":
+            # new files are always uploaded
+            if not all(isinstance(attachment, Attachment) for attachment in value):
+                return _Unknown()
+            return tuple(attachment.id for attachment in value)
+        return value
+
+    @staticmethod
+    def _unchanged(message_id: int, kwargs: Dict[str, Any]) -> Optional[Message]:
+        cached = Messenger._messages.get(message_id)
+        if cached is None:
+            return None
+        message, shown = cached
+        for name in ["content", "embed", "view", "attachments"]:
+            if name in kwargs and Messenger._shown(name, kwargs[name]) != shown[name]:
+                return None
+        Messenger._messages.move_to_end(message_id)
+        return message
+
+    @staticmethod
+    def _remember(message: Message, **fields: Any):
+        """
+        Keeps what the message shows, `fields` left MISSING being what it
+        showed before. The attachments are the ones Discord sent back.
+        """
+        cached = Messenger._messages.pop(message.id, None)
+        shown: Dict[str, Any] = {}
+        for name, value in fields.items():
+            if value is not MISSING:
+                shown[name] = Messenger._shown(name, value)
+            else:
+                shown[name] = cached[1][name] if cached is not None else _Unknown()
+        shown["attachments"] = Messenger._shown("attachments", message.attachments)
+
+        Messenger._messages[message.id] = (message, shown)
+        while len(Messenger._messages) > MAX_MESSAGES:
+            Messenger._messages.popitem(last=False)
+
+    @staticmethod
+    def _interaction_id() -> Optional[int]:
+        return ctx_mgr().get_init_interaction().id if ctx_mgr().has_init_interaction() else None
+
+    @staticmethod
+    def _count(kind: str, interaction_id: Optional[int]):
+        Messenger.api_calls[kind] += 1
+        if interaction_id is None:
+            return
+        calls = Messenger._interaction_calls.pop(interaction_id, 0)
+        Messenger._interaction_calls[interaction_id] = calls + 1
+        while len(Messenger._interaction_calls) > MAX_INTERACTIONS:
+            Messenger._interaction_calls.popitem(last=False)
+
+    @staticmethod
+    def calls_per_interaction() -> Histogram:
+        """API calls made on behalf of each of the latest interactions."""
+        histogram = Histogram(CALL_BUCKETS)
+        for calls in Messenger._interaction_calls.values():
+            histogram.observe(calls)
+        return histogram
+
+    @staticmethod
+    def stats() -> Dict[str, Any]:
+        return {
+            "api_calls": dict(Messenger.api_calls),
+            "total_calls": sum(Messenger.api_calls.values()),
+            "edits_skipped": Messenger.edits_skipped,
+            "messages": len(Messenger._messages),
+            "per_interaction": Messenger.calls_per_interaction(),
+            "outbound": outbound_queue().stats(),
+        }
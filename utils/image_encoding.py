@@ -0,0 +1,154 @@
+"""
+image_encoding.py
+Encodes stacked board frames as GIF, animated WebP or APNG within a byte budget.
+"""
+
+from io import BytesIO
+from logging import warning
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from PIL import Image
+from PIL.Image import Image as Img
+
+from config import RENDER_FORMAT, RENDER_TARGET_KB
+
+# format: (PIL format, file extension, settings tried from best looking to smallest)
+FORMATS: Dict[str, Tuple[str, str, List[Dict[str, Any]]]] = {
+    "gif": ("GIF", "gif", [{"colors": 256}, {"colors": 128}, {"colors": 64}, {"colors": 32}]),
+    "webp": ("WEBP", "webp", [{"quality": 85}, {"quality": 70}, {"quality": 50}, {"quality": 30}]),
+    "apng": ("PNG", "png", [{}, {"colors": 256}, {"colors": 64}]),
+}
+
+TARGET_BYTES = int(RENDER_TARGET_KB * 1024)
+
+# name of the board attachment, static boards are encoded in RENDER_FORMAT too
+BOARD_FILENAME = f"board.{FORMATS[RENDER_FORMAT][1]}"
+
+# frames the shared palette is built from
+PALETTE_SAMPLES = 8
+
+
+def encode(
+    frames: Sequence[Img],
+    durations: Sequence[int],
+    fmt: str = RENDER_FORMAT,
+    target_bytes: Optional[int] = TARGET_BYTES,
+) -> bytes:
+    """
+    Encodes the frames, a single frame as a still image of the same format so
+    that it matches BOARD_FILENAME. Identical consecutive frames are shown as
+    one. The settings of the format are tried from best looking to smallest
+    until the image fits `target_bytes`, and when none does every other frame
+    is dropped and the settings tried again. Returns the smallest image found
+    if nothing fits.
+
+    :param durations: how long each frame is shown, in milliseconds
+    :param fmt: "gif", "webp" or "apng"
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Invalid image format: {fmt}")
+    if len(frames) == 0:
+        raise ValueError("No images received.")
+    if len(frames) != len(durations):
+        raise ValueError("Frame count doesn't match duration count.")
+
+    pil_format, _, ladder = FORMATS[fmt]
+    frames, durations = dedupe_frames(frames, durations)
+
+    smallest: Optional[bytes] = None
+    while True:
+        for settings in ladder:
+            data = _save(frames, durations, pil_format, settings)
+            if target_bytes is None or len(data) <= target_bytes:
+                return data
+            if smallest is None or len(data) < len(smallest):
+                smallest = data
+        if len(frames) == 1:
+            break
+        frames, durations = drop_frames(frames, durations)
+
+    warning(f"Board image is {len(smallest)} bytes, over the {target_bytes} byte target.")
+    return smallest
+
+
+def dedupe_frames(frames: Sequence[Img], durations: Sequence[int]) -> Tuple[List[Img], List[int]]:
+    """Merges identical consecutive frames into one shown for their total duration."""
+    merged: List[Img] = [frames[0]]
+    merged_durations: List[int] = [durations[0]]
+    last = frames[0].tobytes()
+    for frame, duration in zip(frames[1:], durations[1:]):
+        data = frame.tobytes()
+        if frame.size == merged[-1].size and data == last:
+            merged_durations[-1] += duration
+            continue
+        merged.append(frame)
+        merged_durations.append(duration)
+        last = data
+    return merged, merged_durations
+
+
+def drop_frames(frames: Sequence[Img], durations: Sequence[int]) -> Tuple[List[Img], List[int]]:
+    """Keeps every other frame, each shown for as long as the dropped one after it too."""
+    kept = list(frames[::2])
+    kept_durations = [sum(durations[i : i + 2]) for i in range(0, len(durations), 2)]
+    return dedupe_frames(kept, kept_durations)
+
+
+def shared_palette(frames: Sequence[Img], colors: int) -> Img:
+    """
+    A palette of at most `colors` colors for all the frames, built from a
+    sample of them so every frame is quantized the same way.
+    """
+    step = max(1, len(frames) // PALETTE_SAMPLES)
+    samples = [frame.convert("RGB") for frame in frames[::step][:PALETTE_SAMPLES]]
+    width, height = samples[0].size
+    strip = Image.new("RGB", (width, height * len(samples)))
+    for i, sample in enumerate(samples):
+        strip.paste(sample, (0, height * i))
+    return strip.quantize(colors, method=Image.Quantize.FASTOCTREE)
+
+
+def to_palette(frame: Img, palette: Img, transparent: int) -> Img:
+    """The frame on the given palette, mostly transparent pixels set to index `transparent`."""
+    indexed = frame.convert("RGB").quantize(palette=palette, dither=Image.Dither.NONE)
+    indexed.putpalette(palette.getpalette()[: 3 * transparent] + [0, 0, 0])
+    if frame.mode == "RGBA":
+        mask = frame.getchannel("A").point([255] * 128 + [0] * 128)
+        indexed.paste(transparent, mask=mask)
+    return indexed
+
+
+def _palette_frames(frames: Sequence[Img], colors: int) -> Tuple[List[Img], int]:
+    # one palette entry is kept back for transparency
+    palette = shared_palette(frames, colors - 1)
+    transparent = min(255, len(palette.getpalette()) // 3)
+    return [to_palette(frame, palette, transparent) for frame in frames], transparent
+
+
+def _save(frames: Sequence[Img], durations: Sequence[int], pil_format: str, settings: Dict[str, Any]) -> bytes:
+    buffer = BytesIO()
+    animated = len(frames) > 1
+    options: Dict[str, Any] = {}
+    if animated:
+        options.update(save_all=True, duration=list(durations), loop=0)
+    frames = list(frames)
+    if pil_format == "GIF":
+        frames, transparent = _palette_frames(frames, settings["colors"])
+        options.update(transparency=transparent, optimize=False)
+        if animated:
+            options.update(disposal=2)
+    elif pil_format == "WEBP":
+        # the slower methods cost seconds on full size boards for a few percent
+        options.update(settings, method=2)
+    elif pil_format == "PNG":
+        if "colors" in settings:
+            frames, transparent = _palette_frames(frames, settings["colors"])
+            options.update(transparency=transparent)
+        if animated:
+            # every frame replaces the last one instead of being drawn over it
+            options.update(disposal=0, blend=0)
+
+    if animated:
+        options.update(append_images=frames[1:])
+    frames[0].save(buffer, format=pil_format, **options)
+    return buffer.getvalue()
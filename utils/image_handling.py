@@ -1,9 +1,45 @@
-from PIL import Image
+from PIL import Image, ImageDraw
 from PIL.Image import Image as Img
-from typing import Union, Tuple, List, Optional
+from typing import Any, Dict, Set, Union, Tuple, List, Optional, Sequence
 from io import BytesIO
-from math import lcm
-from logging import warning
+from bisect import bisect_right
+from functools import lru_cache
+from math import ceil, lcm
+from logging import info, warning
+
+from config import RENDER_MAX_FRAMES, RENDER_FRAMES_MB, RENDER_MAX_LOOP_MS, RENDER_BACKEND
+from utils.image_encoding import encode
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional, layers are stacked with Pillow without it
+    np = None
+
+# frames shared read-only between renders, never composited onto
+Frames = Tuple[Img, ...]
+
+# static images of the boards, overlays also get every rotated / flipped variant
+STATIC_ASSETS: Dict[str, bool] = {
+    "bin/tictac_board.png": False,
+    "bin/b3_board.png": False,
+    "bin/tictac_across.png": True,
+    "bin/tictac_diag.png": True,
+}
+
+# (path, clockwise quarter turns, flipped) -> frames
+_assets: Dict[Tuple[str, int, bool], Frames] = {}
+
+# how to build a layer, (kind, *args). Specs are small and picklable so that a
+# render can be described in one process and composited in another.
+LayerSpec = Tuple[Any, ...]
+
+# frames without a usable duration are shown this long, in milliseconds, and
+# none shorter than MIN_FRAME_MS as most viewers slow such frames down anyway
+DEFAULT_FRAME_MS = 100
+MIN_FRAME_MS = 20
+
+# index of the frame shown from every layer, one per step of the timeline
+FramePicks = Tuple[int, ...]
 
 
 def load_image(img_buf: BytesIO) -> Img:
@@ -27,6 +63,90 @@ def load_image_from_url(img_url: str) -> Img:
     return img
 
 
+def load_assets(assets: Optional[Dict[str, bool]] = None):
+    """
+    Decodes the static assets once, along with the rotated and flipped variants
+    of the overlays, so renders only ever composite them.
+
+    :param assets: path: whether the asset is an overlay, STATIC_ASSETS by default
+    """
+    for path, overlay in (assets or STATIC_ASSETS).items():
+        frames = tuple(extract_frames(load_image_from_path(path)))
+        _assets[(path, 0, False)] = frames
+        if not overlay:
+            continue
+        for flipped in (False, True):
+            base = tuple(flip(img) for img in frames) if flipped else frames
+            for rotation in range(4):
+                _assets[(path, rotation, flipped)] = tuple(
+                    rotate_90_clockwise(img, rotation) if rotation else img for img in base
+                )
+    info(f"Loaded {len(_assets)} asset variants.")
+
+
+def get_asset(path: str, rotation: int = 0, flipped: bool = False) -> Frames:
+    """
+    Frames of a static asset, flipped left to right and then turned clockwise
+    `rotation` times. Assets missing from the registry are decoded on first use.
+    """
+    key = (path, rotation % 4, flipped)
+    if key not in _assets:
+        load_assets({path: rotation % 4 != 0 or flipped})
+    return _assets[key]
+
+
+def asset_layer(path: str, rotation: int = 0, flipped: bool = False) -> LayerSpec:
+    return ("asset", path, rotation, flipped)
+
+
+def grid_layer(
+    size: Tuple[int, int], cells: int, color: Tuple[int, int, int, int], width: int
+) -> LayerSpec:
+    return ("grid", size, cells, color, width)
+
+
+def line_layer(
+    size: Tuple[int, int],
+    start: Tuple[int, int],
+    end: Tuple[int, int],
+    color: Tuple[int, int, int, int],
+    width: int,
+) -> LayerSpec:
+    return ("line", size, start, end, color, width)
+
+
+def avatar_layer(key: str, data: bytes, size: Tuple[int, int]) -> LayerSpec:
+    """An avatar from its encoded bytes, decoded and resized to `size`."""
+    return ("avatar", key, data, size)
+
+
+def resolve_layer(spec: LayerSpec) -> Frames:
+    """Frames of a layer, every kind is cached in the process resolving it."""
+    kind = spec[0]
+    if kind == "asset":
+        return get_asset(*spec[1:])
+    if kind in ("grid", "line"):
+        return _drawn_layer(spec)
+    if kind == "avatar":
+        from utils.avatar_cache import AvatarCache
+
+        return AvatarCache.decode(*spec[1:])
+    raise ValueError(f"Invalid layer kind: {kind}")
+
+
+@lru_cache(maxsize=64)
+def _drawn_layer(spec: LayerSpec) -> Frames:
+    if spec[0] == "grid":
+        return (draw_grid(*spec[1:]),)
+    return (draw_line(*spec[1:]),)
+
+
+def render_layers(specs: Sequence[LayerSpec], layers_coords: List[Tuple[int, int]]) -> bytes:
+    """Resolves, stacks and encodes the layers, safe to run in a worker process."""
+    layers = [resolve_layer(spec) for spec in specs]
+    return stack_and_animate(layers, layers_coords=layers_coords).getvalue()
+
+
 def extract_frames(img: Img) -> List[Img]:
     """Extracts frames from an Image."""
     frame_count = getattr(img, "n_frames", 1)
@@ -77,8 +197,49 @@ def rotate_90_clockwise(img: Img, count: int = 1):
     return img.rotate(-90 * count, expand=True)
 
 
+def draw_grid(
+    size: Tuple[int, int], cells: int, color: Tuple[int, int, int, int], width: int
+) -> Img:
+    """Draws the inner lines of a cells x cells grid with rounded ends."""
+    img = Image.new("RGBA", size=size)
+    cell_width, cell_height = size[0] / cells, size[1] / cells
+    inset = width
+    for i in range(1, cells):
+        x, y = round(i * cell_width), round(i * cell_height)
+        _draw_rounded_line(img, (x, inset), (x, size[1] - inset), color, width)
+        _draw_rounded_line(img, (inset, y), (size[0] - inset, y), color, width)
+    return img
+
+
+def draw_line(
+    size: Tuple[int, int],
+    start: Tuple[int, int],
+    end: Tuple[int, int],
+    color: Tuple[int, int, int, int],
+    width: int,
+) -> Img:
+    """Draws a single line with rounded ends on a transparent canvas."""
+    img = Image.new("RGBA", size=size)
+    _draw_rounded_line(img, start, end, color, width)
+    return img
+
+
+def _draw_rounded_line(
+    img: Img,
+    start: Tuple[int, int],
+    end: Tuple[int, int],
+    color: Tuple[int, int, int, int],
+    width: int,
+):
+    draw = ImageDraw.Draw(img)
+    draw.line([start, end], fill=color, width=width)
+    radius = width // 2
+    for x, y in (start, end):
+        draw.ellipse((x - radius, y - radius, x + radius, y + radius), fill=color)
+
+
 def extra_frames(
-    imgs: List[Img], final_count: int, add_blank: bool = False
+    imgs: Sequence[Img], final_count: int, add_blank: bool = False
 ) -> List[Img]:
     """Adds frames to get the required frame count."""
     original_frame_count = len(imgs)
@@ -95,21 +256,88 @@ def extra_frames(
         if add_blank:
             new_frames.append(Image.new("RGBA", size=imgs[0].size))
         else:
-            new_frames.append(imgs[i % original_frame_count].copy())
+            # frames are only read while stacking, so they can be repeated as is
+            new_frames.append(imgs[i % original_frame_count])
     return new_frames
 
 
+def frame_durations(frames: Sequence[Img]) -> List[int]:
+    """How long each frame is shown, in milliseconds."""
+    return [max(MIN_FRAME_MS, int(frame.info.get("duration") or DEFAULT_FRAME_MS)) for frame in frames]
+
+
+def frame_timeline(
+    layers: Sequence[Sequence[Img]], max_frames: int, max_loop_ms: int = RENDER_MAX_LOOP_MS
+) -> Tuple[List[FramePicks], List[int]]:
+    """
+    Resamples the layers onto one shared timeline, using the real duration of
+    every frame. The timeline lasts until all the animated layers loop together,
+    cut at `max_loop_ms` (but never shorter than the longest layer), and is
+    sampled at evenly spaced steps, at most `max_frames` of them. Consecutive
+    steps showing the same frames are merged into one longer frame.
+
+    :returns: the frame of every layer shown at each step, and the step durations
+    """
+    starts: List[List[int]] = []
+    loops: List[int] = []
+    for layer in layers:
+        durations = frame_durations(layer)
+        layer_starts = [0]
+        for duration in durations[:-1]:
+            layer_starts.append(layer_starts[-1] + duration)
+        starts.append(layer_starts)
+        loops.append(layer_starts[-1] + durations[-1])
+
+    animated = [i for i, layer in enumerate(layers) if len(layer) > 1]
+    if not animated:
+        return [tuple(0 for _ in layers)], [0]
+
+    loop_ms = 1
+    for i in animated:
+        loop_ms = lcm(loop_ms, loops[i])
+    loop_ms = min(loop_ms, max(max_loop_ms, max(loops[i] for i in animated)))
+
+    shortest = min(min(frame_durations(layers[i])) for i in animated)
+    step = max(shortest, ceil(loop_ms / max(1, max_frames)))
+
+    picks: List[FramePicks] = []
+    durations: List[int] = []
+    for t in range(0, loop_ms, step):
+        current = tuple(
+            bisect_right(starts[i], t % loops[i]) - 1 if len(layers[i]) > 1 else 0 for i in range(len(layers))
+        )
+        duration = min(step, loop_ms - t)
+        if picks and picks[-1] == current:
+            durations[-1] += duration
+        else:
+            picks.append(current)
+            durations.append(duration)
+
+    # the loop wrapped onto the frames it started with
+    if len(picks) > 1 and picks[-1] == picks[0]:
+        durations[0] += durations.pop()
+        picks.pop()
+    return picks, durations
+
+
 def stack_layers(
-    layers: List[List[Img]],
+    layers: Sequence[Sequence[Img]],
     layer_order: Optional[List[int]] = None,
     layers_coords: Optional[List[Tuple[int, int]]] = None,
-) -> List[Img]:
+    max_frames: int = RENDER_MAX_FRAMES,
+    max_bytes: int = int(RENDER_FRAMES_MB * 1024 * 1024),
+    backend: str = RENDER_BACKEND,
+) -> Tuple[List[Img], List[int]]:
     """
-    Merges the layers according to the given order.
+    Merges the layers according to the given order. Animated layers are
+    resampled onto a shared timeline of at most `max_frames` frames, and at most
+    `max_bytes` of composited frames, see frame_timeline.
 
     :param layers: list of layers where a layer is a list of frames
     :param layer_order: order of layers
     :param layers_coords: list of coords of the layers, same order as layers
+    :param backend: "pillow", "numpy", or "auto" for NumPy whenever it is installed
+    :returns: the stacked frames and how long each is shown, in milliseconds
     """
 
     # Using the original order if layer_order is not provided
@@ -121,6 +349,12 @@ def stack_layers(
         layers_coords = [(0, 0) for _ in layers]
 
     # Validating the parameters
+    if backend not in ("auto", "pillow", "numpy"):
+        raise ValueError(f"Invalid stacking backend: {backend}")
+
+    if backend == "numpy" and np is None:
+        raise ValueError("The numpy stacking backend needs NumPy installed.")
+
     if len(layers) == 0:
         warning("No layers received.")
 
@@ -147,58 +381,204 @@ def stack_layers(
     max_width = max(layer[0].width for layer in layers)
     max_height = max(layer[0].height for layer in layers)
 
-    # Matching the Frame count
-    lcm_frame_count = 1
-    for i in range(layer_count):
-        lcm_frame_count = lcm(lcm_frame_count, len(layers[i]))
-    for i in range(layer_count):
-        layers[i] += extra_frames(layers[i], final_count=lcm_frame_count)
+    # Stacking the layers in order from here on
+    layers = [layers[i] for i in layer_order]
+    layers_coords = [layers_coords[i] for i in layer_order]
 
-    # Stacking the layers
-    stacked = [
-        Image.new("RGBA", size=(max_width, max_height)) for _ in range(lcm_frame_count)
-    ]
-    for i in range(layer_count):
-        for j in range(lcm_frame_count):
-            current_layer = layer_order[i]
-            stacked[j].alpha_composite(
-                layers[current_layer][j], layers_coords[current_layer]
-            )
+    # Compositing the static layers under every animated one just once
+    base = Image.new("RGBA", size=(max_width, max_height))
+    first_animated = next((i for i in range(layer_count) if len(layers[i]) > 1), layer_count)
+    for i in range(first_animated):
+        base.alpha_composite(layers[i][0], layers_coords[i])
+
+    # Static fast path
+    if first_animated == layer_count:
+        return [base], [0]
+
+    frame_budget = min(max_frames, max(1, max_bytes // (max_width * max_height * 4)))
+    picks, durations = frame_timeline(layers, frame_budget)
+
+    stack_frames = _stack_frames_pillow if backend == "pillow" or np is None else _stack_frames_numpy
+    stacked = stack_frames(base, layers[first_animated:], layers_coords[first_animated:], picks, first_animated)
+    return stacked, durations
+
+
+def _stack_frames_pillow(
+    base: Img,
+    layers: Sequence[Sequence[Img]],
+    layers_coords: Sequence[Tuple[int, int]],
+    picks: Sequence[FramePicks],
+    offset: int,
+) -> List[Img]:
+    stacked: List[Img] = []
+    for current in picks:
+        frame = base.copy()
+        for i, (layer, coords) in enumerate(zip(layers, layers_coords)):
+            frame.alpha_composite(layer[current[offset + i]], coords)
+        stacked.append(frame)
     return stacked
 
 
-def animate(imgs: List[Img], duration: int = 200) -> BytesIO:
-    """Creates a GIF from a list of frames."""
+def _stack_frames_numpy(
+    base: Img,
+    layers: Sequence[Sequence[Img]],
+    layers_coords: Sequence[Tuple[int, int]],
+    picks: Sequence[FramePicks],
+    offset: int,
+) -> List[Img]:
+    """
+    Stacks every output frame at once, the output held as a (frames, H, W, 4)
+    array and each layer blended, premultiplied, over all the frames together.
+    Pixels a layer leaves transparent are skipped and the ones it covers fully
+    are copied. Where no animated layer has drawn yet the pixels are the same in
+    every frame, so static layers are blended there on the base once, and
+    animated layers once per distinct frame. A static layer over an animated
+    one, like the winning line over the avatars, is blended into the animated
+    layer's own frames, once per frame of it rather than once per output frame.
+    """
+    canvas = np.array(base)
+    height, width = canvas.shape[:2]
+    # pixels which differ between the output frames
+    varying = np.zeros((height, width), dtype=bool)
+    # the deferred animated layer a pixel shows one of the frames of, -1 for none
+    tops = np.full((height, width), -1, dtype=np.int32)
+    # deferred layers whose frames are their own to blend into, not shared
+    owned: Set[int] = set()
+    # (frames, which of them each output frame shows, box, [(how, pixels)])
+    deferred: List[Tuple[Any, Any, Tuple[slice, slice], List[Tuple[str, Any]]]] = []
+    # frames, fully covered and partly covered pixels of a layer's box, the same
+    # avatar usually sits on several cells
+    arrays: Dict[Tuple[int, int, int, int, int], Tuple[Any, Any, Any]] = {}
+
+    for i, (layer, (x, y)) in enumerate(zip(layers, layers_coords)):
+        # the box of the layer that is drawn on and lands on the canvas
+        boxes = [box for box in (frame.getbbox() for frame in layer) if box is not None]
+        if not boxes:
+            continue
+        left = max(min(box[0] for box in boxes), -x)
+        top = max(min(box[1] for box in boxes), -y)
+        right = min(max(box[2] for box in boxes), width - x)
+        bottom = min(max(box[3] for box in boxes), height - y)
+        if left >= right or top >= bottom:
+            continue
+
+        key = (id(layer), left, top, right, bottom)
+        if key not in arrays:
+            frames = np.stack([np.asarray(frame)[top:bottom, left:right] for frame in layer])
+            solid = (frames[..., 3] == 255).all(axis=0)
+            arrays[key] = frames, solid, (frames[..., 3] > 0).any(axis=0) & ~solid
+        frames, solid, partial = arrays[key]
+        shown = np.array([current[offset + i] for current in picks])
+        box = (slice(y + top, y + bottom), slice(x + left, x + right))
+        box_varying = varying[box]
+        box_top = tops[box]
+
+        if len(layer) > 1 and solid.mean() > 0.5:
+            # mostly covered, copied in whole with the rest blended after
+            box_top[solid], box_top[partial] = len(deferred), -1
+            deferred.append((frames, shown, box, [("fill", np.nonzero(~solid))]))
+            box_varying[...] = True
+            continue
+
+        folded = np.zeros_like(partial)
+        if len(layer) == 1:
+            folded = partial & (box_top >= 0)
+            for below in np.unique(box_top[folded]):
+                _fold_into(deferred, owned, int(below), frames[0], box, folded & (box_top == below))
+
+        ops = [("copy", np.nonzero(solid & box_varying)), ("over", np.nonzero(partial & box_varying & ~folded))]
+        same_solid, same_partial = np.nonzero(solid & ~box_varying), np.nonzero(partial & ~box_varying)
+        if len(layer) == 1:
+            region = canvas[box]
+            region[same_solid] = frames[0][same_solid]
+            region[same_partial] = _blend(frames[0][same_partial], region[same_partial])
+            box_top[solid] = -1
+        else:
+            ops += [("copy", same_solid), ("over_base", same_partial)]
+            box_varying |= solid | partial
+            box_top[solid], box_top[partial] = len(deferred), -1
+        deferred.append((frames, shown, box, [(how, pixels) for how, pixels in ops if len(pixels[0])]))
+
+    stacked = np.repeat(canvas[np.newaxis], len(picks), axis=0)
+    for frames, shown, box, ops in deferred:
+        region = stacked[(slice(None), *box)]
+        for how, pixels in ops:
+            at = (slice(None), *pixels)
+            if how == "fill":
+                under = region[at]
+                for frame, current in zip(region, shown):
+                    frame[...] = frames[current]
+                region[at] = _blend(frames[at][shown], under)
+            elif how == "copy":
+                region[at] = frames[at][shown]
+            elif how == "over_base":
+                region[at] = _blend(frames[at], canvas[box][pixels])[shown]
+            else:
+                region[at] = _blend(frames[at][shown], region[at])
+
+    return [Image.fromarray(frame, "RGBA") for frame in stacked]
+
+
+def _fold_into(
+    deferred: List[Tuple[Any, Any, Tuple[slice, slice], List[Tuple[str, Any]]]],
+    owned: Set[int],
+    index: int,
+    frame: "np.ndarray",
+    box: Tuple[slice, slice],
+    mask: "np.ndarray",
+):
+    """
+    Blends the `mask` pixels of a static layer's `frame`, placed at `box`, into
+    every frame of the deferred animated layer at `index`, which covers them fully.
+    """
+    frames, shown, below_box, ops = deferred[index]
+    if index not in owned:
+        # the frames may be shared with the same avatar on other cells
+        frames = frames.copy()
+        deferred[index] = (frames, shown, below_box, ops)
+        owned.add(index)
+    rows, cols = np.nonzero(mask)
+    below_rows = rows + (box[0].start - below_box[0].start)
+    below_cols = cols + (box[1].start - below_box[1].start)
+    frames[:, below_rows, below_cols] = _blend(frame[rows, cols], frames[:, below_rows, below_cols])
+
+
+def _blend(src: "np.ndarray", dst: "np.ndarray") -> "np.ndarray":
+    """`src` pixels over `dst` pixels, straight alpha RGBA in and out."""
+    src_alpha = src[..., 3:] * np.float32(1 / 255)
+    dst_weight = dst[..., 3:] * np.float32(1 / 255) * (1 - src_alpha)
+    out_alpha = src_alpha + dst_weight
+    color = src[..., :3] * src_alpha + dst[..., :3] * dst_weight
+    color /= np.maximum(out_alpha, np.float32(1e-6))
+
+    out = np.empty(np.broadcast_shapes(src.shape, dst.shape), dtype=np.uint8)
+    out[..., :3] = color + 0.5
+    out[..., 3:] = out_alpha * 255 + 0.5
+    return out
+
+
+def animate(imgs: List[Img], duration: Union[int, Sequence[int]] = 200) -> BytesIO:
+    """
+    Encodes a list of frames, see image_encoding.encode.
+
+    :param duration: how long every frame is shown, or each of them, in milliseconds
+    """
     if len(imgs) == 0:
         print("ERROR: No images received.")
         raise ValueError("No images received.")
 
-    bytes_array = BytesIO()
-    if len(imgs) == 1:
-        imgs[0].save(bytes_array, format="PNG")
-    else:
-        imgs[0].save(
-            bytes_array,
-            format="GIF",
-            append_images=imgs[1:],
-            save_all=True,
-            duration=duration,
-            optimize=False,
-            loop=0,
-            disposal=2,
-        )
-    bytes_array.seek(0)
-    return bytes_array
+    durations = [duration] * len(imgs) if isinstance(duration, int) else list(duration)
+    return BytesIO(encode(imgs, durations))
 
 
 def stack_and_animate(
-    layers: List[List[Img]],
+    layers: Sequence[Sequence[Img]],
     *,
     layer_order: Optional[List[int]] = None,
     layers_coords: Optional[List[Tuple[int, int]]] = None
 ) -> BytesIO:
-    frames = stack_layers(layers, layer_order, layers_coords)
-    animation = animate(frames)
+    frames, durations = stack_layers(layers, layer_order, layers_coords)
+    animation = animate(frames, durations)
     return animation
 
 
@@ -0,0 +1,160 @@
+"""
+interaction_stats.py
+How long commands, clicks and modal submits take to be acknowledged and answered.
+"""
+
+from logging import warning
+from typing import Any, Dict, List, Optional
+
+from discord import Interaction
+from discord.interactions import InteractionResponse
+from discord.utils import utcnow
+
+from utils.metrics import Histogram
+
+# Discord fails an interaction which isn't acknowledged within 3 seconds of being created
+ACK_DEADLINE_MS = 3000
+# flows tracked separately, the rest are counted together
+MAX_FLOWS = 200
+OTHER_FLOW = "other"
+
+
+class InteractionStat:
+    def __init__(self, flow: str):
+        self.flow = flow
+        self.ack = Histogram()
+        self.final = Histogram()
+        self.missed = 0  # acknowledged too late, or never
+
+
+class InteractionStats:
+    stats: Dict[str, InteractionStat] = {}
+
+    @staticmethod
+    def get(flow: str) -> InteractionStat:
+        stat = InteractionStats.stats.get(flow)
+        if stat is None:
+            if len(InteractionStats.stats) >= MAX_FLOWS:
+                flow = OTHER_FLOW
+            stat = InteractionStats.stats.setdefault(flow, InteractionStat(flow))
+        return stat
+
+    @staticmethod
+    def record_ack(flow: str, elapsed_ms: float):
+        stat = InteractionStats.get(flow)
+        stat.ack.observe(elapsed_ms)
+        if elapsed_ms > ACK_DEADLINE_MS:
+            stat.missed += 1
+            warning(f"Interaction acknowledged after the deadline: {flow}, {elapsed_ms:.0f} ms")
+
+    @staticmethod
+    def record_final(flow: str, elapsed_ms: float, acked: bool):
+        stat = InteractionStats.get(flow)
+        stat.final.observe(elapsed_ms)
+        if not acked:
+            stat.missed += 1
+            warning(f"Interaction never acknowledged: {flow}")
+
+    @staticmethod
+    def top(count: int = 10) -> List[InteractionStat]:
+        """
+        Returns the flows closest to the deadline, the ones which missed it first.
+        """
+        stats = sorted(
+            InteractionStats.stats.values(), key=lambda x: (x.missed, x.ack.percentile(95)), reverse=True
+        )
+        return stats[:count]
+
+    @staticmethod
+    def reset():
+        InteractionStats.stats.clear()
+
+
+class InteractionTimer:
+    """
+    Times one interaction from when Discord created it, so that the time it
+    spent reaching the bot counts against the deadline as well.
+    """
+
+    def __init__(self, interaction: Interaction, flow: str):
+        self.flow = flow
+        self.created_at = interaction.created_at
+        self.acked = False
+        self.finished = False
+
+    def elapsed_ms(self) -> float:
+        return max(0.0, (utcnow() - self.created_at).total_seconds() * 1000)
+
+    def ack(self):
+        if self.acked:
+            return
+        self.acked = True
+        InteractionStats.record_ack(self.flow, self.elapsed_ms())
+
+    def finish(self):
+        """Records the time to the final message, once the handler is done."""
+        if self.finished:
+            return
+        self.finished = True
+        InteractionStats.record_final(self.flow, self.elapsed_ms(), self.acked)
+
+
+class _TimedResponse(InteractionResponse):  # type: ignore
+    """Acknowledges the interaction's timer along with the interaction."""
+
+    def __init__(self, parent: Interaction, timer: InteractionTimer):
+        super().__init__(parent)
+        self.timer = timer
+
+    async def defer(self, *args: Any, **kwargs: Any):
+        result = await super().defer(*args, **kwargs)
+        self.timer.ack()
+        return result
+
+    async def send_message(self, *args: Any, **kwargs: Any):
+        result = await super().send_message(*args, **kwargs)
+        self.timer.ack()
+        return result
+
+    async def edit_message(self, *args: Any, **kwargs: Any):
+        result = await super().edit_message(*args, **kwargs)
+        self.timer.ack()
+        return result
+
+    async def send_modal(self, *args: Any, **kwargs: Any):
+        result = await super().send_modal(*args, **kwargs)
+        self.timer.ack()
+        return result
+
+
+def time_interaction(interaction: Interaction, flow: str) -> InteractionTimer:
+    """
+    Starts timing the interaction, or returns its timer if it already is.
+    Acknowledging it through `interaction.response` records the time to ack.
+    """
+    response = getattr(interaction, "_cs_response", None)
+    if isinstance(response, _TimedResponse):
+        return response.timer
+
+    timer = InteractionTimer(interaction, flow)
+    timed = _TimedResponse(interaction, timer)
+    if response is not None:
+        timed._response_type = response._response_type
+        if response.is_done():
+            timer.ack()
+    # the response is cached on the interaction, everything answering it goes through this one
+    interaction._cs_response = timed  # type: ignore
+    return timer
+
+
+def interaction_timer(interaction: Interaction) -> Optional[InteractionTimer]:
+    response = getattr(interaction, "_cs_response", None)
+    return response.timer if isinstance(response, _TimedResponse) else None
+
+
+def custom_id_flow(owner: str, custom_id: str) -> str:
+    """
+    Flow name of a component, custom_ids like "duel~<duel_id>~refresh" are
+    named after their last part.
+    """
+    return f"{owner}:{custom_id.split('~')[-1]}"
@@ -0,0 +1,56 @@
+from bisect import bisect_left
+from typing import List, Optional
+
+# upper bounds of the latency buckets in milliseconds
+DEFAULT_BUCKETS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000]
+
+
+class Histogram:
+    """
+    Fixed bucket histogram, cheap enough to be updated on every call.
+    """
+
+    def __init__(self, buckets: Optional[List[float]] = None):
+        self.buckets = buckets or DEFAULT_BUCKETS_MS
+        self.counts = [0] * (len(self.buckets) + 1)  # last one is the overflow bucket
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, p: float) -> float:
+        """
+        Returns the upper bound of the bucket holding the p-th percentile,
+        capped at the largest value observed.
+        """
+        if self.count == 0:
+            return 0.0
+        rank = p / 100 * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= rank:
+                bound = self.buckets[i] if i < len(self.buckets) else self.max
+                return min(bound, self.max)
+        return self.max
+
+    def summary(self, unit: str = "ms") -> str:
+        return (
+            f"p50 {self.percentile(50):.0f} · p95 {self.percentile(95):.0f} · "
+            f"p99 {self.percentile(99):.0f} · max {self.max:.0f} {unit}"
+        )
+
+    def reset(self):
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
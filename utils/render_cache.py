@@ -0,0 +1,116 @@
+"""
+render_cache.py
+Encoded board images addressed by the content they show.
+"""
+
+from asyncio import Future, get_running_loop, shield
+from collections import OrderedDict
+from hashlib import sha1
+from io import BytesIO
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from discord import Attachment, Message
+
+from config import RENDER_CACHE_MB
+from utils.render_service import RenderError
+
+
+class RenderCache:
+    """
+    LRU cache of rendered board images keyed by a hash of everything that goes
+    into the picture, bounded by the bytes of the encoded images.
+    Two duels in the same position with the same avatars share an entry, and
+    concurrent requests for the same board share a single render.
+    """
+
+    max_bytes: int = int(RENDER_CACHE_MB * 1024 * 1024)
+
+    _entries: "OrderedDict[str, bytes]" = OrderedDict()
+    _pending: Dict[str, "Future[bytes]"] = {}
+
+    bytes_used = 0
+    hits = 0
+    misses = 0
+    evictions = 0
+    # edits which kept the attachment already on the message instead of uploading
+    uploads_skipped = 0
+
+    @staticmethod
+    def key(*parts: Any) -> str:
+        return sha1(repr(parts).encode()).hexdigest()
+
+    @classmethod
+    async def get_or_render(cls, key: str, render: Callable[[], Awaitable[BytesIO]]) -> BytesIO:
+        data = cls._entries.get(key)
+        if data is not None:
+            cls._entries.move_to_end(key)
+            cls.hits += 1
+            return BytesIO(data)
+
+        pending = cls._pending.get(key)
+        if pending is not None:
+            cls.hits += 1
+            # shielded, a caller giving up must not cancel the render for the others
+            return BytesIO(await shield(pending))
+
+        cls.misses += 1
+        future: "Future[bytes]" = get_running_loop().create_future()
+        cls._pending[key] = future
+        try:
+            data = (await render()).getvalue()
+        except Exception as e:
+            future.set_exception(e)
+            # nobody else may be waiting, mark the exception as retrieved
+            future.exception()
+            raise
+        except BaseException:
+            # cancelled, the requests sharing the render keep the last board
+            future.set_exception(RenderError("The render was cancelled"))
+            future.exception()
+            raise
+        finally:
+            del cls._pending[key]
+
+        future.set_result(data)
+        cls._put(key, data)
+        return BytesIO(data)
+
+    @classmethod
+    def _put(cls, key: str, data: bytes):
+        if len(data) > cls.max_bytes:
+            return
+        # a render finishing after the entry was put some other way replaces it
+        previous = cls._entries.pop(key, None)
+        if previous is not None:
+            cls.bytes_used -= len(previous)
+        cls._entries[key] = data
+        cls.bytes_used += len(data)
+        while cls.bytes_used > cls.max_bytes:
+            _, evicted = cls._entries.popitem(last=False)
+            cls.bytes_used -= len(evicted)
+            cls.evictions += 1
+
+    @classmethod
+    def stats(cls) -> Dict[str, Any]:
+        lookups = cls.hits + cls.misses
+        return {
+            "entries": len(cls._entries),
+            "bytes_used": cls.bytes_used,
+            "max_bytes": cls.max_bytes,
+            "hits": cls.hits,
+            "misses": cls.misses,
+            "hit_ratio": cls.hits / lookups if lookups else 0.0,
+            "evictions": cls.evictions,
+            "uploads_skipped": cls.uploads_skipped,
+        }
+
+
+def find_attachment(message: Optional[Message], filename: str) -> Optional[Attachment]:
+    """
+    The attachment of a message with the given filename. Partial messages, like
+    the ones views are restored on, carry no attachments.
+    """
+    for attachment in getattr(message, "attachments", []):
+        if attachment.filename == filename:
+            return attachment
+    return None
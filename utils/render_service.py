@@ -0,0 +1,145 @@
+"""
+render_service.py
+Runs board compositing and encoding off the event loop.
+"""
+
+from asyncio import get_running_loop, wait_for, wrap_future, TimeoutError as AsyncTimeoutError
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+from logging import info, warning
+from time import perf_counter
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from config import RENDER_WORKERS, RENDER_QUEUE_SIZE, RENDER_TIMEOUT
+from utils import image_handling as imgh
+from utils.metrics import Histogram
+
+
+class RenderError(Exception):
+    """Raised when a render is rejected or doesn't finish in time."""
+
+    pass
+
+
+class RenderQueueFull(RenderError):
+    pass
+
+
+class RenderTimeout(RenderError):
+    pass
+
+
+class RenderWorkerDied(RenderError):
+    pass
+
+
+def _init_worker():
+    imgh.load_assets()
+
+
+class RenderService:
+    """
+    Hands renders, described as layer specs, to a pool of worker processes.
+    At most `queue_size` renders are queued or running at once, more are turned
+    away right away rather than piling up, and a render is given up on after
+    `timeout` seconds. A render given up on still counts as pending until the
+    worker is done with it, as it keeps the worker busy until then.
+    """
+
+    _instance = None
+
+    @classmethod
+    def setup_render_service(cls):
+        cls._instance = cls(RENDER_WORKERS, RENDER_QUEUE_SIZE, RENDER_TIMEOUT)
+        info("RenderService has been setup.")
+
+    @classmethod
+    def get_instance(cls):
+        assert cls._instance is not None, "RenderService has not been setup."
+        return cls._instance
+
+    def __init__(self, workers: int, queue_size: int, timeout: float):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self._executor: Optional[Executor] = None
+
+        self.pending = 0
+        self.max_pending = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.render_time = Histogram()
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.workers > 0:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=1)
+        return self._executor
+
+    async def render(self, specs: Sequence[imgh.LayerSpec], layers_coords: List[Tuple[int, int]]) -> BytesIO:
+        """
+        :raises RenderQueueFull: If `queue_size` renders are already pending
+        :raises RenderTimeout: If the render doesn't finish within `timeout`
+        :raises RenderWorkerDied: If the worker process died, the pool is restarted
+        """
+        if self.pending >= self.queue_size:
+            self.rejected += 1
+            raise RenderQueueFull(f"{self.pending} renders already pending")
+
+        start = perf_counter()
+        executor = self._get_executor()
+        try:
+            job = executor.submit(imgh.render_layers, list(specs), layers_coords)
+        except BrokenProcessPool:
+            self._restart_executor(executor)
+            raise RenderWorkerDied("Render worker died")
+
+        self.pending += 1
+        self.max_pending = max(self.max_pending, self.pending)
+        loop = get_running_loop()
+        job.add_done_callback(lambda _: loop.call_soon_threadsafe(self._job_done))
+        try:
+            # cancelling the wrapper on timeout only cancels jobs which haven't started
+            data = await wait_for(wrap_future(job), self.timeout)
+        except AsyncTimeoutError:
+            self.timeouts += 1
+            raise RenderTimeout(f"Render didn't finish in {self.timeout} seconds")
+        except BrokenProcessPool:
+            self._restart_executor(executor)
+            raise RenderWorkerDied("Render worker died")
+        self.render_time.observe((perf_counter() - start) * 1000)
+        return BytesIO(data)
+
+    def _job_done(self):
+        self.pending -= 1
+
+    def _restart_executor(self, executor: Executor):
+        # every render pending on a broken pool fails with it, only the first one restarts it
+        if self._executor is not executor:
+            return
+        warning("Render worker died, restarting the pool.")
+        executor.shutdown(wait=False, cancel_futures=True)
+        self._executor = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "pending": self.pending,
+            "max_pending": self.max_pending,
+            "queue_size": self.queue_size,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+            "render_time": self.render_time,
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+def render_service() -> RenderService:
+    return RenderService.get_instance()